@@ -2,8 +2,9 @@ from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QLineEdit, QPushButton
 from models.book import Book
 
 class AddBookDialog(QDialog):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.changes = None
         self.setWindowTitle("Add Book")
         self.setFixedSize(400, 300)
         layout = QVBoxLayout()
@@ -20,9 +21,9 @@ class AddBookDialog(QDialog):
 
     def add_book(self):
         try:
-            Book.add_book(self.title.text(), self.isbn.text(), self.author.text(),
+            self.changes = Book.add_book(self.title.text(), self.isbn.text(), self.author.text(),
                           self.category.text(), int(self.copies.text()))
             QMessageBox.information(self, "Success", "Book added!")
-            self.close()
+            self.accept()
         except Exception as e:
             QMessageBox.critical(self, "Error", str(e))
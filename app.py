@@ -1,6 +1,8 @@
 # run.py
 import sys
 from PyQt5.QtWidgets import QApplication
+from database import instrument
+from database.backend import get_backend
 from gui.login_window import LoginWindow
 
 def main():
@@ -60,9 +62,15 @@ def main():
     app.setStyleSheet(dark_stylesheet)
     # --------------------------------
 
+    # bring the database up to the schema this build expects
+    get_backend().prepare()
+
     login_window = LoginWindow()
     login_window.show()
-    sys.exit(app.exec_())
+    code = app.exec_()
+    if instrument.enabled():
+        print(instrument.report(), file=sys.stderr)
+    sys.exit(code)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,33 @@
+import datetime
+
+from database.backend import get_backend
+
+# Loan archival. Loans made and returned more than keep_days ago move from
+# loans to loans_archive, `batch` per short transaction, oldest first, so the
+# loans table -- and every borrow, return, overdue check and loan list that
+# reads it -- stays the size of the recent history however long the library
+# has been lending. A loan with a fine still growing stays until it is final.
+# Only the member history dialog and the loan history export read the archive,
+# on demand. Recommendations and club suggestions are worked out from loans,
+# so from the last keep_days of reading. Run it nightly
+# (tools/archive_loans.py).
+ARCHIVE_CONFIG = {
+    'keep_days': 365,
+    'batch': 5000,  # loans moved per transaction
+}
+
+
+def archive_loans(as_of=None, progress=None):
+    # Archives every loan due to go as of `as_of` (default today).
+    # progress(moved so far) follows every batch. Returns the number moved.
+    as_of = as_of or datetime.date.today()
+    before = as_of - datetime.timedelta(days=ARCHIVE_CONFIG['keep_days'])
+    db = get_backend()
+    moved = 0
+    while True:
+        batch = db.archive_loans(before, ARCHIVE_CONFIG['batch'])
+        if not batch:
+            return moved
+        moved += batch
+        if progress:
+            progress(moved)
@@ -0,0 +1,33 @@
+# tools/archive_loans.py
+# Moves loans returned long ago out of the loans table into loans_archive (see
+# models/archive.py). Meant to run nightly, after tools/overdue_job.py has
+# made the day's fines final:
+#
+#   40 0 * * *  cd /srv/library && python -m tools.archive_loans
+import argparse
+import datetime
+import sys
+import time
+
+from models.archive import ARCHIVE_CONFIG, archive_loans
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive old loans")
+    parser.add_argument("--as-of", type=datetime.date.fromisoformat, default=None,
+                        help=f"archive loans made and returned over {ARCHIVE_CONFIG['keep_days']} days before this "
+                             f"date (YYYY-MM-DD); default today")
+    args = parser.parse_args(argv)
+
+    def progress(moved):
+        print(f"\r{moved} loans archived", end="", file=sys.stderr)
+
+    start = time.monotonic()
+    moved = archive_loans(args.as_of, progress=progress)
+    print(file=sys.stderr)
+    print(f"{moved} loans archived in {time.monotonic() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,491 @@
+# database/backend.py
+# Storage backends. Every query the application makes is one method of Backend,
+# implemented once per engine: PostgresBackend (pg_backend.py) for the real
+# library server, SqliteBackend (sqlite_backend.py) for a local file or an
+# in-memory database in tests and benchmarks. Models and windows only ever talk
+# to get_backend(), so they run unchanged on either.
+#
+#   LIBRARY_DB_ENGINE=sqlite LIBRARY_SQLITE_PATH=:memory: python app.py
+import os
+import re
+import threading
+
+from models.changes import ChangeSet
+
+BACKEND_CONFIG = {
+    'engine': os.environ.get('LIBRARY_DB_ENGINE', 'postgres'),       # 'postgres' or 'sqlite'
+    'sqlite_path': os.environ.get('LIBRARY_SQLITE_PATH', 'library.db'),  # a file or ':memory:'
+}
+
+# Per-statement timing and slow-query log (see instrument.py), for either
+# engine. Applies to connections opened after it is switched on;
+# LIBRARY_QUERY_STATS=1 turns it on for a run without editing this file.
+INSTRUMENT_CONFIG = {
+    'enabled': os.environ.get('LIBRARY_QUERY_STATS') == '1',
+    'slow_ms': 200.0,
+    'slow_log': 'slow_queries.log',
+    'window': 1000,
+}
+
+# result codes shared by every engine (see Member)
+BORROW_OK = "ok"
+BORROW_NO_COPIES = "no_copies"
+BORROW_LIMIT_REACHED = "limit_reached"
+BORROW_NO_BOOK = "no_book"
+BORROW_NO_MEMBER = "no_member"
+RETURN_NOT_ON_LOAN = "not_on_loan"
+HOLD_OK = "ok"
+HOLD_COPIES_AVAILABLE = "copies_available"
+HOLD_ALREADY_QUEUED = "already_queued"
+HOLD_NOT_FOUND = "hold_not_found"
+
+# loan statuses that still hold a copy: 'overdue' is set on loans past their
+# due date by the overdue job (see models/fines.py); returned loans are 'returned'
+OPEN_LOAN_STATUSES = ("borrowed", "overdue")
+
+# holds are 'waiting' in their book's queue, then 'ready' with a copy set aside
+# for the member, and end 'collected', 'cancelled' or 'expired'
+ACTIVE_HOLD_STATUSES = ("waiting", "ready")
+# column order of Backend.member_holds(); ChangeSets add member_id
+HOLD_COLUMNS = ("hold_id", "book_id", "title", "status", "position", "ready_until")
+
+# column order of Backend.similar_books(); score is the cosine of the two books
+# over the members' baskets, 1.0 when always borrowed together
+RECOMMENDATION_COLUMNS = ("book_id", "title", "category", "copies_available", "score")
+
+# columns a loan row carries in a ChangeSet, besides the book's title
+LOAN_COLUMNS = ("loan_id", "book_id", "member_id", "loan_date", "due_date", "return_date", "status")
+
+
+def normalize_isbn(code):
+    return "".join(ch for ch in str(code).upper() if ch.isdigit() or ch == "X")
+
+
+def isbn13(code):
+    # Canonical 13-digit ISBN for an ISBN-10 or ISBN-13 in any punctuation, or
+    # None if the code is malformed or its check digit is wrong.
+    code = normalize_isbn(code)
+    if len(code) == 10:
+        if not code[:9].isdigit():
+            return None
+        total = sum((10 - i) * int(d) for i, d in enumerate(code[:9]))
+        expected = (11 - total % 11) % 11
+        if code[9] != ("X" if expected == 10 else str(expected)):
+            return None
+        body = "978" + code[:9]
+    elif len(code) == 13 and code.isdigit():
+        body = code[:12]
+    else:
+        return None
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(body))
+    check = str((10 - total % 10) % 10)
+    if len(code) == 13 and code[12] != check:
+        return None
+    return body + check
+
+
+def parse_search(text):
+    # Splits a search box query into what the engines match on: the words, and
+    # an ISBN prefix when the query is nothing but (at least four) ISBN digits.
+    words = re.findall(r"\w+", text.lower())
+    isbn = normalize_isbn(text)
+    isbn_prefix = isbn if re.fullmatch(r"[\dXx\- ]+", text) and len(isbn) >= 4 else None
+    return words, isbn_prefix
+
+
+def split_scans(scans):
+    # Barcode scans are ISBNs or, on items catalogued without one, the book_id
+    # on the library's own label. A scan of digits only and not ISBN-10 or
+    # ISBN-13 long is taken as a book_id. Returns (isbns, book_ids).
+    isbns, book_ids = [], []
+    for scan in scans:
+        scan = str(scan).strip()
+        if scan.isdigit() and len(scan) not in (10, 13):
+            book_ids.append(int(scan))
+        else:
+            isbns.append(scan)
+    return isbns, book_ids
+
+
+def borrow_requests(isbns, book_ids):
+    return [("isbn", normalize_isbn(i)) for i in isbns] + [("id", int(b)) for b in book_ids]
+
+
+def return_requests(loan_ids, isbns, book_ids):
+    return [("id", int(l)) for l in loan_ids] + [("isbn", normalize_isbn(i)) for i in isbns] + \
+        [("book", int(b)) for b in book_ids]
+
+
+def plan_borrow(requests, by_isbn, by_id, active, max_loans):
+    # Decides a batch borrow against the locked books. requests is [(kind, value)]
+    # with kind "isbn" or "id"; by_isbn/by_id map to mutable [book_id, available].
+    # Returns (granted book_ids, rejects [(value, code)], over_limit).
+    granted, rejects = [], []
+    for kind, value in requests:
+        book = by_isbn.get(value) if kind == "isbn" else by_id.get(value)
+        if book is None:
+            rejects.append((value, BORROW_NO_BOOK))
+        elif book[1] <= 0:
+            rejects.append((value, BORROW_NO_COPIES))
+        else:
+            book[1] -= 1
+            granted.append(book[0])
+    return granted, rejects, active + len(granted) > max_loans
+
+
+def split_collections(granted, ready):
+    # granted: book_ids a batch borrow takes (repeated for several copies);
+    # ready: {book_id: [hold_id]} of the member's holds waiting for collection.
+    # Copies set aside for the member are collected first, the rest come off
+    # the shelf. Returns (hold_ids collected, {book_id: copies off the shelf}).
+    collected, shelf = [], {}
+    for book_id in granted:
+        held = ready.get(book_id)
+        shelf.setdefault(book_id, 0)
+        if held:
+            collected.append(held.pop())
+        else:
+            shelf[book_id] += 1
+    return collected, shelf
+
+
+def match_returns(requests, open_loans):
+    # Matches return requests ("id", loan_id) / ("isbn", normalised isbn) /
+    # ("book", book_id) to the member's open loans [(loan_id, book_id, isbn)],
+    # oldest first.
+    # Returns (chosen [(loan_id, book_id)], rejects [(value, code)]).
+    chosen, rejects = [], []
+    taken = set()
+    for kind, value in requests:
+        match = None
+        for loan_id, book_id, isbn in open_loans:
+            if loan_id in taken:
+                continue
+            if (kind == "id" and loan_id == value) or (kind == "book" and book_id == value) or \
+               (kind == "isbn" and isbn is not None and normalize_isbn(isbn) == value):
+                match = (loan_id, book_id)
+                break
+        if match is None:
+            rejects.append((value, RETURN_NOT_ON_LOAN))
+        else:
+            taken.add(match[0])
+            chosen.append(match)
+    return chosen, rejects
+
+
+def loan_changes(rows):
+    # rows: LOAN_COLUMNS (plus maybe title) and the book's new copies_available
+    changes = ChangeSet()
+    books = {}
+    for row in rows:
+        books[row["book_id"]] = {"book_id": row["book_id"], "copies_available": row.pop("copies_available")}
+    changes.upsert("loans", rows)
+    changes.upsert("books", list(books.values()))
+    return changes
+
+
+def page_key(rows, limit, columns):
+    # next_key for a keyset page over (title, book_id); None once exhausted
+    if len(rows) < limit:
+        return None
+    last = rows[-1]
+    return last[columns.index("title")], last[columns.index("book_id")]
+
+
+class Backend:
+    """Every query the application runs. Row shapes are the same on every engine."""
+    name = None
+
+    def prepare(self):
+        """Bring the schema up to date."""
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    # ---- accounts ----
+    def authenticate(self, username, password, role=None):
+        """(user_id, username, role), or None."""
+        raise NotImplementedError
+
+    def create_account(self, username, password, role, full_name=None):
+        """New user_id (with a members row for members), or None if the username is taken."""
+        raise NotImplementedError
+
+    def member_id_for_user(self, user_id):
+        raise NotImplementedError
+
+    def members(self):
+        """[(member_id, username, full_name, join_date)] by member_id."""
+        raise NotImplementedError
+
+    # ---- catalogue ----
+    def books_page(self, after, limit, columns):
+        """(rows, next_key): keyset page over (title, book_id) after key `after`."""
+        raise NotImplementedError
+
+    def search_books(self, text, columns, limit):
+        """Up to `limit` rows matching title, category, author or ISBN, best first."""
+        raise NotImplementedError
+
+    def book_title(self, book_id):
+        raise NotImplementedError
+
+    def catalogue_version(self):
+        """The catalogue's current change version (see books_changed_since)."""
+        raise NotImplementedError
+
+    def books_changed_since(self, version, columns):
+        """(rows, deleted book_ids, version): books inserted or updated and books
+        deleted after change version `version`, and the version to ask from next."""
+        raise NotImplementedError
+
+    def add_book(self, title, isbn, author_id, category, copies, columns):
+        """ChangeSet with the new book's `columns`."""
+        raise NotImplementedError
+
+    def update_book_title(self, book_id, title):
+        raise NotImplementedError
+
+    def delete_book(self, book_id):
+        raise NotImplementedError
+
+    def merge_catalogue(self, rows, checkpoint=None):
+        """Adds validated import rows (line, title, isbn, author_id, category, copies)
+        in one transaction: known ISBNs get more copies, new ones are inserted.
+        checkpoint() runs once every row is staged and may raise to abort.
+        Returns (updated, inserted)."""
+        raise NotImplementedError
+
+    # ---- circulation ----
+    def borrow(self, member_id, book_id, max_loans):
+        """(code, ChangeSet) -- atomic: limit check, decrement and loan insert."""
+        raise NotImplementedError
+
+    def borrow_many(self, member_id, isbns, book_ids, max_loans, loan_days):
+        """(code, ChangeSet, rejects), all in one transaction (see Member.borrow_many)."""
+        raise NotImplementedError
+
+    def return_many(self, member_id, loan_ids, isbns, book_ids, shelf_days):
+        """(ChangeSet, rejects), all in one transaction (see Member.return_many).
+        Each returned copy goes to the next waiting hold on its book, set aside
+        for shelf_days, before any goes back on the shelf."""
+        raise NotImplementedError
+
+    def open_loans(self, member_id):
+        """[(loan_id, book_id, title, loan_date, due_date)] still out."""
+        raise NotImplementedError
+
+    def member_loan_history(self, member_id):
+        """[(loan_id, title, loan_date, due_date, return_date, status)], newest first."""
+        raise NotImplementedError
+
+    def recent_loans(self, limit):
+        """[(loan_id, member_id, member_name, book_id, title, status)], newest first."""
+        raise NotImplementedError
+
+    # ---- loan archive ----
+    # loans returned long ago live in loans_archive (schema migration 12); the
+    # loan queries above only see loans
+    def archive_loans(self, before, limit):
+        """Moves up to `limit` returned loans made and returned before `before`
+        to the archive, oldest first, in one transaction; loans with a fine not
+        yet final stay. Returns the number of loans moved, 0 once done."""
+        raise NotImplementedError
+
+    def archived_loans(self, member_id):
+        """The member's archived loans, in the shape of member_loan_history()."""
+        raise NotImplementedError
+
+    # ---- holds ----
+    def place_hold(self, member_id, book_id, priority):
+        """(code, ChangeSet with the new hold as a HOLD_COLUMNS row). Only books
+        without a copy on the shelf can be held, once per member."""
+        raise NotImplementedError
+
+    def cancel_hold(self, member_id, hold_id, shelf_days):
+        """ChangeSet; a copy set aside for the hold goes to the next one in the queue."""
+        raise NotImplementedError
+
+    def member_holds(self, member_id):
+        """[HOLD_COLUMNS] of the member's waiting and ready holds, oldest first;
+        position is the place in the book's queue, None once ready."""
+        raise NotImplementedError
+
+    def expire_holds(self, as_of, limit, shelf_days):
+        """Expires up to `limit` ready holds not collected by `as_of` and passes
+        their copies on, in one transaction. ChangeSet; no holds once done."""
+        raise NotImplementedError
+
+    # ---- overdue and fines ----
+    def loan_id_range(self):
+        """(lowest loan_id, highest loan_id), or (None, None) without loans."""
+        raise NotImplementedError
+
+    def assess_overdue(self, first, last, as_of, fine_per_day, fine_cap):
+        """One chunk of the overdue job, in its own short transaction: loans with
+        first <= loan_id <= last still out past their due date on `as_of` are
+        marked overdue, and every late loan in the range gets its fine (days late
+        * fine_per_day, at most fine_cap) written to fines. Fines of returned
+        loans are final. Returns (loans marked overdue, fines written)."""
+        raise NotImplementedError
+
+    def fine_totals(self):
+        """(members fined, overdue loans, fined loans, total amount)."""
+        raise NotImplementedError
+
+    def member_fines(self, limit):
+        """[(member_id, member_name, overdue_loans, fined_loans, days_late, amount)],
+        highest amount first."""
+        raise NotImplementedError
+
+    # ---- statistics ----
+    # running totals kept by the database as loans are written (schema
+    # migration 9); each read costs the same however long the loan history
+    def circulation_totals(self):
+        """(active loans, overdue loans)."""
+        raise NotImplementedError
+
+    def daily_circulation(self, since):
+        """[(day, loans, returns)] for the days from `since` that had any, by day."""
+        raise NotImplementedError
+
+    def top_books(self, limit):
+        """[(book_id, title, loans)], most borrowed first."""
+        raise NotImplementedError
+
+    def top_categories(self, limit):
+        """[(category, loans)], most borrowed first; category '' for books without one."""
+        raise NotImplementedError
+
+    def largest_clubs(self, limit):
+        """[(club_id, name, members)], largest first."""
+        raise NotImplementedError
+
+    # ---- recommendations ----
+    # see models/recommendations.py; the tables are schema migration 10
+    def queue_recommendations(self, history, rebuild):
+        """Puts loans made since the last run (every loan if `rebuild`) into
+        the baskets of their members, each member's `history` most recently
+        borrowed books, and queues every book whose neighbours that changes. One
+        transaction. Returns the number of books queued."""
+        raise NotImplementedError
+
+    def rank_recommendations(self, limit, top, min_together):
+        """Takes up to `limit` books off the queue and stores their `top` best
+        neighbours: books in at least `min_together` of the same baskets, by
+        cosine. One transaction. Returns the number of books done, 0 once the
+        queue is empty."""
+        raise NotImplementedError
+
+    def similar_books(self, book_id, limit):
+        """[RECOMMENDATION_COLUMNS] of the book's stored neighbours, best first."""
+        raise NotImplementedError
+
+    # ---- book clubs ----
+    def clubs(self):
+        """[(club_id, name, description)] by name."""
+        raise NotImplementedError
+
+    def club_members(self, club_id):
+        """[(member_id, full_name, username)] by full_name."""
+        raise NotImplementedError
+
+    def member_clubs(self, member_id):
+        """[(club_id, name)] by name."""
+        raise NotImplementedError
+
+    def create_club(self, name, description):
+        raise NotImplementedError
+
+    def delete_club(self, club_id):
+        raise NotImplementedError
+
+    def join_club(self, member_id, club_id):
+        """ChangeSet with the membership; empty if the member was already in."""
+        raise NotImplementedError
+
+    def leave_club(self, member_id, club_id):
+        raise NotImplementedError
+
+    # club suggestions, see BookClub.suggest; the tables are schema migration 11
+    def member_id_range(self):
+        """(lowest member_id, highest member_id), or (None, None) without members."""
+        raise NotImplementedError
+
+    def profile_readers(self, first, last, categories):
+        """Works out the reading profile of members first <= member_id <= last:
+        their `categories` most borrowed categories, weighted by loans and scaled
+        to unit length. One transaction. Returns the number of members profiled."""
+        raise NotImplementedError
+
+    def profile_clubs(self):
+        """Makes every club's profile the sum of its members', scaled to unit
+        length. Returns the number of clubs profiled."""
+        raise NotImplementedError
+
+    def suggest_clubs(self, first, last, top):
+        """Stores the `top` clubs closest to the profile of each member first <=
+        member_id <= last, among those they are not in. One transaction. Returns
+        the number of members with suggestions."""
+        raise NotImplementedError
+
+    def suggested_clubs(self, member_id):
+        """[(club_id, name, description, score)] suggested to the member, best
+        first, without clubs joined since."""
+        raise NotImplementedError
+
+    # ---- reports and tooling ----
+    def bulk_load(self, table, columns, rows):
+        """Appends the rows (any iterable, consumed as a stream) to `table` in one
+        transaction, e.g. when seeding. Explicit ids are kept and the id
+        sequence moves past them. Returns the number of rows loaded."""
+        raise NotImplementedError
+
+    def stream_query(self, sql, itersize):
+        """Yields the column names, then the rows, without holding them all."""
+        raise NotImplementedError
+
+    def estimate_rows(self, table):
+        raise NotImplementedError
+
+    # ---- live updates ----
+    def change_feed(self):
+        """A feed of changes committed by other sessions, or None if the engine
+        has none. The feed has fileno() to wait on, read() -> (ChangeSet, set of
+        tables to reload wholesale) once it is readable, and close()."""
+        return None
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                engine = BACKEND_CONFIG['engine']
+                if engine == 'sqlite':
+                    from database.sqlite_backend import SqliteBackend
+                    _backend = SqliteBackend(BACKEND_CONFIG['sqlite_path'])
+                elif engine == 'postgres':
+                    from database.pg_backend import PostgresBackend
+                    _backend = PostgresBackend()
+                else:
+                    raise ValueError(f"unknown database engine {engine!r}")
+    return _backend
+
+
+def set_backend(backend):
+    # Swaps the backend in, e.g. a fresh SqliteBackend(':memory:') per test run.
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, backend
+    if previous is not None and previous is not backend:
+        previous.close()
+
+
+def close_backend():
+    set_backend(None)
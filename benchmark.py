@@ -0,0 +1,246 @@
+# tools/benchmark.py
+# Times the application's hot paths end to end -- the real MainWindow loaders
+# running through the QueryExecutor and table models, and the model calls
+# behind borrow/return, login and club joins -- with Qt on the offscreen
+# platform. Results go to a JSON file; --compare diffs two runs and fails on
+# regressions, e.g. between commits:
+#
+#   python -m tools.benchmark --engine sqlite --loans 100000 --output before.json
+#   python -m tools.benchmark --engine sqlite --loans 100000 --output after.json --compare before.json
+#
+# An empty database is seeded first (tools/seed_data.py, with a fixed date so
+# a seed always gives the same data); one that already has a catalogue is
+# benchmarked as it is. SQLite defaults to a fresh in-memory database per run.
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import argparse
+import datetime
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+from PyQt5.QtCore import QEventLoop, QTimer
+from PyQt5.QtWidgets import QApplication
+
+from database import backend, instrument
+from database.backend import get_backend
+from gui.main_window import MainWindow
+from models.book import Book
+from models.book_club import BookClub
+from models.catalogue_cache import catalogue_cache
+from models.member import Member
+from models.user import User
+from tools import seed_data
+
+# a median this much slower than the baseline's counts as a regression
+REGRESSION_THRESHOLD = 0.20
+# how long one GUI load may take before the run is abandoned
+LOAD_TIMEOUT_S = 120
+
+
+def _percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def _summary(samples):
+    ordered = sorted(samples)
+    return {
+        'runs': len(ordered),
+        'min_ms': ordered[0],
+        'median_ms': statistics.median(ordered),
+        'mean_ms': statistics.fmean(ordered),
+        'p95_ms': _percentile(ordered, 95),
+        'max_ms': ordered[-1],
+    }
+
+
+def _wait_idle(executor):
+    # Spins the event loop until every background query has delivered its rows.
+    if not executor.is_busy():
+        return
+    loop = QEventLoop()
+    done = lambda busy: busy or loop.quit()
+    executor.busy_changed.connect(done)
+    timer = QTimer(); timer.setSingleShot(True); timer.timeout.connect(loop.quit)
+    timer.start(LOAD_TIMEOUT_S * 1000)
+    loop.exec_()
+    executor.busy_changed.disconnect(done)
+    if executor.is_busy():
+        raise TimeoutError(f"background queries still running after {LOAD_TIMEOUT_S}s")
+
+
+def _time(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return samples
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(repeat=20, seed=0):
+    db = get_backend()
+    rng = random.Random(seed)
+    results = {}
+
+    window = MainWindow("benchmark", "librarian", 0)
+    QApplication.processEvents()  # lets the first tab start loading
+    _wait_idle(window.executor)
+
+    def load_books():
+        window.load_books()
+        _wait_idle(window.executor)
+    results["load_books"] = _time(load_books, repeat)
+
+    def load_member_loans():
+        window.load_member_loans()
+        _wait_idle(window.executor)
+    window.load_members_tab()
+    _wait_idle(window.executor)
+    results["load_member_loans"] = _time(load_member_loans, repeat)
+
+    if window.club_combobox.count() > 1:
+        window.club_combobox.setCurrentIndex(1)
+        _wait_idle(window.executor)
+
+        def load_members_by_club():
+            window.load_members_by_club()
+            _wait_idle(window.executor)
+        results["load_members_by_club"] = _time(load_members_by_club, repeat)
+    window.executor.shutdown()
+    window.deleteLater()
+
+    # borrow then return the same loan, so the data ends as it started
+    members = [row for row in db.members() if row[1] is not None]
+    rng.shuffle(members)
+    borrowers = [m for m in members[:200] if not db.open_loans(m[0])][:repeat + 1]
+    books = [row for row in Book.page(None, 500)[0] if row[Book.CATALOGUE_COLUMNS.index("copies_available")] > 1]
+    borrow_ms, return_ms, codes = [], [], {}
+    for i, member in enumerate(borrowers):
+        book_id = rng.choice(books)[0]
+        start = time.perf_counter()
+        code, changes = Member.borrow(member[0], book_id)
+        elapsed = (time.perf_counter() - start) * 1000.0
+        codes[code] = codes.get(code, 0) + 1
+        loan_ids = [row["loan_id"] for row in changes.upserted("loans")]
+        if not loan_ids:
+            continue
+        start = time.perf_counter()
+        Member.return_many(member[0], loan_ids=loan_ids)
+        if i:  # the first round is the warm-up
+            borrow_ms.append(elapsed)
+            return_ms.append((time.perf_counter() - start) * 1000.0)
+    if borrow_ms:
+        results["borrow"] = borrow_ms
+        results["return"] = return_ms
+
+    usernames = [m[1] for m in members[:repeat + 1]] or ["nobody"]
+    results["login"] = _time(lambda: User.authenticate(rng.choice(usernames), seed_data.PASSWORD), repeat)
+
+    clubs = db.clubs()
+    if clubs and members:
+        def club_join():
+            # join and, if it was new, leave again
+            club_id = rng.choice(clubs)[0]
+            member_id = rng.choice(members)[0]
+            if BookClub.join_club(member_id, club_id):
+                BookClub.leave_club(member_id, club_id)
+        results["club_join"] = _time(club_join, repeat)
+
+    return {name: _summary(samples) for name, samples in results.items() if samples}, codes
+
+
+def compare(current, baseline, threshold=REGRESSION_THRESHOLD):
+    # Prints the median of every benchmark against the baseline's; returns the
+    # names that got slower by more than `threshold`.
+    regressions = []
+    print(f"{'benchmark':24s} {'baseline':>10s} {'current':>10s} {'change':>8s}")
+    for name, now in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            print(f"{name:24s} {'-':>10s} {now['median_ms']:10.2f}")
+            continue
+        change = now['median_ms'] / before['median_ms'] - 1.0 if before['median_ms'] else 0.0
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:24s} {before['median_ms']:10.2f} {now['median_ms']:10.2f} {change:+8.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the library's hot paths")
+    parser.add_argument("--engine", choices=("postgres", "sqlite"), default=backend.BACKEND_CONFIG['engine'])
+    parser.add_argument("--sqlite-path", default=":memory:", help="fresh SQLite database to seed (default in memory)")
+    parser.add_argument("--loans", type=int, default=10000, help="scale of the seeded data")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per benchmark")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier --output file to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    backend.BACKEND_CONFIG['engine'] = args.engine
+    backend.BACKEND_CONFIG['sqlite_path'] = args.sqlite_path
+    app = QApplication.instance() or QApplication(sys.argv[:1])  # must outlive the windows
+    db = get_backend()
+    db.prepare()
+    seeded = None
+    if not db.books_page(None, 1, ("book_id", "title"))[0]:
+        seeded = seed_data.generate(db, seed_data.Scale(args.loans), args.seed, datetime.date(2025, 1, 1))
+    try:
+        results, borrow_codes = run(args.repeat, args.seed)
+        cache = catalogue_cache()
+        cache_stats = cache.stats() if cache is not None else None
+    finally:
+        backend.close_backend()
+
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': datetime.datetime.now().isoformat(timespec="seconds"),
+            'engine': args.engine,
+            'loans': args.loans if seeded else None,
+            'seeded': seeded,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'borrow_codes': borrow_codes,
+            'catalogue_cache': cache_stats,
+        },
+        'results': results,
+    }
+    if instrument.enabled():
+        report['queries'] = instrument.stats()
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    for name, s in results.items():
+        print(f"{name:24s} median {s['median_ms']:9.2f} ms  p95 {s['p95_ms']:9.2f} ms  ({s['runs']} runs)")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,61 @@
-from database.database import get_connection
+from database.backend import get_backend, isbn13
+from models.catalogue_cache import catalogue_cache, record_changes
 
 class Book:
-    def __init__(self, book_id, title, isbn, author_id, category, total, available):
+    # attributes are named after the columns, so any subset of them can be hydrated
+    __slots__ = ("book_id", "title", "isbn", "author_id", "category", "copies_total", "copies_available",
+                 "__weakref__")
+    TABLE = "books"
+    KEY = "book_id"
+    PAGE_SIZE = 100
+    CATALOGUE_COLUMNS = ("book_id", "title", "isbn", "author_id", "category", "copies_total", "copies_available")
+
+    def __init__(self, book_id, title=None, isbn=None, author_id=None, category=None, copies_total=None,
+                 copies_available=None):
         self.book_id = book_id
         self.title = title
         self.isbn = isbn
         self.author_id = author_id
         self.category = category
-        self.total = total
-        self.available = available
+        self.copies_total = copies_total
+        self.copies_available = copies_available
 
     @staticmethod
     def add_book(title, isbn, author_id, category, copies):
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("""INSERT INTO books (title, isbn, author_id, category, copies_total, copies_available)
-                       VALUES (%s, %s, %s, %s, %s, %s)""",
-                    (title, isbn, author_id, category, copies, copies))
-        conn.commit()
-        cur.close()
-        conn.close()
+        # stored as the canonical ISBN-13 that imports merge on; anything that
+        # isn't a valid ISBN is kept as typed
+        isbn = isbn13(isbn) or isbn
+        changes = get_backend().add_book(title, isbn, author_id, category, copies, Book.CATALOGUE_COLUMNS)
+        record_changes(changes)
+        return changes
+
+    @staticmethod
+    def update_title(book_id, title):
+        changes = get_backend().update_book_title(book_id, title)
+        record_changes(changes)
+        return changes
+
+    @staticmethod
+    def delete(book_id):
+        changes = get_backend().delete_book(book_id)
+        record_changes(changes)
+        return changes
+
+    @staticmethod
+    def title_of(book_id):
+        cache = catalogue_cache()
+        if cache is not None:
+            return cache.title_of(book_id)
+        return get_backend().book_title(book_id)
+
+    @staticmethod
+    def page(after=None, limit=PAGE_SIZE, columns=CATALOGUE_COLUMNS):
+        # Keyset pagination over (title, book_id): `after` is the key of the last
+        # row already shown, so every page costs one index range scan of `limit` rows.
+        # Returns (rows, next_key); next_key is None once the catalogue is exhausted.
+        if "title" not in columns or "book_id" not in columns:
+            raise ValueError("catalogue pages need the title and book_id columns")
+        cache = catalogue_cache()
+        if cache is not None:
+            return cache.page(after, limit, columns)
+        return get_backend().books_page(after, limit, columns)
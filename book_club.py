@@ -1,17 +1,70 @@
-from database.database import get_connection
+from database.backend import get_backend
 
 class BookClub:
-    def __init__(self, club_id, name, description):
+    __slots__ = ("club_id", "name", "description", "__weakref__")
+    TABLE = "book_clubs"
+    KEY = "club_id"
+    COLUMNS = ("club_id", "name", "description")
+    # column order of Backend.member_clubs()
+    MEMBERSHIP_COLUMNS = ("club_id", "name")
+    # column order of Backend.suggested_clubs()
+    SUGGESTION_COLUMNS = ("club_id", "name", "description", "score")
+
+    # Club suggestions: a member's reading profile is their most borrowed
+    # categories, a club's the sum of its members' profiles, both as unit
+    # vectors, and clubs are suggested by cosine similarity to the member's.
+    # BookClub.suggest() works them all out ahead, in transactions of
+    # SUGGESTION_CHUNK member ids, so the clubs tab only reads them. Run it
+    # nightly (tools/suggest_clubs.py).
+    SUGGESTION_CATEGORIES = 5  # categories in a reading profile
+    SUGGESTIONS = 5            # clubs suggested per member
+    SUGGESTION_CHUNK = 2000
+
+    def __init__(self, club_id, name=None, description=None):
         self.club_id = club_id
         self.name = name
         self.description = description
 
+    @staticmethod
+    def create(name, description):
+        return get_backend().create_club(name, description)
+
+    @staticmethod
+    def delete(club_id):
+        return get_backend().delete_club(club_id)
+
     @staticmethod
     def join_club(member_id, club_id):
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT 1 FROM club_members WHERE member_id=%s AND club_id=%s", (member_id, club_id))
-        if not cur.fetchone():
-            cur.execute("INSERT INTO club_members (member_id, club_id) VALUES (%s, %s)", (member_id, club_id))
-            conn.commit()
-        cur.close(); conn.close()
+        # The ChangeSet is empty if the member was already in the club.
+        return get_backend().join_club(member_id, club_id)
+
+    @staticmethod
+    def leave_club(member_id, club_id):
+        return get_backend().leave_club(member_id, club_id)
+
+    @staticmethod
+    def suggest(progress=None):
+        # Recomputes every member's suggestions. progress(step, fraction) is
+        # called after every chunk, step 'profiles' then 'suggestions'.
+        # Returns the number of members given suggestions.
+        db = get_backend()
+        first, last = db.member_id_range()
+        if first is None:
+            return 0
+        chunks = [(start, min(start + BookClub.SUGGESTION_CHUNK - 1, last))
+                  for start in range(first, last + 1, BookClub.SUGGESTION_CHUNK)]
+        for i, (start, end) in enumerate(chunks):
+            db.profile_readers(start, end, BookClub.SUGGESTION_CATEGORIES)
+            if progress:
+                progress('profiles', (i + 1) / len(chunks))
+        db.profile_clubs()
+        suggested = 0
+        for i, (start, end) in enumerate(chunks):
+            suggested += db.suggest_clubs(start, end, BookClub.SUGGESTIONS)
+            if progress:
+                progress('suggestions', (i + 1) / len(chunks))
+        return suggested
+
+    @staticmethod
+    def suggested(member_id):
+        return get_backend().suggested_clubs(member_id)
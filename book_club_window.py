@@ -1,8 +1,14 @@
 # gui/book_club_window.py
-from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QLineEdit, QTextEdit, QPushButton, QTableWidget, QTableWidgetItem, QHBoxLayout, QMessageBox
+from functools import partial
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QLineEdit, QTextEdit, QPushButton, QHBoxLayout, QMessageBox
 from PyQt5.QtGui import QFont
 from PyQt5.QtCore import Qt
-from database.database import get_connection
+from gui.live_updates import live_updates
+from gui.table_model import RowTableView
+from gui.workers import QueryExecutor
+from models.book_club import BookClub
+from models.member import Member
+from models.repository import Repository
 
 class BookClubWindow(QDialog):
     def __init__(self, role, user_id=None, parent=None):
@@ -21,10 +27,19 @@ class BookClubWindow(QDialog):
         title.setAlignment(Qt.AlignCenter)
         layout.addWidget(title)
 
+        # Background queries
+        self.repo = Repository()
+        self.executor = QueryExecutor(self)
+        self.loading_label = QLabel("Loading...")
+        self.loading_label.setVisible(False)
+        self.executor.busy_changed.connect(self.loading_label.setVisible)
+        layout.addWidget(self.loading_label)
+
         # Clubs table
-        self.table = QTableWidget()
+        self.table = RowTableView(["ID", "Name", "Description"], columns=BookClub.COLUMNS,
+                                  record=partial(self.repo.record, BookClub))
         self.table.setStyleSheet("""
-            QTableWidget { background-color: #1a1a1a; color: white; gridline-color: #333333; }
+            QTableView { background-color: #1a1a1a; color: white; gridline-color: #333333; }
             QHeaderView::section { background-color: #222222; color: white; padding: 5px; }
         """)
         layout.addWidget(self.table)
@@ -58,6 +73,10 @@ class BookClubWindow(QDialog):
             self.create_btn.clicked.connect(self.create_club_dialog)
             self.view_members_btn.clicked.connect(self.view_members_dialog)
 
+        # Clubs created or deleted at other desks
+        self.live = live_updates()
+        self.live.changes_arrived.connect(self.apply_changes)
+
         # Load clubs from database
         self.load_clubs()
 
@@ -65,82 +84,52 @@ class BookClubWindow(QDialog):
     # Load all clubs
     # ----------------------------
     def load_clubs(self):
-        try:
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT club_id, name, description FROM book_clubs ORDER BY name")
-            rows = cur.fetchall()
-
-            self.table.setRowCount(len(rows))
-            self.table.setColumnCount(3)
-            self.table.setHorizontalHeaderLabels(["ID", "Name", "Description"])
+        self.executor.submit("clubs", self.repo.clubs,
+                             on_result=self.table.set_rows,
+                             on_error=lambda e: QMessageBox.critical(self, "Error", f"Failed to load clubs:\n{e}"))
 
-            for r, row in enumerate(rows):
-                for c, val in enumerate(row):
-                    self.table.setItem(r, c, QTableWidgetItem(str(val)))
+    def apply_changes(self, changes):
+        self.repo.apply(changes)
+        self.table.apply_changes(changes, "book_clubs", insert_new=True)
 
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load clubs:\n{e}")
-        finally:
-            try:
-                cur.close()
-                conn.close()
-            except:
-                pass
+    def done(self, result):
+        self.live.changes_arrived.disconnect(self.apply_changes)
+        self.executor.shutdown(wait=False)
+        super().done(result)
 
     # ----------------------------
     # Join club
     # ----------------------------
     def join_club(self):
-        row = self.table.currentRow()
-        if row < 0:
+        rec = self.table.current_record()
+        if rec is None:
             QMessageBox.warning(self, "Error", "Select a club first!")
             return
-        club_id = int(self.table.item(row, 0).text())
+        club_id = rec.club_id
 
         try:
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT 1 FROM club_members WHERE club_id=%s AND member_id=%s", (club_id, self.user_id))
-            if cur.fetchone():
-                QMessageBox.information(self, "Info", "Already joined!")
-            else:
-                cur.execute("INSERT INTO club_members (club_id, member_id) VALUES (%s, %s)", (club_id, self.user_id))
-                conn.commit()
+            if BookClub.join_club(self.user_id, club_id):
                 QMessageBox.information(self, "Success", "Joined club!")
+            else:
+                QMessageBox.information(self, "Info", "Already joined!")
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to join club:\n{e}")
-        finally:
-            try:
-                cur.close()
-                conn.close()
-            except:
-                pass
 
     # ----------------------------
     # Leave club
     # ----------------------------
     def leave_club(self):
-        row = self.table.currentRow()
-        if row < 0:
+        rec = self.table.current_record()
+        if rec is None:
             QMessageBox.warning(self, "Error", "Select a club first!")
             return
-        club_id = int(self.table.item(row, 0).text())
+        club_id = rec.club_id
 
         try:
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("DELETE FROM club_members WHERE club_id=%s AND member_id=%s", (club_id, self.user_id))
-            conn.commit()
+            BookClub.leave_club(self.user_id, club_id)
             QMessageBox.information(self, "Success", "Left club!")
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to leave club:\n{e}")
-        finally:
-            try:
-                cur.close()
-                conn.close()
-            except:
-                pass
 
     # ----------------------------
     # Create club (librarian)
@@ -170,21 +159,12 @@ class BookClubWindow(QDialog):
                 QMessageBox.warning(dlg, "Error", "Name is required!")
                 return
             try:
-                conn = get_connection()
-                cur = conn.cursor()
-                cur.execute("INSERT INTO book_clubs (name, description) VALUES (%s, %s)", (name, desc))
-                conn.commit()
+                changes = BookClub.create(name, desc)
                 QMessageBox.information(dlg, "Success", "Club created!")
                 dlg.close()
-                self.load_clubs()
+                self.apply_changes(changes)
             except Exception as e:
                 QMessageBox.critical(dlg, "Error", f"Failed to create club:\n{e}")
-            finally:
-                try:
-                    cur.close()
-                    conn.close()
-                except:
-                    pass
 
         create_btn.clicked.connect(create)
         dlg.exec_()
@@ -193,11 +173,11 @@ class BookClubWindow(QDialog):
     # View members (librarian)
     # ----------------------------
     def view_members_dialog(self):
-        row = self.table.currentRow()
-        if row < 0:
+        rec = self.table.current_record()
+        if rec is None:
             QMessageBox.warning(self, "Error", "Select a club!")
             return
-        club_id = int(self.table.item(row, 0).text())
+        club_id = rec.club_id
 
         dlg = QDialog(self)
         dlg.setWindowTitle("Club Members")
@@ -209,41 +189,24 @@ class BookClubWindow(QDialog):
         label.setFont(QFont("Arial", 14, QFont.Bold))
         label.setAlignment(Qt.AlignCenter)
 
-        table = QTableWidget()
+        table = RowTableView(["ID", "Full Name", "Username"], columns=Member.CLUB_COLUMNS,
+                             record=partial(self.repo.record, Member))
         table.setStyleSheet("""
-            QTableWidget { background-color: #1a1a1a; color: white; }
+            QTableView { background-color: #1a1a1a; color: white; }
             QHeaderView::section { background-color: #222222; color: white; padding: 5px; }
         """)
 
         layout.addWidget(label)
         layout.addWidget(table)
 
-        try:
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT m.member_id, m.full_name, u.username
-                FROM club_members cm
-                JOIN members m ON m.member_id = cm.member_id
-                JOIN users u ON u.user_id = m.user_id
-                WHERE cm.club_id = %s
-            """, (club_id,))
-            rows = cur.fetchall()
-
-            table.setRowCount(len(rows))
-            table.setColumnCount(3)
-            table.setHorizontalHeaderLabels(["ID", "Full Name", "Username"])
-            for r, row_data in enumerate(rows):
-                for c, val in enumerate(row_data):
-                    table.setItem(r, c, QTableWidgetItem(str(val)))
-            table.resizeColumnsToContents()
-        except Exception as e:
-            QMessageBox.critical(dlg, "Error", f"Failed to load members:\n{e}")
-        finally:
-            try:
-                cur.close()
-                conn.close()
-            except:
-                pass
+        self.executor.submit("club_members", self.repo.club_members, club_id, on_result=table.set_rows,
+            on_error=lambda e: QMessageBox.critical(dlg, "Error", f"Failed to load members:\n{e}"))
 
+        # members joining or leaving at other desks while the dialog is open
+        def patch(changes):
+            table.apply_changes(changes, "club_members", insert_new=True,
+                                accept=lambda row: True if row["club_id"] == club_id else None)
+        self.live.changes_arrived.connect(patch)
         dlg.exec_()
+        self.live.changes_arrived.disconnect(patch)
+        self.executor.cancel("club_members")
@@ -0,0 +1,122 @@
+# tools/borrow_contention.py
+# Contention check for Member.borrow: N threads borrow the same book at once and
+# the run fails if more loans are created than the book has copies, or if one
+# member ends up over the loan limit. Needs a reachable database (DB_CONFIG);
+# everything it creates is removed again.
+#
+#   python -m tools.borrow_contention --borrowers 100 --copies 10
+import argparse
+import sys
+import threading
+import uuid
+
+from database import database, schema
+from database.database import connection
+from models.member import Member
+
+
+def _setup(borrowers, copies, tag):
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("""INSERT INTO books (title, isbn, author_id, category, copies_total, copies_available)
+                       VALUES (%s, %s, NULL, 'contention', %s, %s) RETURNING book_id""",
+                    (f"contention {tag}", f"C-{tag}", copies, copies))
+        book_id = cur.fetchone()[0]
+        member_ids = []
+        for i in range(borrowers):
+            cur.execute("INSERT INTO users (username, password, role) VALUES (%s, %s, 'member') RETURNING user_id",
+                        (f"contention_{tag}_{i}", uuid.uuid4().hex))
+            user_id = cur.fetchone()[0]
+            cur.execute("INSERT INTO members (user_id, full_name) VALUES (%s, %s) RETURNING member_id",
+                        (user_id, f"Contention {i}"))
+            member_ids.append(cur.fetchone()[0])
+        # extra books for the loan limit check
+        cur.execute("""INSERT INTO books (title, isbn, author_id, category, copies_total, copies_available)
+                       SELECT %s || g, %s || g, NULL, 'contention', 1, 1 FROM generate_series(1, 10) g
+                       RETURNING book_id""",
+                    (f"contention {tag} extra ", f"CX-{tag}-"))
+        extra_books = [r[0] for r in cur.fetchall()]
+        conn.commit()
+    return book_id, member_ids, extra_books
+
+
+def _teardown(tag):
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM loans WHERE book_id IN (SELECT book_id FROM books WHERE category='contention' AND title LIKE %s)",
+                    (f"contention {tag}%",))
+        cur.execute("DELETE FROM books WHERE category='contention' AND title LIKE %s", (f"contention {tag}%",))
+        cur.execute("DELETE FROM members WHERE user_id IN (SELECT user_id FROM users WHERE username LIKE %s)",
+                    (f"contention_{tag}_%",))
+        cur.execute("DELETE FROM users WHERE username LIKE %s", (f"contention_{tag}_%",))
+        conn.commit()
+
+
+def _run_concurrently(calls):
+    barrier = threading.Barrier(len(calls))
+    results = [None] * len(calls)
+
+    def worker(i, member_id, book_id):
+        barrier.wait()
+        try:
+            results[i] = Member.borrow(member_id, book_id)[0]
+        except Exception as e:
+            results[i] = f"error: {e}"
+
+    threads = [threading.Thread(target=worker, args=(i, m, b)) for i, (m, b) in enumerate(calls)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def run(borrowers=100, copies=10):
+    database.POOL_CONFIG['maxconn'] = max(database.POOL_CONFIG['maxconn'], borrowers)
+    schema.migrate()
+    tag = uuid.uuid4().hex[:8]
+    book_id, member_ids, extra_books = _setup(borrowers, copies, tag)
+    failures = []
+    try:
+        # 1. many members race for the same book
+        results = _run_concurrently([(m, book_id) for m in member_ids])
+        ok = results.count(Member.BORROW_OK)
+        errors = [r for r in results if r.startswith("error")]
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT copies_available FROM books WHERE book_id=%s", (book_id,))
+            left = cur.fetchone()[0]
+            cur.execute("SELECT count(*) FROM loans WHERE book_id=%s AND status='borrowed'", (book_id,))
+            loans = cur.fetchone()[0]
+        print(f"same book: {borrowers} borrowers, {copies} copies -> {ok} ok, {loans} loans, "
+              f"{left} left, {len(errors)} errors")
+        if ok != copies or loans != copies or left != 0:
+            failures.append("copies oversubscribed or lost")
+        if errors:
+            failures.append(errors[0])
+
+        # 2. one member races for many books
+        member_id = member_ids[-1]
+        results = _run_concurrently([(member_id, b) for b in extra_books])
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM loans WHERE member_id=%s AND status='borrowed'", (member_id,))
+            active = cur.fetchone()[0]
+        print(f"loan limit: {len(extra_books)} parallel borrows by one member -> {active} active loans")
+        if active > Member.MAX_ACTIVE_LOANS:
+            failures.append("loan limit exceeded")
+    finally:
+        _teardown(tag)
+        database.close_pool()
+
+    for f in failures:
+        print("FAIL:", f)
+    return not failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent borrow contention check")
+    parser.add_argument("--borrowers", type=int, default=100)
+    parser.add_argument("--copies", type=int, default=10)
+    args = parser.parse_args(argv)
+    return 0 if run(args.borrowers, args.copies) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+import bisect
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from database.backend import get_backend, page_key
+
+# In-process read-through cache of the catalogue, shared by every window of the
+# process. Books are held by book_id (least recently used evicted first) with a
+# sorted (title, book_id) index beside them, and the cache remembers which key
+# ranges it holds completely, so a catalogue page inside such a range is served
+# from memory. Writes made here patch it straight from their ChangeSet; changes
+# made elsewhere arrive through Backend.books_changed_since(), asked at most
+# every refresh_s seconds -- or, while a live change feed is connected (see
+# gui/live_updates.py), as notifications, with no asking at all.
+# LIBRARY_CATALOGUE_CACHE=0 switches it off.
+CACHE_CONFIG = {
+    'enabled': os.environ.get('LIBRARY_CATALOGUE_CACHE', '1') != '0',
+    'capacity': 50000,  # books held
+    'refresh_s': 5.0,   # how stale the cache may get before it asks what changed
+}
+
+
+class CatalogueCache:
+    def __init__(self, db, columns, capacity, refresh_s):
+        self.db = db
+        self.columns = tuple(columns)
+        self.capacity = capacity
+        self.refresh_s = refresh_s
+        self._title = self.columns.index("title")
+        self._id = self.columns.index("book_id")
+        self._lock = threading.RLock()
+        self._rows = OrderedDict()  # book_id -> row, least recently used first
+        self._index = []            # sorted (title, book_id) of every cached row
+        # key ranges held completely, [(start, end)]: every book with
+        # start < (title, book_id) <= end is cached; None is open-ended
+        self._runs = []
+        self._version = None
+        self._refresh_due = 0.0
+        self._generation = 0  # bumped by every change, so a slow read can't store stale rows
+        # set while notifications keep the cache current; when they stop, the
+        # next refresh catches up on everything since the last version seen
+        self.live = False
+        self.hits = self.misses = self.evictions = self.refreshes = 0
+
+    # ---- reads ----
+    def page(self, after, limit, columns):
+        self._refresh()
+        with self._lock:
+            rows = self._page_from_memory(after, limit)
+            if rows is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                generation = self._generation
+        if rows is None:
+            rows, next_key = self.db.books_page(after, limit, self.columns)
+            with self._lock:
+                if generation == self._generation and self._version is not None:
+                    for row in rows:
+                        self._put(row)
+                    self._add_run(after, self._key(rows[-1]) if next_key is not None else None)
+                    self._evict()
+        if columns != self.columns:
+            picks = [self.columns.index(c) for c in columns]
+            rows = [tuple(row[i] for i in picks) for row in rows]
+        return rows, page_key(rows, limit, columns)
+
+    def title_of(self, book_id):
+        self._refresh()
+        with self._lock:
+            row = self._rows.get(book_id)
+            if row is not None:
+                self.hits += 1
+                self._rows.move_to_end(book_id)
+                return row[self._title]
+            self.misses += 1
+        return self.db.book_title(book_id)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._rows),
+                'capacity': self.capacity,
+                'ranges': len(self._runs),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'refreshes': self.refreshes,
+                'version': self._version,
+            }
+
+    # ---- writes ----
+    def apply(self, changes):
+        # Patches cached books with a write's ChangeSet rows (partial rows update
+        # just their columns; complete new rows are added) and drops deleted ones.
+        with self._lock:
+            for change in changes.upserted("books"):
+                old = self._rows.get(change.get("book_id"))
+                if old is not None:
+                    self._put(tuple(change.get(c, old[i]) for i, c in enumerate(self.columns)))
+                elif all(c in change for c in self.columns):
+                    self._put(tuple(change[c] for c in self.columns))
+            for change in changes.deleted("books"):
+                self._remove(change.get("book_id"))
+            self._generation += 1
+            self._evict()
+
+    def invalidate(self):
+        # Forgets everything, e.g. after a bulk import or an explicit refresh.
+        with self._lock:
+            self._rows.clear()
+            self._index = []
+            self._runs = []
+            self._version = None
+            self._refresh_due = 0.0
+            self._generation += 1
+
+    # ---- internals ----
+    def _key(self, row):
+        return row[self._title], row[self._id]
+
+    def _refresh(self):
+        # Applies what changed in the database since the last look, at most
+        # every refresh_s seconds. The first call only notes the version: the
+        # cache is empty, so there is nothing to bring up to date.
+        with self._lock:
+            now = time.monotonic()
+            if now < self._refresh_due or (self.live and self._version is not None):
+                return
+            self._refresh_due = now + self.refresh_s
+            version = self._version
+        if version is None:
+            # nothing is stored until this is known, so nothing can be missed
+            version = self.db.catalogue_version()
+            with self._lock:
+                self._version = version
+                self._generation += 1
+            return
+        rows, deleted, version = self.db.books_changed_since(version, self.columns)
+        with self._lock:
+            if self._version is None:
+                return  # invalidated meanwhile
+            for row in rows:
+                # a book not cached only matters if it now falls in a range held completely
+                if row[self._id] in self._rows or self._held(self._key(row)):
+                    self._put(row)
+            for book_id in deleted:
+                self._remove(book_id)
+            self._version = version
+            self._generation += 1
+            self.refreshes += 1
+            self._evict()
+
+    def _page_from_memory(self, after, limit):
+        run = self._run_for(after)
+        if run is None:
+            return None
+        start = 0 if after is None else bisect.bisect_right(self._index, after)
+        keys = self._index[start:start + limit]
+        end = run[1]
+        if end is not None:
+            keys = [k for k in keys if k <= end]
+            if len(keys) < limit:
+                return None  # the page runs past what is held
+        rows = []
+        for _, book_id in keys:
+            self._rows.move_to_end(book_id)
+            rows.append(self._rows[book_id])
+        return rows
+
+    def _run_for(self, key):
+        # the held range whose books all come after `key` (None: the start of the catalogue)
+        for start, end in self._runs:
+            if start is None or (key is not None and start <= key):
+                if key is None or end is None or key < end:
+                    return start, end
+        return None
+
+    def _held(self, key):
+        return any((start is None or start < key) and (end is None or key <= end) for start, end in self._runs)
+
+    def _add_run(self, start, end):
+        runs = sorted(self._runs + [(start, end)], key=lambda r: (r[0] is not None, r[0]))
+        merged = [runs[0]]
+        for s, e in runs[1:]:
+            ps, pe = merged[-1]
+            if pe is None or (s is not None and s <= pe):
+                merged[-1] = (ps, None if pe is None or e is None else max(pe, e))
+            else:
+                merged.append((s, e))
+        self._runs = merged
+
+    def _put(self, row):
+        book_id = row[self._id]
+        old = self._rows.get(book_id)
+        if old is not None:
+            if self._key(old) != self._key(row):
+                del self._index[bisect.bisect_left(self._index, self._key(old))]
+                bisect.insort(self._index, self._key(row))
+        else:
+            bisect.insort(self._index, self._key(row))
+        self._rows[book_id] = row
+        self._rows.move_to_end(book_id)
+
+    def _remove(self, book_id):
+        row = self._rows.pop(book_id, None)
+        if row is not None:
+            del self._index[bisect.bisect_left(self._index, self._key(row))]
+
+    def _evict(self):
+        while len(self._rows) > self.capacity:
+            book_id, row = self._rows.popitem(last=False)
+            key = self._key(row)
+            i = bisect.bisect_left(self._index, key)
+            del self._index[i]
+            before = self._index[i - 1] if i > 0 else None
+            # a range that held the book now ends just before it and starts again after it
+            runs = []
+            for start, end in self._runs:
+                if (start is None or start < key) and (end is None or key <= end):
+                    if before is not None and (start is None or before > start):
+                        runs.append((start, before))
+                    if end is None or key < end:
+                        runs.append((key, end))
+                else:
+                    runs.append((start, end))
+            self._runs = runs
+            self.evictions += 1
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def catalogue_cache():
+    # The process's cache for the current backend, or None when it is switched off.
+    global _cache
+    if not CACHE_CONFIG['enabled']:
+        return None
+    db = get_backend()
+    with _cache_lock:
+        if _cache is None or _cache.db is not db:
+            from models.book import Book
+            _cache = CatalogueCache(db, Book.CATALOGUE_COLUMNS, CACHE_CONFIG['capacity'], CACHE_CONFIG['refresh_s'])
+        return _cache
+
+
+def record_changes(changes):
+    # Every write path hands its ChangeSet here so cached books never go stale.
+    cache = catalogue_cache()
+    if cache is not None and changes:
+        cache.apply(changes)
+
+
+def set_catalogue_live(live):
+    cache = catalogue_cache()
+    if cache is not None:
+        cache.live = live
+
+
+def invalidate_catalogue():
+    cache = catalogue_cache()
+    if cache is not None:
+        cache.invalidate()
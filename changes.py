@@ -0,0 +1,43 @@
+class ChangeSet:
+    """Rows touched by a write, as returned by its RETURNING clause.
+
+    Rows are dicts keyed by column name and may be partial (only the columns the
+    write knows about). Views use them to patch the affected rows in place
+    instead of reloading whole tables.
+    """
+
+    def __init__(self):
+        self._upserted = {}
+        self._deleted = {}
+
+    def upsert(self, table, rows):
+        self._upserted.setdefault(table, []).extend(rows)
+        return self
+
+    def delete(self, table, rows):
+        self._deleted.setdefault(table, []).extend(rows)
+        return self
+
+    def merge(self, other):
+        for table, rows in other._upserted.items():
+            self.upsert(table, rows)
+        for table, rows in other._deleted.items():
+            self.delete(table, rows)
+        return self
+
+    def upserted(self, table):
+        return self._upserted.get(table, [])
+
+    def deleted(self, table):
+        return self._deleted.get(table, [])
+
+    def tables(self):
+        return set(self._upserted) | set(self._deleted)
+
+    def __bool__(self):
+        return bool(self._upserted or self._deleted)
+
+
+def rows_as_dicts(cur):
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur.fetchall()]
@@ -1,4 +1,15 @@
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+
 import psycopg2
+import psycopg2.extensions
+
+from database import instrument
+from database.backend import INSTRUMENT_CONFIG
 
 DB_CONFIG = {
     'host': 'localhost',
@@ -8,16 +19,391 @@ DB_CONFIG = {
     'password': 'kallon'
 }
 
-def get_connection():
+# Bounds for the shared connection pool. Connections idle for longer than
+# ping_after seconds get a round-trip health check before being handed out.
+POOL_CONFIG = {
+    'minconn': 1,
+    'maxconn': 10,
+    'timeout': 10.0,
+    'ping_after': 30.0,
+}
+
+
+def _parse_replicas(text):
+    # "host:port,host" -> [{'host': ..., 'port': ...}], overrides of DB_CONFIG
+    replicas = []
+    for entry in filter(None, (e.strip() for e in text.split(","))):
+        host, _, port = entry.partition(":")
+        replicas.append({'host': host, 'port': int(port)} if port else {'host': host})
+    return replicas
+
+
+# Read replicas: streaming standbys of the primary above, each given as its
+# differences from DB_CONFIG. connection(read_only=True) -- browsing, search,
+# reports -- goes to them round-robin. A replica that fails to connect, or
+# breaks during a read, is skipped for retry_after seconds; with none left,
+# reads use the primary. The backend's reads are run again on the primary when
+# their replica breaks under them (PostgresBackend._read). For
+# read_your_writes_s after this process writes, reads stay on the primary too,
+# so the view reloaded straight after a borrow already shows it. Writes always
+# go to the primary. Two local servers are enough to try it:
+#
+#   LIBRARY_DB_REPLICAS=localhost:5433 python app.py
+REPLICA_CONFIG = {
+    'replicas': _parse_replicas(os.environ.get('LIBRARY_DB_REPLICAS', '')),
+    'retry_after': 30.0,
+    'read_your_writes_s': 5.0,
+}
+
+def get_connection(config=None):
+    config = config or DB_CONFIG
     try:
         conn = psycopg2.connect(
-            host=DB_CONFIG['host'],
-            port=DB_CONFIG['port'],
-            dbname=DB_CONFIG['dbname'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password']
+            host=config['host'],
+            port=config['port'],
+            dbname=config['dbname'],
+            user=config['user'],
+            password=config['password'],
+            connection_factory=InstrumentedConnection if instrument.configure(INSTRUMENT_CONFIG) else None
         )
         return conn
     except Exception as e:
         print("DB connection failed:", e)
         raise
+
+
+# Cursors that report every statement to instrument.record(); connections only
+# use them while instrumentation is on.
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(query, vars)
+            failed = False
+            return result
+        finally:
+            instrument.record(query, vars, (time.perf_counter() - start) * 1000.0, self.rowcount, failed)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().executemany(query, vars_list)
+            failed = False
+            return result
+        finally:
+            instrument.record(query, None, (time.perf_counter() - start) * 1000.0, self.rowcount, failed)
+
+    def callproc(self, procname, parameters=None):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().callproc(procname, parameters)
+            failed = False
+            return result
+        finally:
+            instrument.record(f"CALL {procname}", parameters, (time.perf_counter() - start) * 1000.0, self.rowcount, failed)
+
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().copy_expert(sql, file, size)
+            failed = False
+            return result
+        finally:
+            instrument.record(sql, None, (time.perf_counter() - start) * 1000.0, self.rowcount, failed)
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        if kwargs.get("cursor_factory") is None:
+            kwargs["cursor_factory"] = InstrumentedCursor
+        return super().cursor(*args, **kwargs)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect, minconn=1, maxconn=10, timeout=10.0, ping_after=30.0):
+        if maxconn < 1 or minconn > maxconn:
+            raise ValueError("invalid pool bounds")
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = []  # (conn, returned_at); used LIFO so hot connections stay hot
+        self._size = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._discarded = 0
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise psycopg2.InterfaceError("connection pool is closed")
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    conn, returned_at = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"no connection available after {self.timeout:.1f}s")
+                waited = True
+                self._cond.wait(remaining)
+
+        try:
+            if conn is not None and not self._healthy(conn, returned_at):
+                self._close_quietly(conn)
+                with self._cond:
+                    self._discarded += 1
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        elapsed = time.monotonic() - start
+        with self._cond:
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+            self._wait_total += elapsed
+            self._wait_max = max(self._wait_max, elapsed)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                # never hand the next caller someone else's open transaction
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        if discard or conn.closed:
+            self._close_quietly(conn)
+            with self._cond:
+                self._size -= 1
+                self._discarded += 1
+                self._cond.notify()
+            return
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time.monotonic() - returned_at < self.ping_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'maxconn': self.maxconn,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'discarded': self._discarded,
+                'avg_wait_ms': (self._wait_total / self._checkouts * 1000.0) if self._checkouts else 0.0,
+                'max_wait_ms': self._wait_max * 1000.0,
+            }
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+
+class ReplicaDown(psycopg2.OperationalError):
+    """A read replica broke during a read. It has been marked down; the read
+    can be run again on the primary (connection(read_only=True, use_replica=False))."""
+
+
+class _Replica:
+    # One read replica: its own pool, opened on first use, and when it may be
+    # tried again after failing.
+    def __init__(self, config):
+        self.config = config
+        self.name = f"{config['host']}:{config['port']}"
+        self.pool = None
+        self.down_until = 0.0
+        self.failures = 0
+        self.reads = 0
+
+    def getconn(self):
+        if self.pool is None:
+            # no connections up front: an unreachable replica must not stop start-up
+            self.pool = ConnectionPool(partial(get_connection, self.config), **{**POOL_CONFIG, 'minconn': 0})
+        return self.pool.getconn()
+
+    def mark_down(self):
+        self.down_until = time.monotonic() + REPLICA_CONFIG['retry_after']
+        self.failures += 1
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'up': time.monotonic() >= self.down_until,
+            'reads': self.reads,
+            'failures': self.failures,
+            'pool': self.pool.stats() if self.pool is not None else None,
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_replicas = None
+_replica_turn = itertools.count()
+_last_write = float("-inf")
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(get_connection, **POOL_CONFIG)
+    return _pool
+
+
+def get_replicas():
+    global _replicas
+    if _replicas is None:
+        with _pool_lock:
+            if _replicas is None:
+                _replicas = [_Replica({**DB_CONFIG, **overrides}) for overrides in REPLICA_CONFIG['replicas']]
+    return _replicas
+
+
+def close_pool():
+    global _pool, _replicas
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+        for replica in _replicas or ():
+            if replica.pool is not None:
+                replica.pool.closeall()
+        _replicas = None
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def replica_stats():
+    return [replica.stats() for replica in get_replicas()]
+
+
+def _checkout_replica():
+    # (replica, conn) from the next healthy replica in turn, or None
+    replicas = get_replicas()
+    if not replicas or time.monotonic() - _last_write < REPLICA_CONFIG['read_your_writes_s']:
+        return None
+    start = next(_replica_turn)
+    for i in range(len(replicas)):
+        replica = replicas[(start + i) % len(replicas)]
+        if time.monotonic() < replica.down_until:
+            continue
+        try:
+            conn = replica.getconn()
+        except (psycopg2.OperationalError, PoolTimeout):
+            replica.mark_down()
+            continue
+        replica.reads += 1
+        return replica, conn
+    return None
+
+
+@contextmanager
+def connection(read_only=False, use_replica=True):
+    """Check a pooled connection out for the duration of the block.
+
+    read_only blocks may be served by a read replica (see REPLICA_CONFIG)
+    unless use_replica is false; everything else is taken to write and goes
+    to the primary. Uncommitted work is rolled back when the block exits;
+    connections that broke while checked out are discarded instead of being
+    returned, and a replica that broke raises ReplicaDown.
+    """
+    global _last_write
+    picked = _checkout_replica() if read_only and use_replica else None
+    if picked is not None:
+        replica, conn = picked
+        pool = replica.pool
+    else:
+        replica, pool = None, get_pool()
+        conn = pool.getconn()
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+        broken = True
+        if replica is not None:
+            replica.mark_down()
+            raise ReplicaDown(f"replica {replica.name}: {e}") from e
+        raise
+    finally:
+        pool.putconn(conn, discard=broken)
+        if not read_only:
+            _last_write = time.monotonic()
+
+
+def fetch_all(sql, params=None, read_only=False):
+    with connection(read_only) as conn, conn.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.fetchall()
@@ -1,10 +1,11 @@
 from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QLineEdit, QPushButton, QMessageBox
-from database.database import get_connection
+from models.book import Book
 
 class EditBookDialog(QDialog):
     def __init__(self, book_id, parent=None):
         super().__init__(parent)
         self.book_id = book_id
+        self.changes = None
         self.setWindowTitle("Edit Book")
         self.setFixedSize(400, 300)
 
@@ -21,20 +22,12 @@ class EditBookDialog(QDialog):
         self.load_book()
 
     def load_book(self):
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT title FROM books WHERE book_id=%s", (self.book_id,))
-        row = cur.fetchone()
-        if row:
-            self.title_input.setText(row[0])
-        cur.close(); conn.close()
+        title = Book.title_of(self.book_id)
+        if title is not None:
+            self.title_input.setText(title)
 
     def save(self):
         title = self.title_input.text()
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("UPDATE books SET title=%s WHERE book_id=%s", (title, self.book_id))
-        conn.commit()
-        cur.close(); conn.close()
+        self.changes = Book.update_title(self.book_id, title)
         QMessageBox.information(self, "Success", "Book updated!")
-        self.close()
+        self.accept()
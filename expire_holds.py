@@ -0,0 +1,32 @@
+# tools/expire_holds.py
+# Expires holds whose copy was set aside but not collected in time and passes
+# the copies on to the next member in each queue (see Member.expire_holds).
+# Meant to run daily, next to tools/overdue_job.py:
+#
+#   20 0 * * *  cd /srv/library && python -m tools.expire_holds
+import argparse
+import datetime
+import sys
+import time
+
+from models.member import Member
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Expire uncollected holds")
+    parser.add_argument("--as-of", type=datetime.date.fromisoformat, default=None,
+                        help="expire holds set aside until before this date (YYYY-MM-DD); default today")
+    args = parser.parse_args(argv)
+
+    def progress(expired):
+        print(f"\r{expired} holds expired", end="", file=sys.stderr)
+
+    start = time.monotonic()
+    expired = Member.expire_holds(args.as_of, progress=progress)
+    print(file=sys.stderr)
+    print(f"{expired} holds expired in {time.monotonic() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
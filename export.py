@@ -0,0 +1,98 @@
+import csv
+import gzip
+import io
+import json
+import os
+from database.backend import get_backend
+
+# Streaming report exports. Rows come off the backend's stream_query()
+# `itersize` at a time (a server-side cursor on Postgres) and go straight
+# through a writer generator to the file, so memory stays flat however big the
+# report is.
+
+# name -> (title, query, tables it reads, for the row estimate)
+REPORTS = {
+    "loan_history": ("Loan history", """
+        SELECT l.loan_id, l.member_id, COALESCE(m.full_name, u.username) AS member_name,
+               b.book_id, b.title, b.isbn, l.loan_date, l.due_date, l.return_date, l.status
+        FROM (SELECT loan_id, book_id, member_id, loan_date, due_date, return_date, status FROM loans
+              UNION ALL
+              SELECT loan_id, book_id, member_id, loan_date, due_date, return_date, status FROM loans_archive) l
+        JOIN books b ON l.book_id = b.book_id
+        LEFT JOIN members m ON l.member_id = m.member_id
+        LEFT JOIN users u ON m.user_id = u.user_id
+        ORDER BY l.loan_date DESC, l.loan_id DESC
+    """, ("loans", "loans_archive")),
+    "inventory": ("Inventory", """
+        SELECT book_id, title, isbn, author_id, category, copies_total, copies_available,
+               copies_total - copies_available AS on_loan
+        FROM books
+        ORDER BY title, book_id
+    """, ("books",)),
+}
+
+DEFAULT_ITERSIZE = 2000
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def estimate_rows(report):
+    # Rough size of the report, for progress bars; no table scan.
+    db = get_backend()
+    return sum(db.estimate_rows(table) for table in REPORTS[report][2])
+
+
+def stream_rows(sql, itersize=DEFAULT_ITERSIZE):
+    # Yields the column names, then every row.
+    return get_backend().stream_query(sql, itersize)
+
+
+def csv_lines(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    for row in rows:
+        writer.writerow(row)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def jsonl_lines(rows):
+    columns = next(rows)
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), default=str) + "\n"
+
+
+def export_report(report, path, itersize=DEFAULT_ITERSIZE, progress=None, cancel=None):
+    # Writes `report` to `path`: CSV or JSONL by extension, gzipped if it ends
+    # in .gz. progress(rows) is called every `itersize` rows; once cancel() is
+    # true the export stops with ExportCancelled and no file is left behind.
+    # The file only appears under its name once it is complete.
+    _, sql, _ = REPORTS[report]
+    name = path[:-3] if path.endswith(".gz") else path
+    to_lines = jsonl_lines if name.endswith((".jsonl", ".json")) else csv_lines
+    tmp = path + ".part"
+    opener = gzip.open if path.endswith(".gz") else open
+    rows = stream_rows(sql, itersize=itersize)
+    written = 0
+    try:
+        with opener(tmp, "wt", encoding="utf-8", newline="") as out:
+            for line in to_lines(rows):
+                out.write(line)
+                written += 1
+                if written % itersize == 0:
+                    if cancel is not None and cancel():
+                        raise ExportCancelled()
+                    if progress is not None:
+                        progress(written)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        rows.close()
+    # csv has a header line, jsonl doesn't
+    return written - 1 if to_lines is csv_lines else written
@@ -0,0 +1,105 @@
+# gui/export_dialog.py
+import threading
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QPushButton, QProgressBar, QFileDialog, QMessageBox
+)
+from gui.workers import QueryExecutor
+from models.export import REPORTS, estimate_rows, export_report, ExportCancelled
+
+
+class _ExportSignals(QObject):
+    progress = pyqtSignal(int)  # rows written so far
+
+
+class ExportDialog(QDialog):
+    def __init__(self, report=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Export Report")
+        self.setFixedSize(460, 220)
+        self._cancel = threading.Event()
+        self._estimate = 0
+        self.executor = QueryExecutor(self, max_threads=2)
+        self.signals = _ExportSignals(self)
+        self.signals.progress.connect(self.on_progress)
+
+        layout = QVBoxLayout()
+        self.report_combo = QComboBox()
+        for key, (title, _, _) in REPORTS.items():
+            self.report_combo.addItem(title, key)
+        if report is not None:
+            self.report_combo.setCurrentIndex(self.report_combo.findData(report))
+        layout.addWidget(QLabel("Report:"))
+        layout.addWidget(self.report_combo)
+
+        self.progress_bar = QProgressBar(); self.progress_bar.setRange(0, 0); self.progress_bar.setVisible(False)
+        layout.addWidget(self.progress_bar)
+        self.status_label = QLabel("Exports to .csv or .jsonl; add .gz to compress")
+        layout.addWidget(self.status_label)
+
+        btn_h = QHBoxLayout()
+        self.export_btn = QPushButton("Export..."); self.export_btn.clicked.connect(self.start_export)
+        self.cancel_btn = QPushButton("Cancel"); self.cancel_btn.clicked.connect(self.cancel_export)
+        self.cancel_btn.setEnabled(False)
+        btn_h.addWidget(self.export_btn); btn_h.addWidget(self.cancel_btn)
+        layout.addLayout(btn_h)
+        self.setLayout(layout)
+
+    def start_export(self):
+        report = self.report_combo.currentData()
+        path, _ = QFileDialog.getSaveFileName(self, "Export to", f"{report}.csv",
+                                              "CSV (*.csv);;JSON Lines (*.jsonl);;"
+                                              "Compressed CSV (*.csv.gz);;Compressed JSON Lines (*.jsonl.gz)")
+        if not path:
+            return
+        self._cancel.clear()
+        self._estimate = 0
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setVisible(True)
+        self.status_label.setText("Exporting...")
+        self.export_btn.setEnabled(False)
+        self.report_combo.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
+        self.executor.submit("estimate", estimate_rows, report, on_result=self.on_estimate)
+        self.executor.submit("export", export_report, report, path, 2000, self.signals.progress.emit,
+                             self._cancel.is_set, on_result=lambda n: self.on_finished(n, path),
+                             on_error=self.on_failed)
+
+    def cancel_export(self):
+        self._cancel.set()
+        self.cancel_btn.setEnabled(False)
+        self.status_label.setText("Cancelling...")
+
+    def on_estimate(self, estimate):
+        self._estimate = estimate
+        if estimate > 0:
+            self.progress_bar.setRange(0, estimate)
+
+    def on_progress(self, rows):
+        if self._estimate:
+            self.progress_bar.setValue(min(rows, self._estimate))
+        self.status_label.setText(f"{rows} rows written")
+
+    def _finish(self):
+        self.progress_bar.setVisible(False)
+        self.cancel_btn.setEnabled(False)
+        self.export_btn.setEnabled(True)
+        self.report_combo.setEnabled(True)
+
+    def on_finished(self, rows, path):
+        self._finish()
+        self.status_label.setText(f"{rows} rows exported to {path}")
+
+    def on_failed(self, error):
+        self._finish()
+        if isinstance(error, ExportCancelled):
+            self.status_label.setText("Export cancelled")
+            return
+        self.status_label.setText("Export failed")
+        QMessageBox.critical(self, "Error", f"Export failed:\n{error}")
+
+    def done(self, result):
+        # closing mid-export stops it and removes the partial file
+        self._cancel.set()
+        self.executor.shutdown(wait=False)
+        super().done(result)
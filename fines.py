@@ -0,0 +1,60 @@
+import datetime
+from decimal import Decimal
+
+from database.backend import get_backend
+
+# Overdue and fine processing. A loan still out after its due date is marked
+# 'overdue', and every late loan -- out or returned late -- has one fine:
+# days late * per_day, capped at cap. Fines of loans still out grow every day
+# until the loan comes back, when they become final. The job walks the loans
+# table in loan_id ranges of `chunk` ids, each range one short transaction of
+# set-based statements, so borrowing and returning carry on while it runs and
+# an interrupted run just starts over. Run it daily (tools/overdue_job.py).
+FINE_CONFIG = {
+    'per_day': Decimal("0.50"),
+    'cap': Decimal("20.00"),
+    'chunk': 50000,  # loan ids per transaction
+}
+
+# members listed in the librarian's fines summary
+SUMMARY_LIMIT = 500
+
+
+class OverdueResult:
+    def __init__(self, as_of):
+        self.as_of = as_of
+        self.chunks = 0
+        self.marked = 0   # loans newly marked overdue
+        self.fined = 0    # fines added or changed
+
+    def __repr__(self):
+        return (f"OverdueResult(as_of={self.as_of}, chunks={self.chunks}, marked={self.marked}, "
+                f"fined={self.fined})")
+
+
+def assess_overdue(as_of=None, chunk=None, progress=None):
+    # Runs the whole job as of `as_of` (default today). progress(result,
+    # fraction) is called after every chunk. Returns an OverdueResult.
+    as_of = as_of or datetime.date.today()
+    chunk = chunk or FINE_CONFIG['chunk']
+    db = get_backend()
+    result = OverdueResult(as_of)
+    first, last = db.loan_id_range()
+    if first is None:
+        return result
+    for start in range(first, last + 1, chunk):
+        end = min(start + chunk - 1, last)
+        marked, fined = db.assess_overdue(start, end, as_of, FINE_CONFIG['per_day'], FINE_CONFIG['cap'])
+        result.chunks += 1
+        result.marked += marked
+        result.fined += fined
+        if progress:
+            progress(result, (end - first + 1) / (last - first + 1))
+    return result
+
+
+def fines_summary(limit=SUMMARY_LIMIT):
+    # ((members fined, overdue loans, fined loans, total amount),
+    #  [(member_id, member_name, overdue_loans, fined_loans, days_late, amount)])
+    db = get_backend()
+    return db.fine_totals(), db.member_fines(limit)
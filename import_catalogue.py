@@ -0,0 +1,47 @@
+# tools/import_catalogue.py
+# Bulk-load an acquisitions file (CSV or JSONL, optionally gzipped) into the
+# catalogue. Rejected rows are listed on stderr, or written to --rejects.
+#
+#   python -m tools.import_catalogue acquisitions.csv --rejects rejects.csv
+import argparse
+import csv
+import sys
+import time
+
+from models.importer import import_catalogue
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk catalogue import")
+    parser.add_argument("path", help="CSV or JSONL file with title, isbn, author_id, category, copies")
+    parser.add_argument("--rejects", help="write rejected rows (line, reason) to this CSV file")
+    args = parser.parse_args(argv)
+
+    rejects_file = open(args.rejects, "w", newline="") if args.rejects else None
+    rejects = csv.writer(rejects_file) if rejects_file else None
+    if rejects:
+        rejects.writerow(["line", "reason"])
+
+    def on_reject(line, reason):
+        if rejects:
+            rejects.writerow([line, reason])
+        else:
+            print(f"line {line}: {reason}", file=sys.stderr)
+
+    def progress(result, fraction):
+        print(f"\r{fraction:6.1%}  {result.read} read, {result.rejected} rejected", end="", file=sys.stderr)
+
+    start = time.monotonic()
+    try:
+        result = import_catalogue(args.path, progress=progress, on_reject=on_reject)
+    finally:
+        if rejects_file:
+            rejects_file.close()
+    print(file=sys.stderr)
+    print(f"{result.read} rows read, {result.rejected} rejected, {result.inserted} titles added, "
+          f"{result.updated} titles restocked in {time.monotonic() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# gui/import_dialog.py
+import threading
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QProgressBar, QFileDialog, QMessageBox
+)
+from gui.table_model import RowTableView
+from gui.workers import QueryExecutor
+from models.importer import import_catalogue, ImportCancelled
+
+
+class _ImportSignals(QObject):
+    progress = pyqtSignal(object, float)  # ImportResult so far, fraction of the file read
+    rejected = pyqtSignal(int, str)       # line, reason
+
+
+class ImportDialog(QDialog):
+    # rejects listed in the dialog; the count keeps going past this
+    MAX_SHOWN_REJECTS = 1000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Import Catalogue")
+        self.setFixedSize(560, 460)
+        self.result = None
+        self._cancel = threading.Event()
+        self._rejects = []
+        self.executor = QueryExecutor(self, max_threads=1)
+        self.signals = _ImportSignals(self)
+        self.signals.progress.connect(self.on_progress)
+        self.signals.rejected.connect(self.on_rejected)
+
+        layout = QVBoxLayout()
+        file_h = QHBoxLayout()
+        self.file_label = QLabel("No file selected")
+        browse_btn = QPushButton("Choose File..."); browse_btn.clicked.connect(self.choose_file)
+        file_h.addWidget(self.file_label); file_h.addWidget(browse_btn)
+        layout.addLayout(file_h)
+
+        self.progress_bar = QProgressBar(); self.progress_bar.setRange(0, 1000)
+        layout.addWidget(self.progress_bar)
+        self.status_label = QLabel("CSV or JSONL with title, isbn, author_id, category, copies")
+        layout.addWidget(self.status_label)
+
+        layout.addWidget(QLabel("Rejected rows:"))
+        self.rejects_table = RowTableView(["Line", "Reason"])
+        layout.addWidget(self.rejects_table)
+
+        btn_h = QHBoxLayout()
+        self.start_btn = QPushButton("Import"); self.start_btn.clicked.connect(self.start_import)
+        self.start_btn.setEnabled(False)
+        self.cancel_btn = QPushButton("Cancel"); self.cancel_btn.clicked.connect(self.cancel_import)
+        self.cancel_btn.setEnabled(False)
+        btn_h.addWidget(self.start_btn); btn_h.addWidget(self.cancel_btn)
+        layout.addLayout(btn_h)
+        self.setLayout(layout)
+        self.path = None
+
+    def choose_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Choose acquisitions file", "",
+                                              "Catalogue files (*.csv *.jsonl *.json *.csv.gz *.jsonl.gz);;All files (*)")
+        if path:
+            self.path = path
+            self.file_label.setText(path)
+            self.start_btn.setEnabled(True)
+
+    def start_import(self):
+        self._cancel.clear()
+        self._rejects = []
+        self.rejects_table.set_rows([])
+        self.progress_bar.setValue(0)
+        self.status_label.setText("Reading...")
+        self.start_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
+        # the callbacks run on the worker thread; signals carry them over to the GUI
+        self.executor.submit("import", import_catalogue, self.path, self.signals.progress.emit,
+                             self.signals.rejected.emit, self._cancel.is_set,
+                             on_result=self.on_finished, on_error=self.on_failed)
+
+    def cancel_import(self):
+        self._cancel.set()
+        self.cancel_btn.setEnabled(False)
+        self.status_label.setText("Cancelling...")
+
+    def on_progress(self, result, fraction):
+        self.progress_bar.setValue(int(fraction * 1000))
+        if fraction >= 1.0:
+            self.status_label.setText(f"{result.read} rows read, {result.rejected} rejected. Merging into the catalogue...")
+        else:
+            self.status_label.setText(f"{result.read} rows read, {result.rejected} rejected")
+        self.rejects_table.set_rows(list(self._rejects))
+
+    def on_rejected(self, line, reason):
+        if len(self._rejects) < self.MAX_SHOWN_REJECTS:
+            self._rejects.append((line, reason))
+
+    def on_finished(self, result):
+        self.result = result
+        self.rejects_table.set_rows(list(self._rejects))
+        self.progress_bar.setValue(1000)
+        self.cancel_btn.setEnabled(False)
+        self.start_btn.setEnabled(True)
+        self.status_label.setText(f"Done: {result.inserted} titles added, {result.updated} restocked, "
+                                  f"{result.rejected} of {result.read} rows rejected")
+
+    def on_failed(self, error):
+        self.cancel_btn.setEnabled(False)
+        self.start_btn.setEnabled(True)
+        self.progress_bar.setValue(0)
+        if isinstance(error, ImportCancelled):
+            self.status_label.setText("Import cancelled; nothing was changed")
+            return
+        self.status_label.setText("Import failed; nothing was changed")
+        QMessageBox.critical(self, "Error", f"Import failed:\n{error}")
+
+    def done(self, result):
+        # closing mid-import rolls it back
+        self._cancel.set()
+        self.executor.shutdown(wait=False)
+        super().done(result)
@@ -0,0 +1,135 @@
+import csv
+import gzip
+import io
+import json
+import os
+from database.backend import get_backend, isbn13
+from models.catalogue_cache import invalidate_catalogue
+
+# Bulk catalogue import. The file is streamed and validated row by row, and
+# the good rows go to the backend's merge_catalogue() as they are read: ISBNs
+# already in the catalogue get their copies added, new ISBNs are inserted.
+# Nothing is visible to other sessions until the whole file has been merged.
+
+REJECT_NO_TITLE = "missing title"
+REJECT_BAD_ISBN = "invalid ISBN"
+REJECT_BAD_COPIES = "copies must be a positive whole number"
+REJECT_BAD_AUTHOR = "author_id must be a whole number"
+REJECT_BAD_ROW = "unreadable row"
+
+# rows between progress callbacks
+PROGRESS_EVERY = 5000
+
+
+class ImportCancelled(Exception):
+    pass
+
+
+class ImportResult:
+    def __init__(self):
+        self.read = 0       # data rows seen in the file
+        self.staged = 0     # rows that passed validation
+        self.rejected = 0
+        self.updated = 0    # existing titles that got more copies
+        self.inserted = 0   # new titles
+
+    def __repr__(self):
+        return (f"ImportResult(read={self.read}, staged={self.staged}, rejected={self.rejected}, "
+                f"updated={self.updated}, inserted={self.inserted})")
+
+
+def _open(path):
+    # Returns (text file, function giving the fraction of the file read so far).
+    raw = open(path, "rb")
+    size = os.fstat(raw.fileno()).st_size or 1
+    stream = gzip.GzipFile(fileobj=raw) if path.endswith(".gz") else raw
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    return text, lambda: min(raw.tell() / size, 1.0)
+
+
+def _records(path, text):
+    # Yields (line number, dict) for every data row of a CSV or JSONL file;
+    # rows that can't be parsed come through as (line number, None).
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith((".jsonl", ".json", ".ndjson")):
+        for line_no, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_no, record if isinstance(record, dict) else None
+    else:
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, {k.strip().lower(): v for k, v in record.items() if k is not None}
+
+
+def validate(record):
+    # Returns (row for staging, None) or (None, reject reason).
+    if record is None:
+        return None, REJECT_BAD_ROW
+    title = str(record.get("title") or "").strip()
+    if not title:
+        return None, REJECT_NO_TITLE
+    isbn = isbn13(record.get("isbn") or "")
+    if isbn is None:
+        return None, REJECT_BAD_ISBN
+    copies = record.get("copies", record.get("copies_total", 1))
+    try:
+        copies = int(str(copies).strip() or 1)
+    except ValueError:
+        return None, REJECT_BAD_COPIES
+    if copies < 1:
+        return None, REJECT_BAD_COPIES
+    author_id = str(record.get("author_id") or "").strip()
+    if author_id:
+        try:
+            author_id = int(author_id)
+        except ValueError:
+            return None, REJECT_BAD_AUTHOR
+    else:
+        author_id = None
+    category = str(record.get("category") or "").strip() or None
+    return (title, isbn, author_id, category, copies), None
+
+
+def import_catalogue(path, progress=None, on_reject=None, cancel=None):
+    # Imports a CSV or JSONL file (optionally .gz) with title, isbn, author_id,
+    # category and copies columns. progress(result, fraction) is called every
+    # PROGRESS_EVERY rows, on_reject(line, reason) for every bad row, and the
+    # import stops with ImportCancelled (nothing written) once cancel() is true.
+    result = ImportResult()
+    text, fraction = _open(path)
+
+    def staged_rows():
+        for line_no, record in _records(path, text):
+            result.read += 1
+            row, reason = validate(record)
+            if row is None:
+                result.rejected += 1
+                if on_reject is not None:
+                    on_reject(line_no, reason)
+            else:
+                result.staged += 1
+                yield (line_no,) + row
+            if result.read % PROGRESS_EVERY == 0:
+                if cancel is not None and cancel():
+                    raise ImportCancelled()
+                if progress is not None:
+                    progress(result, fraction())
+
+    def staged():
+        if progress is not None:
+            progress(result, 1.0)
+        if cancel is not None and cancel():
+            raise ImportCancelled()
+
+    try:
+        result.updated, result.inserted = get_backend().merge_catalogue(staged_rows(), staged)
+    finally:
+        text.close()
+    if result.updated or result.inserted:
+        invalidate_catalogue()  # any page may have changed
+    return result
@@ -0,0 +1,172 @@
+# database/instrument.py
+# Per-statement timing for the database layer. When enabled (INSTRUMENT_CONFIG
+# in backend.py), every statement a backend runs is recorded with its latency,
+# rows and call site; statements over the slow threshold go to the slow-query
+# log with their parameters redacted. When disabled, backends skip the timing
+# entirely (Postgres uses plain psycopg2 connections).
+import logging
+import sys
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# frames in these modules are plumbing, not call sites
+_PLUMBING_MODULES = {__name__, "database.database", "database.backend", "database.pg_backend",
+                     "database.sqlite_backend", "gui.workers", "gui.table_model", "gui.pager",
+                     "contextlib", "threading", "sqlite3"}
+_passthrough_codes = set()
+
+_enabled = False
+_slow_ms = 200.0
+_window = 1000
+_slow_logger = None
+_lock = threading.Lock()
+_sites = {}  # call site -> _SiteStats
+_local = threading.local()
+
+
+class _SiteStats:
+    __slots__ = ("calls", "errors", "rows", "total_ms", "max_ms", "recent")
+
+    def __init__(self, window):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent = deque(maxlen=window)  # rolling window for the percentiles
+
+
+def configure(config):
+    # Applies INSTRUMENT_CONFIG; returns whether instrumentation is on.
+    global _enabled, _slow_ms, _window, _slow_logger
+    _enabled = bool(config.get("enabled"))
+    if not _enabled:
+        return False
+    _slow_ms = float(config.get("slow_ms", _slow_ms))
+    _window = int(config.get("window", _window))
+    if _slow_logger is None:
+        _slow_logger = logging.getLogger("library.slow_queries")
+        path = config.get("slow_log")
+        if path and not _slow_logger.handlers:
+            handler = logging.FileHandler(path)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            _slow_logger.addHandler(handler)
+            _slow_logger.setLevel(logging.INFO)
+            _slow_logger.propagate = False
+    return True
+
+
+def enabled():
+    return _enabled
+
+
+def passthrough(fn):
+    # Marks a helper (e.g. MainWindow.run_query) as plumbing so statements are
+    # attributed to whoever called it.
+    _passthrough_codes.add(fn.__code__)
+    return fn
+
+
+def call_site(skip=1):
+    frame = sys._getframe(skip)
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get("__name__", "")
+        if module not in _PLUMBING_MODULES and not module.startswith("psycopg2") \
+                and code not in _passthrough_codes:
+            owner = frame.f_locals.get("self")
+            if owner is not None:
+                return f"{type(owner).__name__}.{code.co_name}"
+            return f"{module}.{code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+@contextmanager
+def site(name):
+    # Attributes statements run in this thread to `name`, e.g. the call site a
+    # background job was submitted from.
+    saved = getattr(_local, "site", None)
+    _local.site = name
+    try:
+        yield
+    finally:
+        _local.site = saved
+
+
+def record(sql, params, elapsed_ms, rows, failed=False):
+    name = getattr(_local, "site", None) or call_site(2)
+    with _lock:
+        stats = _sites.get(name)
+        if stats is None:
+            stats = _sites[name] = _SiteStats(_window)
+        stats.calls += 1
+        stats.errors += failed
+        stats.rows += max(rows, 0)
+        stats.total_ms += elapsed_ms
+        stats.max_ms = max(stats.max_ms, elapsed_ms)
+        stats.recent.append(elapsed_ms)
+    if elapsed_ms >= _slow_ms and _slow_logger is not None:
+        _slow_logger.info("%.1f ms  %s  rows=%s  %s  params=%s%s", elapsed_ms, name, rows,
+                          " ".join(_text(sql).split()), redact(params), "  FAILED" if failed else "")
+
+
+def _text(sql):
+    if isinstance(sql, bytes):
+        return sql.decode("utf-8", "replace")
+    return str(sql)
+
+
+def redact(params):
+    # Keeps the shape of the parameters (count, names, types) but not the values.
+    if params is None:
+        return "none"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+    if isinstance(params, (list, tuple)):
+        return "(" + ", ".join(type(v).__name__ for v in params) + ")"
+    return type(params).__name__
+
+
+def _percentile(ordered, p):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def stats():
+    # Returns {call site: {...}} with totals since the last reset and p50/p95/p99
+    # over the most recent `window` statements of each site.
+    with _lock:
+        snapshot = {name: (s.calls, s.errors, s.rows, s.total_ms, s.max_ms, sorted(s.recent))
+                    for name, s in _sites.items()}
+    result = {}
+    for name, (calls, errors, rows, total_ms, max_ms, recent) in snapshot.items():
+        result[name] = {
+            'calls': calls,
+            'errors': errors,
+            'rows': rows,
+            'total_ms': total_ms,
+            'avg_ms': total_ms / calls if calls else 0.0,
+            'max_ms': max_ms,
+            'p50_ms': _percentile(recent, 50),
+            'p95_ms': _percentile(recent, 95),
+            'p99_ms': _percentile(recent, 99),
+        }
+    return result
+
+
+def reset():
+    with _lock:
+        _sites.clear()
+
+
+def report():
+    # Plain-text table of stats(), slowest total time first.
+    rows = sorted(stats().items(), key=lambda item: item[1]['total_ms'], reverse=True)
+    lines = [f"{'call site':48s} {'calls':>7s} {'rows':>9s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'max':>8s} {'total':>10s}"]
+    for name, s in rows:
+        lines.append(f"{name[:48]:48s} {s['calls']:7d} {s['rows']:9d} {s['p50_ms']:8.1f} {s['p95_ms']:8.1f} "
+                     f"{s['p99_ms']:8.1f} {s['max_ms']:8.1f} {s['total_ms']:10.1f}")
+    return "\n".join(lines)
@@ -0,0 +1,93 @@
+# gui/live_updates.py
+import traceback
+from PyQt5.QtCore import QObject, QSocketNotifier, QTimer, pyqtSignal, pyqtSlot
+from database.backend import get_backend
+from models.catalogue_cache import record_changes, set_catalogue_live
+
+
+class LiveUpdates(QObject):
+    """Pushes changes committed at other desks into the open windows.
+
+    Listens on the backend's change feed (Postgres LISTEN/NOTIFY) from the Qt
+    event loop: a socket notifier fires when notifications arrive, and everything
+    waiting is read at once and handed out as one ChangeSet, which windows patch
+    their views with exactly like the ChangeSet of their own writes. Bulk writes
+    arrive as reload_requested(tables). Engines without a feed (SQLite) leave it
+    idle. If the feed drops, windows are asked to reload everything and it
+    reconnects every RECONNECT_MS.
+    """
+    changes_arrived = pyqtSignal(object)   # ChangeSet
+    reload_requested = pyqtSignal(object)  # set of table names
+
+    RECONNECT_MS = 5000
+    ALL_TABLES = {"books", "loans", "club_members", "book_clubs"}
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._feed = None
+        self._notifier = None
+        self._reconnect = QTimer(self)
+        self._reconnect.setSingleShot(True)
+        self._reconnect.timeout.connect(self.start)
+
+    def start(self):
+        if self._feed is not None:
+            return
+        try:
+            feed = get_backend().change_feed()
+        except Exception:
+            traceback.print_exc()
+            self._reconnect.start(self.RECONNECT_MS)
+            return
+        if feed is None:
+            return
+        self._feed = feed
+        self._notifier = QSocketNotifier(feed.fileno(), QSocketNotifier.Read, self)
+        self._notifier.activated.connect(self._read)
+        set_catalogue_live(True)
+
+    def is_live(self):
+        return self._feed is not None
+
+    def stop(self):
+        self._reconnect.stop()
+        if self._feed is None:
+            return
+        self._notifier.setEnabled(False)
+        self._notifier.deleteLater()
+        self._notifier = None
+        try:
+            self._feed.close()
+        except Exception:
+            pass
+        self._feed = None
+        set_catalogue_live(False)
+
+    @pyqtSlot()
+    def _read(self):
+        try:
+            changes, reloads = self._feed.read()
+        except Exception:
+            traceback.print_exc()
+            # whatever was committed while we were deaf has to be read again
+            self.stop()
+            self.reload_requested.emit(set(self.ALL_TABLES))
+            self._reconnect.start(self.RECONNECT_MS)
+            return
+        if changes:
+            record_changes(changes)
+            self.changes_arrived.emit(changes)
+        if reloads:
+            self.reload_requested.emit(reloads)
+
+
+_live_updates = None
+
+
+def live_updates():
+    # The process's one listener, started on first use; GUI thread only.
+    global _live_updates
+    if _live_updates is None:
+        _live_updates = LiveUpdates()
+        _live_updates.start()
+    return _live_updates
@@ -0,0 +1,305 @@
+# tools/load_sim.py
+# Term-start load simulation: N worker processes, each playing a circulation
+# desk or kiosk session by session -- log in, browse, search, borrow, return,
+# join a club -- through the same model calls the GUI makes. While they run the
+# parent samples Postgres for sessions stuck on locks; afterwards it checks the
+# circulation invariants (no oversubscribed copies, nobody over the loan limit)
+# and reports throughput, latency percentiles, errors and lock waits.
+#
+# Expects a database seeded with tools/seed_data.py (it logs in as its members):
+#
+#   python -m tools.seed_data --loans 1000000
+#   python -m tools.load_sim --workers 40 --duration 60 --output load.json
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+from database import backend, database
+from database.backend import get_backend
+from models.book import Book
+from models.book_club import BookClub
+from models.member import Member
+from models.search import search_books
+from models.user import User
+from tools import seed_data
+
+# operations per session, by role: (operation, weight)
+MEMBER_MIX = [("browse", 30), ("search", 25), ("borrow", 20), ("return", 15), ("club_join", 5), ("loans", 5)]
+LIBRARIAN_MIX = [("browse", 25), ("search", 25), ("recent_loans", 20), ("members_by_club", 15), ("loans", 15)]
+OPS_PER_SESSION = (3, 12)
+# seconds between the parent's samples of pg_stat_activity for lock waits
+LOCK_SAMPLE_INTERVAL_S = 0.25
+# member accounts handed to the workers
+MEMBER_SAMPLE = 5000
+
+
+def _percentile(ordered, p):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+class _Session:
+    # One desk or kiosk session; every operation is one or two model calls.
+    def __init__(self, rng, member, clubs):
+        self.rng = rng
+        self.member_id, self.username = member
+        self.clubs = clubs
+        self.seen = []  # catalogue rows on screen, to borrow from
+
+    def login(self):
+        # desk sessions sign in with a member account too; it is the same query
+        user = User.authenticate(self.username, seed_data.PASSWORD)
+        return "ok" if user is not None else "login_failed"
+
+    def browse(self):
+        after = None
+        for _ in range(self.rng.randint(1, 3)):
+            rows, after = Book.page(after)
+            self.seen = rows
+            if after is None:
+                break
+        return "ok"
+
+    def search(self):
+        word = self.rng.choice(seed_data.WORDS)
+        rows = search_books(word[:self.rng.randint(3, len(word))])
+        if rows:
+            self.seen = rows
+        return "ok"
+
+    def borrow(self):
+        available = [row for row in self.seen if row[-1] > 0] or self.seen
+        if not available:
+            self.browse()
+            available = self.seen
+        if not available:
+            return "no_book"
+        code, _ = Member.borrow(self.member_id, self.rng.choice(available)[0])
+        return code
+
+    def return_(self):
+        loans = get_backend().open_loans(self.member_id)
+        if not loans:
+            return "nothing_to_return"
+        changes, _ = Member.return_many(self.member_id, loan_ids=[self.rng.choice(loans)[0]])
+        return "ok" if changes else "not_on_loan"
+
+    def club_join(self):
+        if not self.clubs:
+            return "no_club"
+        club_id = self.rng.choice(self.clubs)
+        if BookClub.join_club(self.member_id, club_id):
+            return "ok"
+        BookClub.leave_club(self.member_id, club_id)
+        return "left"
+
+    def loans(self):
+        get_backend().member_loan_history(self.member_id)
+        return "ok"
+
+    def recent_loans(self):
+        get_backend().recent_loans(500)
+        return "ok"
+
+    def members_by_club(self):
+        if self.clubs:
+            get_backend().club_members(self.rng.choice(self.clubs))
+        return "ok"
+
+    def run(self, op):
+        return self.return_() if op == "return" else getattr(self, op)()
+
+
+def _worker(index, args, members, clubs, start_at, results):
+    # Runs sessions until the deadline, then reports its latencies and outcomes.
+    backend.BACKEND_CONFIG['engine'] = "postgres"
+    rng = random.Random(args['seed'] * 1000 + index)
+    latencies, outcomes, errors = {}, {}, {}
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = start_at + args['duration']
+    sessions = 0
+    while time.time() < deadline:
+        role = "librarian" if rng.random() < args['librarian_share'] else "member"
+        session = _Session(rng, rng.choice(members), clubs)
+        mix = LIBRARIAN_MIX if role == "librarian" else MEMBER_MIX
+        ops = ["login"] + rng.choices([op for op, _ in mix], [w for _, w in mix], k=rng.randint(*OPS_PER_SESSION))
+        sessions += 1
+        for op in ops:
+            if time.time() >= deadline:
+                break
+            start = time.perf_counter()
+            try:
+                outcome = session.run(op)
+            except Exception as e:
+                outcome = "error"
+                key = f"{op}: {type(e).__name__}"
+                errors.setdefault(key, [0, str(e).strip()[:200]])[0] += 1
+            latencies.setdefault(op, []).append((time.perf_counter() - start) * 1000.0)
+            outcomes.setdefault(op, {}).setdefault(outcome, 0)
+            outcomes[op][outcome] += 1
+            if args['think_ms']:
+                time.sleep(rng.expovariate(1000.0 / args['think_ms']))
+    pool = database.pool_stats()
+    backend.close_backend()
+    results.put({'latencies': latencies, 'outcomes': outcomes, 'errors': errors, 'sessions': sessions, 'pool': pool})
+
+
+def _sample_lock_waits(deadline):
+    # Sessions of this database waiting on a heavyweight lock, sampled until the deadline.
+    samples = []
+    with database.connection() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                while time.time() < deadline:
+                    cur.execute("""SELECT count(*) FROM pg_stat_activity
+                                   WHERE datname = current_database() AND wait_event_type = 'Lock'""")
+                    samples.append(cur.fetchone()[0])
+                    time.sleep(LOCK_SAMPLE_INTERVAL_S)
+        finally:
+            conn.autocommit = False
+    return samples
+
+
+def _deadlocks():
+    rows = database.fetch_all("SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()")
+    return rows[0][0] if rows else 0
+
+
+def check_invariants():
+    # Counts rows that concurrent circulation must never produce.
+    checks = {
+        'copies_out_of_range': "SELECT count(*) FROM books WHERE copies_available < 0 OR copies_available > copies_total",
+        'copies_not_matching_loans': """
+            SELECT count(*) FROM books b
+            LEFT JOIN (SELECT book_id, count(*) AS n FROM loans WHERE status IN ('borrowed', 'overdue')
+                       GROUP BY book_id) l
+              ON l.book_id = b.book_id
+            WHERE b.copies_total - b.copies_available <> coalesce(l.n, 0)
+        """,
+        'members_over_limit': f"""
+            SELECT count(*) FROM (SELECT member_id FROM loans WHERE status IN ('borrowed', 'overdue')
+                                  GROUP BY member_id HAVING count(*) > {Member.MAX_ACTIVE_LOANS}) over_limit
+        """,
+    }
+    return {name: database.fetch_all(sql)[0][0] for name, sql in checks.items()}
+
+
+def run(args):
+    db = get_backend()
+    members = [(m[0], m[1]) for m in db.members() if m[1] is not None]
+    if not members:
+        raise RuntimeError("no member accounts; seed the database with tools.seed_data first")
+    random.Random(args['seed']).shuffle(members)
+    members = members[:MEMBER_SAMPLE]
+    clubs = [c[0] for c in db.clubs()]
+    deadlocks_before = _deadlocks()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    start_at = time.time() + 2.0  # let every worker start before the clock runs
+    procs = [ctx.Process(target=_worker, args=(i, args, members, clubs, start_at, results))
+             for i in range(args['workers'])]
+    for p in procs:
+        p.start()
+    lock_samples = _sample_lock_waits(start_at + args['duration'])
+    reports = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    latencies, outcomes, errors, pool_waits = {}, {}, {}, []
+    for r in reports:
+        for op, values in r['latencies'].items():
+            latencies.setdefault(op, []).extend(values)
+        for op, counts in r['outcomes'].items():
+            for outcome, n in counts.items():
+                outcomes.setdefault(op, {}).setdefault(outcome, 0)
+                outcomes[op][outcome] += n
+        for key, (n, message) in r['errors'].items():
+            errors.setdefault(key, [0, message])[0] += n
+        pool_waits.append(r['pool'])
+
+    summary = {}
+    for op, values in sorted(latencies.items()):
+        ordered = sorted(values)
+        summary[op] = {
+            'count': len(ordered),
+            'per_s': len(ordered) / args['duration'],
+            'p50_ms': _percentile(ordered, 50),
+            'p95_ms': _percentile(ordered, 95),
+            'p99_ms': _percentile(ordered, 99),
+            'max_ms': ordered[-1],
+            'outcomes': outcomes.get(op, {}),
+        }
+    total = sum(len(v) for v in latencies.values())
+    return {
+        'config': args,
+        'sessions': sum(r['sessions'] for r in reports),
+        'operations': total,
+        'throughput_per_s': total / args['duration'],
+        'operations_by_type': summary,
+        'errors': {key: {'count': n, 'example': message} for key, (n, message) in errors.items()},
+        'lock_waits': {
+            'samples': len(lock_samples),
+            'max_waiting': max(lock_samples, default=0),
+            'mean_waiting': sum(lock_samples) / len(lock_samples) if lock_samples else 0.0,
+            'share_of_samples_waiting': (sum(1 for s in lock_samples if s) / len(lock_samples)) if lock_samples else 0.0,
+            'deadlocks': _deadlocks() - deadlocks_before,
+        },
+        'pool': {
+            'max_wait_ms': max((p['max_wait_ms'] for p in pool_waits), default=0.0),
+            'timeouts': sum(p['timeouts'] for p in pool_waits),
+        },
+        'invariants': check_invariants(),
+    }
+
+
+def _print(report):
+    print(f"{report['config']['workers']} workers, {report['config']['duration']}s: {report['sessions']} sessions, "
+          f"{report['operations']} operations, {report['throughput_per_s']:.1f} ops/s")
+    print(f"{'operation':18s} {'count':>8s} {'ops/s':>8s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'max':>9s}  outcomes")
+    for op, s in report['operations_by_type'].items():
+        outcomes = ", ".join(f"{k}={v}" for k, v in sorted(s['outcomes'].items()))
+        print(f"{op:18s} {s['count']:8d} {s['per_s']:8.1f} {s['p50_ms']:8.1f} {s['p95_ms']:8.1f} "
+              f"{s['p99_ms']:8.1f} {s['max_ms']:9.1f}  {outcomes}")
+    locks = report['lock_waits']
+    print(f"lock waits: max {locks['max_waiting']} sessions, mean {locks['mean_waiting']:.2f}, "
+          f"waiting in {locks['share_of_samples_waiting']:.0%} of samples, {locks['deadlocks']} deadlocks")
+    print(f"pool: max wait {report['pool']['max_wait_ms']:.1f} ms, {report['pool']['timeouts']} timeouts")
+    for key, e in report['errors'].items():
+        print(f"ERROR {key} x{e['count']}: {e['example']}")
+    for name, n in report['invariants'].items():
+        print(f"{'FAIL' if n else 'ok  '} {name}: {n}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent circulation load simulation")
+    parser.add_argument("--workers", type=int, default=40, help="desk/kiosk processes")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of load")
+    parser.add_argument("--librarian-share", type=float, default=0.2, help="fraction of sessions at a desk")
+    parser.add_argument("--think-ms", type=float, default=200.0, help="mean pause between a session's operations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the report to this JSON file")
+    args = vars(parser.parse_args(argv))
+
+    backend.BACKEND_CONFIG['engine'] = "postgres"
+    try:
+        report = run(args)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        backend.close_backend()
+    _print(report)
+    if args['output']:
+        with open(args['output'], "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    return 0 if not any(report['invariants'].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
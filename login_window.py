@@ -5,8 +5,8 @@ from PyQt5.QtWidgets import (
 )
 from PyQt5.QtGui import QFont, QPixmap
 from PyQt5.QtCore import Qt
-from database.database import get_connection
 from gui.main_window import MainWindow
+from models.user import User
 
 
 class LoginWindow(QMainWindow):
@@ -109,19 +109,13 @@ class LoginWindow(QMainWindow):
             QMessageBox.warning(self, "Error", "Enter both username and password")
             return
 
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT user_id, username, role FROM users WHERE username=%s AND password=%s AND role=%s",
-                    (username, password, role))
-        user = cur.fetchone()
-        cur.close()
-        conn.close()
+        user = User.authenticate(username, password, role)
 
         if not user:
             QMessageBox.warning(self, "Error", "Invalid credentials!")
             return
 
-        user_obj = {"user_id": user[0], "username": user[1], "role": user[2]}
+        user_obj = {"user_id": user.user_id, "username": user.username, "role": user.role}
         self.open_main_window(user_obj)
 
     # ---------------- CREATE ACCOUNT ----------------
@@ -138,26 +132,13 @@ class LoginWindow(QMainWindow):
             QMessageBox.warning(self, "Error", "Members must provide full name!")
             return
 
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT 1 FROM users WHERE username=%s", (username,))
-        if cur.fetchone():
+        user_id = User.create_account(username, password, role, fullname)
+        exists = user_id is None
+
+        if exists:
             QMessageBox.warning(self, "Error", "Username already exists!")
-            cur.close()
-            conn.close()
             return
 
-        cur.execute("INSERT INTO users (username, password, role) VALUES (%s, %s, %s) RETURNING user_id",
-                    (username, password, role))
-        user_id = cur.fetchone()[0]
-
-        if role == "member":
-            cur.execute("INSERT INTO members (user_id, full_name) VALUES (%s, %s)", (user_id, fullname))
-
-        conn.commit()
-        cur.close()
-        conn.close()
-
         QMessageBox.information(self, "Success", "Account created successfully!")
         self.open_main_window({"user_id": user_id, "username": username, "role": role})
 
@@ -1,12 +1,37 @@
 # gui/main_window.py
+from functools import partial
 from PyQt5.QtWidgets import *
-from PyQt5.QtCore import Qt
-from database.database import get_connection
+from PyQt5.QtCore import Qt, QTimer
+from database import instrument
+from database.backend import (
+    ACTIVE_HOLD_STATUSES, HOLD_COLUMNS, OPEN_LOAN_STATUSES, RECOMMENDATION_COLUMNS, get_backend,
+)
 from gui.add_book_dialog import AddBookDialog
 from gui.edit_book_dialog import EditBookDialog
+from gui.export_dialog import ExportDialog
+from gui.import_dialog import ImportDialog
+from gui.live_updates import live_updates
+from gui.table_model import RowTableView
+from gui.pager import KeysetPager
+from gui.workers import QueryExecutor
+from gui.scan_batch_dialog import ScanBatchDialog
+from gui.search_box import SearchBox
+from models.book import Book
+from models.book_club import BookClub
+from models.catalogue_cache import invalidate_catalogue
+from models.fines import SUMMARY_LIMIT, assess_overdue, fines_summary
+from models.member import Member
+from models.recommendations import similar_books
+from models.repository import Repository
+from models.stats import DASHBOARD_DAYS, DASHBOARD_TOP, dashboard
 
 
 class MainWindow(QMainWindow):
+    AVAILABLE_COLUMNS = ("book_id", "title", "isbn", "category", "copies_total", "copies_available")
+    BORROWED_COLUMNS = ("loan_id", "book_id", "title", "loan_date", "due_date")
+    RECENT_LOAN_COLUMNS = ("loan_id", "member_id", "member_name", "book_id", "title", "status")
+    RECENT_LOANS_LIMIT = 500
+
     def __init__(self, user_name, role, user_id):
         super().__init__()
         self.user_name = user_name
@@ -30,6 +55,11 @@ class MainWindow(QMainWindow):
         header.setAlignment(Qt.AlignCenter)
         header_layout.addWidget(header)
 
+        refresh_btn = QPushButton("Refresh")
+        refresh_btn.setToolTip("Reload every tab from the database")
+        refresh_btn.clicked.connect(self.refresh)
+        header_layout.addWidget(refresh_btn)
+
         logout_btn = QPushButton("Logout")
         logout_btn.setStyleSheet("background:#B30000; color:blue; padding:8px 14px; border-radius:6px;")
         logout_btn.clicked.connect(self.logout)
@@ -40,28 +70,153 @@ class MainWindow(QMainWindow):
         self.tabs = QTabWidget()
         self.layout.addWidget(self.tabs)
 
-        # Determine member_id (for member users)
-        self.member_id = None
-        if self.role == "member":
-            try:
-                conn = get_connection(); cur = conn.cursor()
-                cur.execute("SELECT member_id FROM members WHERE user_id=%s", (self.user_id,))
-                r = cur.fetchone()
-                if r:
-                    self.member_id = r[0]
-                cur.close(); conn.close()
-            except Exception:
-                self.member_id = None
+        # Background queries and loading indicator
+        self.db = get_backend()
+        self.repo = Repository()  # books, members and clubs on screen, one object each
+        self.executor = QueryExecutor(self)
+        self.loading_label = QLabel("Loading...")
+        self.loading_bar = QProgressBar(); self.loading_bar.setRange(0, 0); self.loading_bar.setMaximumWidth(160)
+        self.statusBar().addPermanentWidget(self.loading_label)
+        self.statusBar().addPermanentWidget(self.loading_bar)
+        self.executor.busy_changed.connect(self.set_loading)
+        self.set_loading(False)
+
+        # Tabs load lazily the first time they are shown
+        self._tab_loaders = {}
+        self._tab_tables = {}  # tab -> tables it shows, for reloads after bulk writes
+        self._loaded_tabs = set()
+        self._current_tab = None
+
+        # Views patched in place from the ChangeSet a write returns, ours or,
+        # through the live feed, another desk's
+        self._patch_targets = []
+        self.live = live_updates()
+        self.live.changes_arrived.connect(self.apply_changes)
+        self.live.reload_requested.connect(self.on_reload_requested)
 
         # Role-specific tabs
         if self.role == "librarian":
+            self.create_dashboard_tab()
             self.create_manage_books_tab()
             self.create_manage_members_tab()
             self.create_manage_book_clubs_tab()
+            self.create_fines_tab()
         else:
             self.create_borrow_tab()
             self.create_return_tab()
+            self.create_holds_tab()
             self.create_book_club_tab()
+        self.tabs.currentChanged.connect(self.on_tab_changed)
+
+        # Determine member_id (for member users); member tabs wait for it
+        self.member_id = None
+        self._member_ready = self.role != "member"
+        if self.role == "member":
+            self.executor.submit("member_id", self.db.member_id_for_user, self.user_id,
+                                 on_result=self.on_member_resolved, on_error=lambda e: self.on_member_resolved(None))
+
+        # first tab loads after the window has painted
+        QTimer.singleShot(0, lambda: self.on_tab_changed(self.tabs.currentIndex()))
+
+    # ----------------- Background loading -----------------
+    def set_loading(self, busy):
+        self.loading_label.setVisible(busy)
+        self.loading_bar.setVisible(busy)
+
+    def add_lazy_tab(self, tab, title, loader, tables):
+        self._tab_loaders[tab] = loader
+        self._tab_tables[tab] = set(tables)
+        self.tabs.addTab(tab, title)
+
+    def on_tab_changed(self, index):
+        tab = self.tabs.widget(index)
+        previous = self._current_tab
+        if previous is not None and previous is not tab:
+            # requests for the tab we left are stale; reload it when it comes back
+            if self.executor.cancel_group(previous):
+                self._loaded_tabs.discard(previous)
+        self._current_tab = tab
+        self.ensure_tab_loaded(tab)
+
+    def ensure_tab_loaded(self, tab):
+        if tab is None or tab in self._loaded_tabs or tab not in self._tab_loaders or not self._member_ready:
+            return
+        self._loaded_tabs.add(tab)
+        self._tab_loaders[tab]()
+
+    def invalidate_tabs(self, *tabs):
+        for tab in tabs:
+            self._loaded_tabs.discard(tab)
+        if self._current_tab in tabs:
+            self.ensure_tab_loaded(self._current_tab)
+
+    def refresh(self):
+        # full reload, for when other desks have changed things behind our back
+        invalidate_catalogue()
+        self.invalidate_tabs(*self._tab_loaders)
+
+    def on_reload_requested(self, tables):
+        # A bulk write elsewhere reloads the tabs showing its tables. When the
+        # live feed dropped, every table is asked for: changes were missed.
+        if tables >= self.live.ALL_TABLES:
+            self.refresh()
+            return
+        if "books" in tables:
+            invalidate_catalogue()
+        self.invalidate_tabs(*[tab for tab, shown in self._tab_tables.items() if shown & tables])
+
+    def watch_changes(self, view, table, key=None, accept=None, insert_new=False):
+        self._patch_targets.append((view, table, key, accept, insert_new))
+
+    def apply_changes(self, changes):
+        if not changes:
+            return
+        self.repo.apply(changes)
+        for view, table, key, accept, insert_new in self._patch_targets:
+            view.apply_changes(changes, table, key, accept, insert_new)
+        if self.role == "librarian":
+            self.patch_club_combobox(changes)
+            if changes.tables() & {"loans", "club_members"}:
+                # the totals are cheap to read again; shown now, or when the tab is next opened
+                self.invalidate_tabs(self.dashboard_tab)
+        else:
+            self.announce_ready_holds(changes)
+
+    def add_catalogue_search(self, layout, tab, view, pager, columns):
+        # While there is a query the view shows ranked search results instead of
+        # the paged catalogue; clearing the box goes back to the current page.
+        box = SearchBox("Search title, author, ISBN or category...")
+        key = (tab, "search")
+
+        def run(text):
+            if not text:
+                self.executor.cancel(key)
+                pager.setVisible(True)
+                pager.reload()
+                return
+            pager.setVisible(False)
+            self.executor.submit(key, self.repo.search_books, text, columns, on_result=view.set_rows,
+                                 on_error=lambda e: QMessageBox.critical(self, "Error", f"Search failed:\n{e}"))
+
+        box.search_requested.connect(run)
+        layout.addWidget(box)
+        return box
+
+    def on_member_resolved(self, member_id):
+        self.member_id = member_id
+        self._member_ready = True
+        self.ensure_tab_loaded(self._current_tab)
+
+    @instrument.passthrough
+    def run_query(self, tab, name, on_result, error_text, fn, *args):
+        self.executor.submit((tab, name), fn, *args, on_result=on_result,
+                             on_error=lambda e: QMessageBox.critical(self, "Error", f"{error_text}:\n{e}"))
+
+    def closeEvent(self, event):
+        self.live.changes_arrived.disconnect(self.apply_changes)
+        self.live.reload_requested.disconnect(self.on_reload_requested)
+        self.executor.shutdown(wait=False)
+        super().closeEvent(event)
 
     # ----------------- Logout -----------------
     def logout(self):
@@ -70,78 +225,116 @@ class MainWindow(QMainWindow):
         self.login.show()
         self.close()
 
+    # ----------------- Dashboard (Librarian) -----------------
+    def create_dashboard_tab(self):
+        self.dashboard_tab = QWidget()
+        l = QVBoxLayout(); l.setContentsMargins(8,8,8,8)
+
+        self.dashboard_label = QLabel()
+        self.dashboard_label.setStyleSheet("font-size:12pt; font-weight:bold;")
+        l.addWidget(self.dashboard_label)
+
+        grid = QGridLayout()
+        self.daily_table = RowTableView(["Day", "Loans", "Returns"])
+        self.top_books_table = RowTableView(["Book ID", "Title", "Loans"])
+        self.top_categories_table = RowTableView(["Category", "Loans"])
+        self.largest_clubs_table = RowTableView(["Club ID", "Name", "Members"])
+        for i, (title, view) in enumerate([(f"Loans per day (last {DASHBOARD_DAYS} days):", self.daily_table),
+                                           (f"Top {DASHBOARD_TOP} books:", self.top_books_table),
+                                           (f"Busiest {DASHBOARD_TOP} categories:", self.top_categories_table),
+                                           (f"Largest {DASHBOARD_TOP} clubs:", self.largest_clubs_table)]):
+            box = QVBoxLayout()
+            box.addWidget(QLabel(title))
+            box.addWidget(view)
+            grid.addLayout(box, i // 2, i % 2)
+        l.addLayout(grid)
+
+        self.dashboard_tab.setLayout(l)
+        self.add_lazy_tab(self.dashboard_tab, "Dashboard", self.load_dashboard,
+                          {"books", "loans", "book_clubs", "club_members"})
+
+    def load_dashboard(self):
+        self.run_query(self.dashboard_tab, "dashboard", self.show_dashboard, "Failed to load statistics", dashboard)
+
+    def show_dashboard(self, stats):
+        self.dashboard_label.setText(f"{stats.active_loans} active loan(s), {stats.overdue_loans} overdue; "
+                                     f"{stats.loans_in_period()} loan(s) in the last {DASHBOARD_DAYS} days")
+        self.daily_table.set_rows(list(reversed(stats.daily)))
+        self.top_books_table.set_rows(stats.top_books)
+        self.top_categories_table.set_rows([(category or "(none)", loans) for category, loans in stats.top_categories])
+        self.largest_clubs_table.set_rows(stats.largest_clubs)
+
     # ----------------- Manage Books (Librarian) -----------------
     def create_manage_books_tab(self):
         self.books_tab = QWidget()
         l = QVBoxLayout(); l.setContentsMargins(8, 8, 8, 8)
-        self.books_table = QTableWidget()
-        self.books_table.setColumnCount(7)
-        self.books_table.setHorizontalHeaderLabels(["ID", "Title", "ISBN", "Author ID", "Category", "Total", "Available"])
+        self.books_table = RowTableView(["ID", "Title", "ISBN", "Author ID", "Category", "Total", "Available"],
+                                        columns=Book.CATALOGUE_COLUMNS, record=partial(self.repo.record, Book))
         self.books_table.setAlternatingRowColors(True)
+        # new books go at the end of the page until the next refresh puts them in title order
+        self.watch_changes(self.books_table, "books", insert_new=True)
+        self.books_pager = KeysetPager(self.books_table, lambda after: self.repo.books_page(after), self.executor,
+                                       (self.books_tab, "books"), "Failed to load books")
+        self.books_search = self.add_catalogue_search(l, self.books_tab, self.books_table, self.books_pager,
+                                                      Book.CATALOGUE_COLUMNS)
         l.addWidget(self.books_table)
+        l.addWidget(self.books_pager)
 
         btn_h = QHBoxLayout()
         add_btn = QPushButton("Add Book"); add_btn.clicked.connect(self.add_book)
         edit_btn = QPushButton("Edit Selected"); edit_btn.clicked.connect(self.edit_book)
         del_btn = QPushButton("Delete Selected"); del_btn.clicked.connect(self.delete_book)
+        import_btn = QPushButton("Import..."); import_btn.clicked.connect(self.import_books)
+        export_btn = QPushButton("Export Inventory..."); export_btn.clicked.connect(lambda: self.export_report("inventory"))
         btn_h.addWidget(add_btn); btn_h.addWidget(edit_btn); btn_h.addWidget(del_btn)
+        btn_h.addWidget(import_btn); btn_h.addWidget(export_btn)
         l.addLayout(btn_h)
 
         self.books_tab.setLayout(l)
-        self.tabs.addTab(self.books_tab, "Manage Books")
-        self.load_books()
+        self.add_lazy_tab(self.books_tab, "Manage Books", self.load_books, {"books"})
 
     def load_books(self):
-        try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("SELECT book_id, title, isbn, author_id, category, copies_total, copies_available FROM books ORDER BY title")
-            rows = cur.fetchall()
-            self.books_table.setRowCount(len(rows))
-            for r, row in enumerate(rows):
-                for c, val in enumerate(row):
-                    self.books_table.setItem(r, c, QTableWidgetItem(str(val if val is not None else "")))
-            self.books_table.resizeColumnsToContents()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load books:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
+        self.books_search.search_now()
 
     def add_book(self):
         dlg = AddBookDialog(self)
         if dlg.exec_():
+            self.apply_changes(dlg.changes)
+
+    def import_books(self):
+        dlg = ImportDialog(self)
+        dlg.exec_()
+        # a bulk import can touch any page, so this is a full reload
+        if dlg.result is not None and (dlg.result.inserted or dlg.result.updated):
             self.load_books()
 
+    def export_report(self, report):
+        ExportDialog(report, self).exec_()
+
     def edit_book(self):
-        sel = self.books_table.currentRow()
-        if sel < 0:
+        rec = self.books_table.current_record()
+        if rec is None:
             QMessageBox.warning(self, "Error", "Select a book to edit")
             return
-        book_id = int(self.books_table.item(sel, 0).text())
-        dlg = EditBookDialog(book_id, self)
+        dlg = EditBookDialog(rec.book_id, self)
         if dlg.exec_():
-            self.load_books()
+            self.apply_changes(dlg.changes)
 
     def delete_book(self):
-        sel = self.books_table.currentRow()
-        if sel < 0:
+        rec = self.books_table.current_record()
+        if rec is None:
             QMessageBox.warning(self, "Error", "Select a book to delete")
             return
-        book_id = int(self.books_table.item(sel, 0).text())
+        book_id = rec.book_id
         confirm = QMessageBox.question(self, "Confirm Delete", f"Delete book ID {book_id}?")
         if confirm != QMessageBox.Yes:
             return
         try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("DELETE FROM books WHERE book_id=%s", (book_id,))
-            conn.commit()
+            changes = Book.delete(book_id)
             QMessageBox.information(self, "Success", "Book deleted.")
-            self.load_books()
+            self.apply_changes(changes)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to delete book:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
 
     # ----------------- Manage Members (Librarian) -----------------
     def create_manage_members_tab(self):
@@ -149,17 +342,16 @@ class MainWindow(QMainWindow):
         l = QVBoxLayout(); l.setContentsMargins(8,8,8,8)
 
         # All members table
-        self.members_table = QTableWidget()
-        self.members_table.setColumnCount(4)
-        self.members_table.setHorizontalHeaderLabels(["Member ID", "Username", "Full Name", "Join Date"])
+        self.members_table = RowTableView(["Member ID", "Username", "Full Name", "Join Date"],
+                                          columns=Member.DIRECTORY_COLUMNS, record=partial(self.repo.record, Member))
         l.addWidget(QLabel("All Members:"))
         l.addWidget(self.members_table)
 
         # Member loans overview
-        self.member_loans_table = QTableWidget()
-        self.member_loans_table.setColumnCount(6)
-        self.member_loans_table.setHorizontalHeaderLabels(["Loan ID", "Member ID", "Member Name", "Book ID", "Title", "Status"])
-        l.addWidget(QLabel("Member Loans:"))
+        self.member_loans_table = RowTableView(["Loan ID", "Member ID", "Member Name", "Book ID", "Title", "Status"],
+                                               columns=self.RECENT_LOAN_COLUMNS)
+        self.watch_changes(self.member_loans_table, "loans")  # returns update the status in place
+        l.addWidget(QLabel(f"Member Loans (latest {self.RECENT_LOANS_LIMIT}):"))
         l.addWidget(self.member_loans_table)
 
         # Club selection for viewing members
@@ -170,9 +362,10 @@ class MainWindow(QMainWindow):
         club_h.addWidget(self.club_combobox)
         l.addLayout(club_h)
 
-        self.club_members_table = QTableWidget()
-        self.club_members_table.setColumnCount(3)
-        self.club_members_table.setHorizontalHeaderLabels(["Member ID", "Full Name", "Username"])
+        self.club_members_table = RowTableView(["Member ID", "Full Name", "Username"], columns=Member.CLUB_COLUMNS,
+                                               record=partial(self.repo.record, Member))
+        self.watch_changes(self.club_members_table, "club_members", insert_new=True,
+                           accept=lambda row: True if row["club_id"] == self.club_combobox.currentData() else None)
         l.addWidget(QLabel("Members in selected club:"))
         l.addWidget(self.club_members_table)
 
@@ -180,167 +373,105 @@ class MainWindow(QMainWindow):
         btn_h = QHBoxLayout()
         view_loans_btn = QPushButton("View Selected Member Loans"); view_loans_btn.clicked.connect(self.view_selected_member_loans)
         view_clubs_btn = QPushButton("View Selected Member Clubs"); view_clubs_btn.clicked.connect(self.view_selected_member_clubs)
-        btn_h.addWidget(view_loans_btn); btn_h.addWidget(view_clubs_btn)
+        export_btn = QPushButton("Export Loan History..."); export_btn.clicked.connect(lambda: self.export_report("loan_history"))
+        btn_h.addWidget(view_loans_btn); btn_h.addWidget(view_clubs_btn); btn_h.addWidget(export_btn)
         l.addLayout(btn_h)
 
         self.members_tab.setLayout(l)
-        self.tabs.addTab(self.members_tab, "Manage Members")
+        self.add_lazy_tab(self.members_tab, "Manage Members", self.load_members_tab,
+                          {"members", "books", "loans", "book_clubs", "club_members"})
 
-        # load data
+    def load_members_tab(self):
         self.load_members()
         self.load_member_loans()
         self.load_book_club_combobox()
 
     def load_members(self):
-        try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("""
-                SELECT m.member_id, u.username, m.full_name, m.join_date
-                FROM members m
-                LEFT JOIN users u ON m.user_id = u.user_id
-                ORDER BY m.member_id
-            """)
-            rows = cur.fetchall()
-            self.members_table.setRowCount(len(rows))
-            for r, row in enumerate(rows):
-                for c, val in enumerate(row):
-                    self.members_table.setItem(r, c, QTableWidgetItem(str(val if val is not None else "")))
-            self.members_table.resizeColumnsToContents()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load members:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
+        self.run_query(self.members_tab, "members", self.members_table.set_rows, "Failed to load members",
+                       self.repo.members)
 
     def load_member_loans(self):
-        try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("""
-                SELECT l.loan_id, l.member_id, COALESCE(m.full_name, u.username) AS member_name,
-                       b.book_id, b.title, l.status
-                FROM loans l
-                JOIN books b ON l.book_id = b.book_id
-                LEFT JOIN members m ON l.member_id = m.member_id
-                LEFT JOIN users u ON m.user_id = u.user_id
-                ORDER BY l.loan_date DESC
-            """)
-            rows = cur.fetchall()
-            self.member_loans_table.setRowCount(len(rows))
-            for r, row in enumerate(rows):
-                for c, val in enumerate(row):
-                    self.member_loans_table.setItem(r, c, QTableWidgetItem(str(val if val is not None else "")))
-            self.member_loans_table.resizeColumnsToContents()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load member loans:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
+        self.run_query(self.members_tab, "member_loans", self.member_loans_table.set_rows, "Failed to load member loans",
+                       self.db.recent_loans, self.RECENT_LOANS_LIMIT)
 
     def load_book_club_combobox(self):
-        try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("SELECT club_id, name FROM book_clubs ORDER BY name")
-            rows = cur.fetchall()
-            self.club_combobox.clear()
-            self.club_combobox.addItem("Select a club", -1)
-            for cid, name in rows:
-                self.club_combobox.addItem(name, cid)
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load clubs:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
+        self.run_query(self.members_tab, "club_combobox", self.fill_book_club_combobox, "Failed to load clubs",
+                       self.repo.clubs)
+
+    def fill_book_club_combobox(self, clubs):
+        self.club_combobox.blockSignals(True)
+        self.club_combobox.clear()
+        self.club_combobox.addItem("Select a club", -1)
+        for club in clubs:
+            self.club_combobox.addItem(club.name, club.club_id)
+        self.club_combobox.blockSignals(False)
+        self.load_members_by_club()
+
+    def patch_club_combobox(self, changes):
+        for row in changes.upserted("book_clubs"):
+            i = self.club_combobox.findData(row["club_id"])
+            if i < 0:
+                self.club_combobox.addItem(row["name"], row["club_id"])
+            else:
+                self.club_combobox.setItemText(i, row["name"])
+        for row in changes.deleted("book_clubs"):
+            i = self.club_combobox.findData(row["club_id"])
+            if i >= 0:
+                self.club_combobox.removeItem(i)
 
     def load_members_by_club(self):
         club_id = self.club_combobox.currentData()
         if club_id is None or club_id == -1:
-            self.club_members_table.setRowCount(0)
+            self.executor.cancel((self.members_tab, "club_members"))
+            self.club_members_table.set_rows([])
             return
-        try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("""
-                SELECT m.member_id, m.full_name, u.username
-                FROM club_members cm
-                JOIN members m ON cm.member_id = m.member_id
-                LEFT JOIN users u ON m.user_id = u.user_id
-                WHERE cm.club_id = %s
-                ORDER BY m.full_name
-            """, (club_id,))
-            rows = cur.fetchall()
-            self.club_members_table.setRowCount(len(rows))
-            for r, row in enumerate(rows):
-                for c, val in enumerate(row):
-                    self.club_members_table.setItem(r, c, QTableWidgetItem(str(val if val is not None else "")))
-            self.club_members_table.resizeColumnsToContents()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load club members:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
+        self.run_query(self.members_tab, "club_members", self.club_members_table.set_rows, "Failed to load club members",
+                       self.repo.club_members, club_id)
 
     def view_selected_member_loans(self):
-        sel = self.members_table.currentRow()
-        if sel < 0:
+        rec = self.members_table.current_record()
+        if rec is None:
             QMessageBox.warning(self, "Error", "Select a member first.")
             return
-        member_id = int(self.members_table.item(sel, 0).text())
-        try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("""
-                SELECT l.loan_id, b.title, l.loan_date, l.due_date, l.return_date, l.status
-                FROM loans l
-                JOIN books b ON l.book_id = b.book_id
-                WHERE l.member_id = %s
-                ORDER BY l.loan_date DESC
-            """, (member_id,))
-            rows = cur.fetchall()
-            cur.close(); conn.close()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load loans:\n{e}")
-            return
+        self.run_query(self.members_tab, "member_history", partial(self.show_member_loans_dialog, rec.member_id),
+                       "Failed to load loans", self.db.member_loan_history, rec.member_id)
 
-        # show dialog
+    def show_member_loans_dialog(self, member_id, rows):
         dlg = QDialog(self); dlg.setWindowTitle("Member Loans"); dlg.setFixedSize(700, 400)
         v = QVBoxLayout(dlg)
-        tbl = QTableWidget(); tbl.setColumnCount(6)
-        tbl.setHorizontalHeaderLabels(["Loan ID", "Title", "Loan Date", "Due Date", "Return Date", "Status"])
-        tbl.setRowCount(len(rows))
-        for r, row in enumerate(rows):
-            for c, val in enumerate(row):
-                tbl.setItem(r, c, QTableWidgetItem(str(val if val is not None else "")))
-        tbl.resizeColumnsToContents()
+        tbl = RowTableView(["Loan ID", "Title", "Loan Date", "Due Date", "Return Date", "Status"])
+        tbl.set_rows(rows)
         v.addWidget(tbl)
+        # loans returned long ago are in the archive (tools/archive_loans.py); read only when asked for
+        archive_btn = QPushButton("Show Archived Loans")
+
+        def show_archived(archived):
+            tbl.set_rows(list(rows) + list(archived))
+            archive_btn.setText(f"{len(archived)} archived loan(s) shown")
+
+        def load_archived():
+            archive_btn.setEnabled(False)
+            self.run_query(self.members_tab, "member_archive", show_archived, "Failed to load archived loans",
+                           self.db.archived_loans, member_id)
+
+        archive_btn.clicked.connect(load_archived)
+        v.addWidget(archive_btn)
         dlg.exec_()
 
     def view_selected_member_clubs(self):
-        sel = self.members_table.currentRow()
-        if sel < 0:
+        rec = self.members_table.current_record()
+        if rec is None:
             QMessageBox.warning(self, "Error", "Select a member first.")
             return
-        member_id = int(self.members_table.item(sel, 0).text())
-        try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("""
-                SELECT bc.club_id, bc.name
-                FROM club_members cm
-                JOIN book_clubs bc ON cm.club_id = bc.club_id
-                WHERE cm.member_id = %s
-                ORDER BY bc.name
-            """, (member_id,))
-            rows = cur.fetchall()
-            cur.close(); conn.close()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load member clubs:\n{e}")
-            return
+        self.run_query(self.members_tab, "member_clubs", self.show_member_clubs_dialog, "Failed to load member clubs",
+                       self.repo.member_clubs, rec.member_id)
 
+    def show_member_clubs_dialog(self, clubs):
         dlg = QDialog(self); dlg.setWindowTitle("Member's Book Clubs"); dlg.setFixedSize(400, 300)
         v = QVBoxLayout(dlg)
-        tbl = QTableWidget(); tbl.setColumnCount(2); tbl.setHorizontalHeaderLabels(["Club ID", "Name"])
-        tbl.setRowCount(len(rows))
-        for r, row in enumerate(rows):
-            for c, val in enumerate(row):
-                tbl.setItem(r, c, QTableWidgetItem(str(val if val is not None else "")))
-        tbl.resizeColumnsToContents()
+        tbl = RowTableView(["Club ID", "Name"], columns=BookClub.MEMBERSHIP_COLUMNS,
+                           record=partial(self.repo.record, BookClub))
+        tbl.set_rows(clubs)
         v.addWidget(tbl)
         dlg.exec_()
 
@@ -349,9 +480,9 @@ class MainWindow(QMainWindow):
         self.clubs_tab = QWidget()
         l = QVBoxLayout(); l.setContentsMargins(8,8,8,8)
 
-        self.clubs_table = QTableWidget()
-        self.clubs_table.setColumnCount(3)
-        self.clubs_table.setHorizontalHeaderLabels(["Club ID", "Name", "Description"])
+        self.clubs_table = RowTableView(["Club ID", "Name", "Description"], columns=BookClub.COLUMNS,
+                                        record=partial(self.repo.record, BookClub))
+        self.watch_changes(self.clubs_table, "book_clubs", insert_new=True)
         l.addWidget(QLabel("Book Clubs:"))
         l.addWidget(self.clubs_table)
 
@@ -364,24 +495,11 @@ class MainWindow(QMainWindow):
         l.addLayout(btn_h)
 
         self.clubs_tab.setLayout(l)
-        self.tabs.addTab(self.clubs_tab, "Manage Book Clubs")
-        self.load_book_clubs_table()
+        self.add_lazy_tab(self.clubs_tab, "Manage Book Clubs", self.load_book_clubs_table, {"book_clubs"})
 
     def load_book_clubs_table(self):
-        try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("SELECT club_id, name, description FROM book_clubs ORDER BY name")
-            rows = cur.fetchall()
-            self.clubs_table.setRowCount(len(rows))
-            for r, row in enumerate(rows):
-                for c, val in enumerate(row):
-                    self.clubs_table.setItem(r, c, QTableWidgetItem(str(val if val is not None else "")))
-            self.clubs_table.resizeColumnsToContents()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load book clubs:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
+        self.run_query(self.clubs_tab, "clubs", self.clubs_table.set_rows, "Failed to load book clubs",
+                       self.repo.clubs)
 
     def add_club(self):
         name, ok = QInputDialog.getText(self, "Create Club", "Club name:")
@@ -391,39 +509,27 @@ class MainWindow(QMainWindow):
         if not ok2:
             desc = ""
         try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("INSERT INTO book_clubs (name, description) VALUES (%s, %s)", (name.strip(), desc.strip()))
-            conn.commit()
+            changes = BookClub.create(name.strip(), desc.strip())
             QMessageBox.information(self, "Success", "Book club created.")
-            self.load_book_clubs_table()
-            self.load_book_club_combobox()
+            self.apply_changes(changes)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to create club:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
 
     def delete_club(self):
-        sel = self.clubs_table.currentRow()
-        if sel < 0:
+        rec = self.clubs_table.current_record()
+        if rec is None:
             QMessageBox.warning(self, "Error", "Select a club to delete")
             return
-        club_id = int(self.clubs_table.item(sel, 0).text())
+        club_id = rec.club_id
         confirm = QMessageBox.question(self, "Confirm", f"Delete club {club_id}?")
         if confirm != QMessageBox.Yes:
             return
         try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("DELETE FROM book_clubs WHERE club_id=%s", (club_id,))
-            conn.commit()
+            changes = BookClub.delete(club_id)
             QMessageBox.information(self, "Success", "Club deleted.")
-            self.load_book_clubs_table()
-            self.load_book_club_combobox()
+            self.apply_changes(changes)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to delete club:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
 
     def assign_member_to_club(self):
         # ask for member id and club id (or use selected)
@@ -434,20 +540,14 @@ class MainWindow(QMainWindow):
             club_id, ok2 = QInputDialog.getInt(self, "Assign Member", "Club ID:")
             if not ok2:
                 return
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("SELECT 1 FROM club_members WHERE club_id=%s AND member_id=%s", (club_id, member_id))
-            if cur.fetchone():
+            changes = BookClub.join_club(member_id, club_id)
+            if not changes:
                 QMessageBox.information(self, "Info", "Member already in club.")
             else:
-                cur.execute("INSERT INTO club_members (club_id, member_id) VALUES (%s, %s)", (club_id, member_id))
-                conn.commit()
                 QMessageBox.information(self, "Success", "Member assigned to club.")
-            self.load_members_by_club()
+                self.apply_changes(changes)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to assign member:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
 
     def remove_member_from_club(self):
         try:
@@ -457,150 +557,266 @@ class MainWindow(QMainWindow):
             club_id, ok2 = QInputDialog.getInt(self, "Remove Member", "Club ID:")
             if not ok2:
                 return
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("DELETE FROM club_members WHERE club_id=%s AND member_id=%s", (club_id, member_id))
-            conn.commit()
+            changes = BookClub.leave_club(member_id, club_id)
             QMessageBox.information(self, "Success", "Member removed from club.")
-            self.load_members_by_club()
+            self.apply_changes(changes)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to remove member:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
+
+    # ----------------- Fines (Librarian) -----------------
+    def create_fines_tab(self):
+        self.fines_tab = QWidget()
+        l = QVBoxLayout(); l.setContentsMargins(8,8,8,8)
+
+        self.fine_totals_label = QLabel()
+        l.addWidget(self.fine_totals_label)
+        self.fines_table = RowTableView(["Member ID", "Member Name", "Overdue Loans", "Late Loans", "Days Late", "Amount"])
+        l.addWidget(QLabel(f"Fines by member (top {SUMMARY_LIMIT}):"))
+        l.addWidget(self.fines_table)
+
+        btn_h = QHBoxLayout()
+        assess_btn = QPushButton("Assess Overdue Loans Now"); assess_btn.clicked.connect(self.assess_overdue)
+        btn_h.addWidget(assess_btn)
+        l.addLayout(btn_h)
+
+        self.fines_tab.setLayout(l)
+        self.add_lazy_tab(self.fines_tab, "Fines", self.load_fines, {"members", "loans", "fines"})
+
+    def load_fines(self):
+        self.run_query(self.fines_tab, "fines", self.show_fines, "Failed to load fines", fines_summary)
+
+    def show_fines(self, summary):
+        (members, overdue, late, amount), rows = summary
+        self.fine_totals_label.setText(f"{overdue} loan(s) overdue; {late} late loan(s) fined {amount:.2f} "
+                                       f"in total across {members} member(s)")
+        self.fines_table.set_rows([row[:5] + (f"{row[5]:.2f}",) for row in rows])
+
+    def assess_overdue(self):
+        # normally the nightly tools/overdue_job.py does this
+        self.run_query(self.fines_tab, "assess", self.on_overdue_assessed, "Failed to assess overdue loans",
+                       assess_overdue)
+
+    def on_overdue_assessed(self, result):
+        self.statusBar().showMessage(f"{result.marked} loan(s) newly overdue, {result.fined} fine(s) updated", 5000)
+        # loan statuses changed everywhere
+        self.refresh()
 
     # ----------------- Member Tabs -----------------
     def create_borrow_tab(self):
         self.borrow_tab = QWidget()
         l = QVBoxLayout(); l.setContentsMargins(8,8,8,8)
-        self.available_books_table = QTableWidget()
-        self.available_books_table.setColumnCount(6)
-        self.available_books_table.setHorizontalHeaderLabels(["ID", "Title", "ISBN", "Category", "Total", "Available"])
+        self.available_books_table = RowTableView(["ID", "Title", "ISBN", "Category", "Total", "Available"],
+                                                  columns=self.AVAILABLE_COLUMNS, record=partial(self.repo.record, Book))
+        self.watch_changes(self.available_books_table, "books")
+        self.available_pager = KeysetPager(self.available_books_table,
+                                           lambda after: self.repo.books_page(after, columns=self.AVAILABLE_COLUMNS),
+                                           self.executor, (self.borrow_tab, "available_books"),
+                                           "Failed to load available books")
+        self.available_search = self.add_catalogue_search(l, self.borrow_tab, self.available_books_table,
+                                                          self.available_pager, self.AVAILABLE_COLUMNS)
+        self.available_books_table.selectionModel().currentRowChanged.connect(self.load_recommendations)
         l.addWidget(QLabel("Available Books:"))
         l.addWidget(self.available_books_table)
+        l.addWidget(self.available_pager)
+        self.recommendations_label = QLabel("Members who borrowed this also borrowed:")
+        l.addWidget(self.recommendations_label)
+        self.recommendations_table = RowTableView(["ID", "Title", "Category", "Available", "Score"],
+                                                  formatters={4: lambda score: f"{score:.2f}"},
+                                                  columns=RECOMMENDATION_COLUMNS)
+        self.recommendations_table.setMaximumHeight(180)
+        self.watch_changes(self.recommendations_table, "books")
+        l.addWidget(self.recommendations_table)
+        btn_h = QHBoxLayout()
         borrow_btn = QPushButton("Borrow Selected Book"); borrow_btn.clicked.connect(self.borrow_book)
-        l.addWidget(borrow_btn)
+        hold_btn = QPushButton("Place Hold"); hold_btn.clicked.connect(self.place_hold)
+        scan_btn = QPushButton("Scan Mode..."); scan_btn.clicked.connect(lambda: self.open_scan_batch("borrow"))
+        btn_h.addWidget(borrow_btn); btn_h.addWidget(hold_btn); btn_h.addWidget(scan_btn)
+        l.addLayout(btn_h)
         self.borrow_tab.setLayout(l)
-        self.tabs.addTab(self.borrow_tab, "Borrow Books")
-        self.load_available_books()
+        self.add_lazy_tab(self.borrow_tab, "Borrow Books", self.load_available_books, {"books"})
 
     def load_available_books(self):
-        try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("SELECT book_id, title, isbn, category, copies_total, copies_available FROM books ORDER BY title")
-            rows = cur.fetchall()
-            self.available_books_table.setRowCount(len(rows))
-            for r, row in enumerate(rows):
-                for c, val in enumerate(row):
-                    self.available_books_table.setItem(r, c, QTableWidgetItem(str(val if val is not None else "")))
-            self.available_books_table.resizeColumnsToContents()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load available books:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
+        self.available_search.search_now()
+
+    def load_recommendations(self, *_):
+        # precomputed by tools/refresh_recommendations.py; one index lookup per selection
+        rec = self.available_books_table.current_record()
+        if rec is None:
+            self.recommendations_table.set_rows([])
+            return
+        self.recommendations_label.setText(f"Members who borrowed \"{rec.title}\" also borrowed:")
+        self.run_query(self.borrow_tab, "recommendations", self.recommendations_table.set_rows,
+                       "Failed to load recommendations", similar_books, rec.book_id)
 
     def borrow_book(self):
         if self.member_id is None:
             QMessageBox.warning(self, "Error", "Member record not found!")
             return
-        sel = self.available_books_table.currentRow()
-        if sel < 0:
+        rec = self.available_books_table.current_record()
+        if rec is None:
             QMessageBox.warning(self, "Error", "Select a book to borrow")
             return
-        book_id = int(self.available_books_table.item(sel, 0).text())
         try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("SELECT copies_available FROM books WHERE book_id=%s", (book_id,))
-            a = cur.fetchone()
-            if not a or a[0] <= 0:
-                QMessageBox.warning(self, "Error", "No copies available")
-                cur.close(); conn.close(); return
-            cur.execute("SELECT COUNT(*) FROM loans WHERE member_id=%s AND status='borrowed'", (self.member_id,))
-            active = cur.fetchone()[0]
-            if active >= 3:
-                QMessageBox.warning(self, "Error", "You cannot borrow more than 3 books at a time")
-                cur.close(); conn.close(); return
-            # due_date required in schema: set 14 days
-            cur.execute("INSERT INTO loans (book_id, member_id, due_date, status) VALUES (%s, %s, CURRENT_DATE + INTERVAL '14 days', 'borrowed')",
-                        (book_id, self.member_id))
-            cur.execute("UPDATE books SET copies_available = copies_available - 1 WHERE book_id=%s", (book_id,))
-            conn.commit()
-            QMessageBox.information(self, "Success", "Book borrowed successfully!")
-            self.load_available_books()
-            self.load_borrowed_books()
-            self.load_member_loans()
+            code, changes = Member.borrow(self.member_id, rec.book_id)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to borrow book:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
+            return
+        # on BORROW_NO_COPIES this still carries the book's current count, in case
+        # someone else took the last copy since the page was loaded
+        self.apply_changes(changes)
+        if code == Member.BORROW_NO_COPIES:
+            answer = QMessageBox.question(self, "No Copies Available",
+                                          "No copies available. Place a hold and get the next copy returned?")
+            if answer == QMessageBox.Yes:
+                self.place_hold()
+            return
+        if code != Member.BORROW_OK:
+            QMessageBox.warning(self, "Error", Member.BORROW_MESSAGES[code])
+            return
+        QMessageBox.information(self, "Success", Member.BORROW_MESSAGES[code])
+
+    def place_hold(self):
+        if self.member_id is None:
+            QMessageBox.warning(self, "Error", "Member record not found!")
+            return
+        rec = self.available_books_table.current_record()
+        if rec is None:
+            QMessageBox.warning(self, "Error", "Select a book to hold")
+            return
+        try:
+            code, changes = Member.place_hold(self.member_id, rec.book_id)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to place hold:\n{e}")
+            return
+        self.apply_changes(changes)
+        if code != Member.HOLD_OK:
+            QMessageBox.warning(self, "Error", Member.HOLD_MESSAGES[code])
+            return
+        position = changes.upserted("holds")[0]["position"]
+        QMessageBox.information(self, "Success", f"{Member.HOLD_MESSAGES[code]}\nPlace in queue: {position}")
 
     def create_return_tab(self):
         self.return_tab = QWidget()
         l = QVBoxLayout(); l.setContentsMargins(8,8,8,8)
-        self.borrowed_table = QTableWidget()
-        self.borrowed_table.setColumnCount(5)
-        self.borrowed_table.setHorizontalHeaderLabels(["Loan ID", "Book ID", "Title", "Loan Date", "Due Date"])
+        self.borrowed_table = RowTableView(["Loan ID", "Book ID", "Title", "Loan Date", "Due Date"],
+                                           columns=self.BORROWED_COLUMNS)
+        self.watch_changes(self.borrowed_table, "loans", insert_new=True, accept=self.is_own_open_loan)
+        self.borrowed_table.setSelectionMode(QAbstractItemView.ExtendedSelection)
         l.addWidget(QLabel("My Borrowed Books:"))
         l.addWidget(self.borrowed_table)
-        return_btn = QPushButton("Return Selected Book"); return_btn.clicked.connect(self.return_book)
-        l.addWidget(return_btn)
+        btn_h = QHBoxLayout()
+        return_btn = QPushButton("Return Selected Books"); return_btn.clicked.connect(self.return_book)
+        scan_btn = QPushButton("Scan Mode..."); scan_btn.clicked.connect(lambda: self.open_scan_batch("return"))
+        btn_h.addWidget(return_btn); btn_h.addWidget(scan_btn)
+        l.addLayout(btn_h)
         self.return_tab.setLayout(l)
-        self.tabs.addTab(self.return_tab, "Return Books")
-        self.load_borrowed_books()
+        self.add_lazy_tab(self.return_tab, "Return Books", self.load_borrowed_books, {"books", "loans"})
 
     def load_borrowed_books(self):
         if self.member_id is None:
             return
-        try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("""
-                SELECT l.loan_id, b.book_id, b.title, l.loan_date, l.due_date
-                FROM loans l
-                JOIN books b ON l.book_id = b.book_id
-                WHERE l.member_id=%s AND l.status='borrowed'
-            """, (self.member_id,))
-            rows = cur.fetchall()
-            self.borrowed_table.setRowCount(len(rows))
-            for r, row in enumerate(rows):
-                for c, val in enumerate(row):
-                    self.borrowed_table.setItem(r, c, QTableWidgetItem(str(val if val is not None else "")))
-            self.borrowed_table.resizeColumnsToContents()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load borrowed books:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
+        self.run_query(self.return_tab, "borrowed", self.borrowed_table.set_rows, "Failed to load borrowed books",
+                       self.db.open_loans, self.member_id)
+
+    def is_own_open_loan(self, row):
+        if row["member_id"] != self.member_id:
+            return None
+        return row["status"] in OPEN_LOAN_STATUSES
 
     def return_book(self):
-        sel = self.borrowed_table.currentRow()
-        if sel < 0:
+        if self.member_id is None:
+            QMessageBox.warning(self, "Error", "Member record not found!")
+            return
+        recs = self.borrowed_table.selected_records()
+        if not recs:
             QMessageBox.warning(self, "Error", "Select a book to return")
             return
-        loan_id = int(self.borrowed_table.item(sel, 0).text())
-        book_id = int(self.borrowed_table.item(sel, 1).text())
         try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("UPDATE loans SET status='returned', return_date=CURRENT_DATE WHERE loan_id=%s", (loan_id,))
-            cur.execute("UPDATE books SET copies_available = copies_available + 1 WHERE book_id=%s", (book_id,))
-            conn.commit()
-            QMessageBox.information(self, "Success", "Book returned successfully!")
-            self.load_available_books()
-            self.load_borrowed_books()
-            self.load_member_loans()
+            changes, rejects = Member.return_many(self.member_id, loan_ids=[rec[0] for rec in recs])
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to return book:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
+            return
+        self.apply_changes(changes)
+        returned = changes.upserted("loans")
+        if rejects:
+            QMessageBox.warning(self, "Error", f"{len(rejects)} loan(s) were already returned.")
+        elif len(returned) == 1:
+            QMessageBox.information(self, "Success", "Book returned successfully!")
+        else:
+            QMessageBox.information(self, "Success", f"{len(returned)} books returned successfully!")
+
+    def open_scan_batch(self, mode):
+        if self.member_id is None:
+            QMessageBox.warning(self, "Error", "Member record not found!")
+            return
+        dlg = ScanBatchDialog(self.member_id, mode, self)
+        dlg.exec_()
+        # one patch per batch, however many items it held
+        self.apply_changes(dlg.changes)
+
+    def create_holds_tab(self):
+        self.holds_tab = QWidget()
+        l = QVBoxLayout(); l.setContentsMargins(8,8,8,8)
+        self.holds_table = RowTableView(["Hold ID", "Book ID", "Title", "Status", "Place in Queue", "Ready Until"],
+                                        columns=HOLD_COLUMNS)
+        self.watch_changes(self.holds_table, "holds", insert_new=True, accept=self.is_own_active_hold)
+        l.addWidget(QLabel("My Holds:"))
+        l.addWidget(self.holds_table)
+        btn_h = QHBoxLayout()
+        cancel_btn = QPushButton("Cancel Selected Hold"); cancel_btn.clicked.connect(self.cancel_hold)
+        btn_h.addWidget(cancel_btn)
+        l.addLayout(btn_h)
+        self.holds_tab.setLayout(l)
+        self.add_lazy_tab(self.holds_tab, "My Holds", self.load_holds, {"books", "holds"})
+
+    def load_holds(self):
+        if self.member_id is None:
+            return
+        self.run_query(self.holds_tab, "holds", self.holds_table.set_rows, "Failed to load holds",
+                       Member.holds, self.member_id)
+
+    def is_own_active_hold(self, row):
+        if row["member_id"] != self.member_id:
+            return None
+        return row["status"] in ACTIVE_HOLD_STATUSES
+
+    def announce_ready_holds(self, changes):
+        for row in changes.upserted("holds"):
+            if row["member_id"] == self.member_id and row["status"] == "ready":
+                title = row.get("title") or f"book {row['book_id']}"
+                self.statusBar().showMessage(f"A copy of {title} is set aside for you until {row['ready_until']}")
+
+    def cancel_hold(self):
+        rec = self.holds_table.current_record()
+        if rec is None:
+            QMessageBox.warning(self, "Error", "Select a hold to cancel")
+            return
+        try:
+            changes = Member.cancel_hold(self.member_id, rec[0])
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to cancel hold:\n{e}")
+            return
+        self.apply_changes(changes)
 
     # ----------------- Book Clubs (Member view) -----------------
     def create_book_club_tab(self):
         self.club_tab = QWidget()
         l = QVBoxLayout(); l.setContentsMargins(8,8,8,8)
-        self.club_table = QTableWidget()
-        self.club_table.setColumnCount(3)
-        self.club_table.setHorizontalHeaderLabels(["ID", "Name", "Description"])
+        self.club_table = RowTableView(["ID", "Name", "Description"], columns=BookClub.COLUMNS,
+                                       record=partial(self.repo.record, BookClub))
+        self.watch_changes(self.club_table, "book_clubs", insert_new=True)
+        # worked out nightly by tools/suggest_clubs.py from what the member reads
+        self.suggested_club_table = RowTableView(["ID", "Name", "Description", "Match"],
+                                                 formatters={3: lambda score: f"{score:.0%}"},
+                                                 columns=BookClub.SUGGESTION_COLUMNS)
+        self.suggested_club_table.setMaximumHeight(160)
+        self.watch_changes(self.suggested_club_table, "book_clubs")
+        self.watch_changes(self.suggested_club_table, "club_members", key="club_id", accept=self.is_own_membership)
+        l.addWidget(QLabel("Suggested For You:"))
+        l.addWidget(self.suggested_club_table)
+        join_suggested_btn = QPushButton("Join Suggested Club")
+        join_suggested_btn.clicked.connect(self.join_suggested_club)
+        l.addWidget(join_suggested_btn)
         l.addWidget(QLabel("Available Book Clubs:"))
         l.addWidget(self.club_table)
 
@@ -611,67 +827,57 @@ class MainWindow(QMainWindow):
         l.addLayout(btn_h)
 
         self.club_tab.setLayout(l)
-        self.tabs.addTab(self.club_tab, "Book Clubs")
-        self.load_book_clubs()
+        self.add_lazy_tab(self.club_tab, "Book Clubs", self.load_book_clubs, {"book_clubs", "club_members"})
 
     def load_book_clubs(self):
-        try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("SELECT club_id, name, description FROM book_clubs ORDER BY name")
-            rows = cur.fetchall()
-            self.club_table.setRowCount(len(rows))
-            for r, row in enumerate(rows):
-                for c, val in enumerate(row):
-                    self.club_table.setItem(r, c, QTableWidgetItem(str(val if val is not None else "")))
-            self.club_table.resizeColumnsToContents()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load clubs:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
+        self.run_query(self.club_tab, "clubs", self.club_table.set_rows, "Failed to load clubs",
+                       self.repo.clubs)
+        if self.member_id is not None:
+            self.run_query(self.club_tab, "suggested", self.suggested_club_table.set_rows,
+                           "Failed to load suggested clubs", BookClub.suggested, self.member_id)
+
+    def is_own_membership(self, row):
+        # a club the member joins is no longer a suggestion
+        return False if row["member_id"] == self.member_id else None
 
     def join_club(self):
+        rec = self.club_table.current_record()
+        self.join_club_by_id(None if rec is None else rec.club_id)
+
+    def join_suggested_club(self):
+        rec = self.suggested_club_table.current_record()
+        self.join_club_by_id(None if rec is None else rec[0])
+
+    def join_club_by_id(self, club_id):
         if self.member_id is None:
             QMessageBox.warning(self, "Error", "Member record not found!")
             return
-        sel = self.club_table.currentRow()
-        if sel < 0:
+        if club_id is None:
             QMessageBox.warning(self, "Error", "Select a club to join")
             return
-        club_id = int(self.club_table.item(sel, 0).text())
         try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("SELECT 1 FROM club_members WHERE club_id=%s AND member_id=%s", (club_id, self.member_id))
-            if cur.fetchone():
-                QMessageBox.information(self, "Info", "Already joined this club")
-            else:
-                cur.execute("INSERT INTO club_members (club_id, member_id) VALUES (%s, %s)", (club_id, self.member_id))
-                conn.commit()
-                QMessageBox.information(self, "Success", "Joined club successfully!")
-            self.load_book_clubs()
+            changes = BookClub.join_club(self.member_id, club_id)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to join club:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
+            return
+        # the clubs list itself doesn't change; the suggestions drop the club
+        self.apply_changes(changes)
+        if changes:
+            QMessageBox.information(self, "Success", "Joined club successfully!")
+        else:
+            QMessageBox.information(self, "Info", "Already joined this club")
 
     def leave_club(self):
         if self.member_id is None:
             QMessageBox.warning(self, "Error", "Member record not found!")
             return
-        sel = self.club_table.currentRow()
-        if sel < 0:
+        rec = self.club_table.current_record()
+        if rec is None:
             QMessageBox.warning(self, "Error", "Select a club to leave")
             return
-        club_id = int(self.club_table.item(sel, 0).text())
+        club_id = rec.club_id
         try:
-            conn = get_connection(); cur = conn.cursor()
-            cur.execute("DELETE FROM club_members WHERE club_id=%s AND member_id=%s", (club_id, self.member_id))
-            conn.commit()
+            BookClub.leave_club(self.member_id, club_id)
             QMessageBox.information(self, "Success", "Left club successfully!")
-            self.load_book_clubs()
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to leave club:\n{e}")
-        finally:
-            try: cur.close(); conn.close()
-            except: pass
@@ -1,20 +1,146 @@
-from database.database import get_connection
+import datetime
+
+from database import backend
+from database.backend import get_backend
+from models.catalogue_cache import record_changes
+from models.changes import ChangeSet
+
 
 class Member:
-    def __init__(self, member_id, user_id, full_name):
+    __slots__ = ("member_id", "user_id", "full_name", "username", "join_date", "__weakref__")
+    TABLE = "members"
+    KEY = "member_id"
+    # column order of Backend.members() and Backend.club_members()
+    DIRECTORY_COLUMNS = ("member_id", "username", "full_name", "join_date")
+    CLUB_COLUMNS = ("member_id", "full_name", "username")
+
+    MAX_ACTIVE_LOANS = 3
+    LOAN_DAYS = 14
+
+    BORROW_OK = backend.BORROW_OK
+    BORROW_NO_COPIES = backend.BORROW_NO_COPIES
+    BORROW_LIMIT_REACHED = backend.BORROW_LIMIT_REACHED
+    BORROW_NO_BOOK = backend.BORROW_NO_BOOK
+    BORROW_NO_MEMBER = backend.BORROW_NO_MEMBER
+
+    BORROW_MESSAGES = {
+        BORROW_OK: "Book borrowed successfully!",
+        BORROW_NO_COPIES: "No copies available",
+        BORROW_LIMIT_REACHED: f"You cannot borrow more than {MAX_ACTIVE_LOANS} books at a time",
+        BORROW_NO_BOOK: "Book not found",
+        BORROW_NO_MEMBER: "Member record not found!",
+    }
+
+    RETURN_OK = "ok"
+    RETURN_NOT_ON_LOAN = backend.RETURN_NOT_ON_LOAN
+
+    # days a returned copy is kept for the member whose hold it went to
+    HOLD_SHELF_DAYS = 3
+    # ready holds expired per transaction
+    HOLD_EXPIRY_BATCH = 1000
+
+    HOLD_OK = backend.HOLD_OK
+    HOLD_COPIES_AVAILABLE = backend.HOLD_COPIES_AVAILABLE
+    HOLD_ALREADY_QUEUED = backend.HOLD_ALREADY_QUEUED
+
+    HOLD_MESSAGES = {
+        HOLD_OK: "Hold placed. You will be told when a copy is set aside for you.",
+        HOLD_COPIES_AVAILABLE: "A copy is on the shelf; borrow it instead",
+        HOLD_ALREADY_QUEUED: "You already have a hold on this book",
+        BORROW_NO_BOOK: "Book not found",
+        BORROW_NO_MEMBER: "Member record not found!",
+    }
+
+    def __init__(self, member_id, user_id=None, full_name=None, username=None, join_date=None):
         self.member_id = member_id
         self.user_id = user_id
         self.full_name = full_name
+        self.username = username
+        self.join_date = join_date
 
     def borrow_book(self, book_id):
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT copies_available FROM books WHERE book_id=%s", (book_id,))
-        available = cur.fetchone()[0]
-        if available <= 0:
-            cur.close(); conn.close()
-            raise Exception("No copies available")
-        cur.execute("INSERT INTO loans (book_id, member_id, due_date, status) VALUES (%s, %s, CURRENT_DATE + INTERVAL '14 days', 'borrowed')",
-                    (book_id, self.member_id))
-        cur.execute("UPDATE books SET copies_available = copies_available - 1 WHERE book_id=%s", (book_id,))
-        conn.commit(); cur.close(); conn.close()
+        code, changes = Member.borrow(self.member_id, book_id)
+        if code != Member.BORROW_OK:
+            raise Exception(Member.BORROW_MESSAGES[code])
+        return changes.upserted("loans")[0]["loan_id"]
+
+    @staticmethod
+    def borrow(member_id, book_id):
+        # Returns (result code, changes). On BORROW_OK the ChangeSet holds the new
+        # loan and the book's new copies_available; on BORROW_NO_COPIES just the book.
+        # The member, the loan limit and the copies are checked, and the copy taken
+        # and the loan inserted, as one atomic call.
+        code, changes = get_backend().borrow(member_id, book_id, Member.MAX_ACTIVE_LOANS)
+        record_changes(changes)
+        return code, changes
+
+    @staticmethod
+    def borrow_many(member_id, isbns=(), book_ids=()):
+        # Checks out a whole batch (e.g. a run of barcode scans) in one transaction.
+        # Items that can't be borrowed are reported and skipped; if the batch would
+        # take the member over the loan limit nothing is borrowed.
+        # Returns (code, changes, rejects): changes is a ChangeSet with the new loans
+        # and the books' new copies_available, rejects is [(item, code)].
+        if not isbns and not book_ids:
+            return Member.BORROW_OK, ChangeSet(), []
+        code, changes, rejects = get_backend().borrow_many(member_id, list(isbns), list(book_ids),
+                                                           Member.MAX_ACTIVE_LOANS, Member.LOAN_DAYS)
+        record_changes(changes)
+        return code, changes, rejects
+
+    @staticmethod
+    def return_many(member_id, loan_ids=(), isbns=(), book_ids=()):
+        # Returns a batch of loans in one transaction. Loans can be given directly or
+        # by scanning the book's ISBN or book_id label, which returns one of the
+        # member's active loans of that title. Returns (changes, rejects): changes is a ChangeSet with the
+        # returned loans and the books' new copies_available.
+        if not loan_ids and not isbns and not book_ids:
+            return ChangeSet(), []
+        changes, rejects = get_backend().return_many(member_id, list(loan_ids), list(isbns), list(book_ids),
+                                                     Member.HOLD_SHELF_DAYS)
+        record_changes(changes)
+        return changes, rejects
+
+    @staticmethod
+    def place_hold(member_id, book_id, priority=0):
+        # Queues the member for a book with no copy on the shelf. Higher priority
+        # goes first, then first come first served. When a copy comes back it is
+        # set aside for the first hold in the queue, which turns 'ready', and
+        # borrowing the book collects it. Returns (code, changes).
+        code, changes = get_backend().place_hold(member_id, book_id, priority)
+        record_changes(changes)
+        return code, changes
+
+    @staticmethod
+    def cancel_hold(member_id, hold_id):
+        # A copy already set aside goes to the next hold in the queue.
+        changes = get_backend().cancel_hold(member_id, hold_id, Member.HOLD_SHELF_DAYS)
+        record_changes(changes)
+        return changes
+
+    @staticmethod
+    def holds(member_id):
+        return get_backend().member_holds(member_id)
+
+    @staticmethod
+    def expire_holds(as_of=None, progress=None):
+        # Expires every ready hold not collected by `as_of` (default today), in
+        # batches of HOLD_EXPIRY_BATCH, passing each copy on to the next hold or
+        # back to the shelf. progress(expired so far) follows every batch.
+        # Returns the number of holds expired.
+        as_of = as_of or datetime.date.today()
+        db = get_backend()
+        expired = 0
+        while True:
+            changes = db.expire_holds(as_of, Member.HOLD_EXPIRY_BATCH, Member.HOLD_SHELF_DAYS)
+            batch = sum(1 for hold in changes.upserted("holds") if hold["status"] == "expired")
+            if not batch:
+                return expired
+            record_changes(changes)
+            expired += batch
+            if progress:
+                progress(expired)
+
+    @staticmethod
+    def id_for_user(user_id):
+        return get_backend().member_id_for_user(user_id)
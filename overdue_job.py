@@ -0,0 +1,37 @@
+# tools/overdue_job.py
+# Marks loans past their due date overdue and brings every late loan's fine up
+# to date (see models/fines.py). Meant to run daily, e.g. from cron:
+#
+#   15 0 * * *  cd /srv/library && python -m tools.overdue_job
+#   python -m tools.overdue_job --as-of 2024-06-30 --chunk 20000
+import argparse
+import datetime
+import sys
+import time
+
+from models.fines import FINE_CONFIG, assess_overdue
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Overdue loans and fines")
+    parser.add_argument("--as-of", type=datetime.date.fromisoformat, default=None,
+                        help="assess as of this date (YYYY-MM-DD); default today")
+    parser.add_argument("--chunk", type=int, default=FINE_CONFIG['chunk'], help="loan ids per transaction")
+    args = parser.parse_args(argv)
+    if args.chunk < 1:
+        parser.error("--chunk must be positive")
+
+    def progress(result, fraction):
+        print(f"\r{fraction:6.1%}  {result.marked} marked overdue, {result.fined} fines written",
+              end="", file=sys.stderr)
+
+    start = time.monotonic()
+    result = assess_overdue(args.as_of, args.chunk, progress=progress)
+    print(file=sys.stderr)
+    print(f"as of {result.as_of}: {result.marked} loans marked overdue, {result.fined} fines written "
+          f"in {result.chunks} chunks, {time.monotonic() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
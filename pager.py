@@ -0,0 +1,64 @@
+# gui/pager.py
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QLabel, QPushButton, QMessageBox
+
+
+class KeysetPager(QWidget):
+    # rows one page window may grow to through infinite scroll before the
+    # user has to move on with "Next"; keeps memory flat on huge catalogues
+    WINDOW_ROWS = 1000
+
+    def __init__(self, view, fetch, executor, key, error_text="Failed to load rows", parent=None):
+        super().__init__(parent)
+        self._view = view
+        self._fetch = fetch
+        self._executor = executor
+        self._key = key
+        self._error_text = error_text
+        self._starts = [None]  # start key of every page visited so far
+
+        h = QHBoxLayout(); h.setContentsMargins(0, 0, 0, 0)
+        self.prev_btn = QPushButton("< Previous"); self.prev_btn.clicked.connect(self.prev_page)
+        self.page_label = QLabel()
+        self.next_btn = QPushButton("Next >"); self.next_btn.clicked.connect(self.next_page)
+        h.addStretch(); h.addWidget(self.prev_btn); h.addWidget(self.page_label); h.addWidget(self.next_btn)
+        self.setLayout(h)
+
+        view.model().rowsInserted.connect(self._update_controls)
+        view.model().modelReset.connect(self._update_controls)
+        self._update_controls()
+
+    def first(self):
+        self._starts = [None]
+        self._load()
+
+    def reload(self):
+        self._load()
+
+    def next_page(self):
+        key = self._view.model().next_key()
+        if key is None:
+            return
+        self._starts.append(key)
+        self._load()
+
+    def prev_page(self):
+        if len(self._starts) > 1:
+            self._starts.pop()
+            self._load()
+
+    def _load(self):
+        self._view.model().set_source(self._request, start=self._starts[-1], max_rows=self.WINDOW_ROWS)
+        self._update_controls()
+
+    def _request(self, after, deliver):
+        def failed(e):
+            QMessageBox.critical(self, "Error", f"{self._error_text}:\n{e}")
+            deliver([], None)
+        self._executor.submit(self._key, self._fetch, after,
+                              on_result=lambda page: deliver(*page), on_error=failed)
+
+    def _update_controls(self, *args):
+        loading = self._view.model().is_loading()
+        self.page_label.setText(f"Page {len(self._starts)}")
+        self.prev_btn.setEnabled(not loading and len(self._starts) > 1)
+        self.next_btn.setEnabled(not loading and self._view.model().next_key() is not None)
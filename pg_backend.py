@@ -0,0 +1,1025 @@
+# database/pg_backend.py
+# The PostgreSQL backend: pooled psycopg2 connections (database.py) with reads
+# spread over any read replicas, the schema migrations in schema.py, and the
+# server-side features the library relies on at scale -- library_borrow(),
+# trigram/full-text search, COPY imports and named-cursor exports.
+import csv
+import datetime
+import io
+import itertools
+import json
+
+from database import schema
+from database.backend import (
+    Backend, BORROW_OK, BORROW_NO_MEMBER, BORROW_NO_BOOK, BORROW_LIMIT_REACHED, HOLD_OK, HOLD_COPIES_AVAILABLE,
+    HOLD_ALREADY_QUEUED, normalize_isbn, parse_search, borrow_requests, return_requests, plan_borrow,
+    split_collections, match_returns, loan_changes, page_key,
+)
+from database.database import ReplicaDown, connection, close_pool, get_connection
+from models.changes import ChangeSet, rows_as_dicts
+
+# candidates taken from each search branch before ranking; bounds the work for
+# very common words ("the") at the cost of not ranking every last match
+SEARCH_CANDIDATE_LIMIT = 1000
+# a superseded search is dropped by the GUI, but the server stops it too
+SEARCH_TIMEOUT_MS = 2000
+
+# The catalogue change version is a transaction id: the oldest transaction
+# still running (schema migration 14). Every transaction before it has
+# committed or rolled back, so its changes are in whatever is read next; those
+# from it on are asked for again at the next look, which may send a change
+# twice but never misses one that commits late.
+CURRENT_XMIN_SQL = "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+
+# channel library_notify_change() announces row changes on (schema migration 6)
+CHANGE_CHANNEL = "library_changes"
+# date columns, which come through the notification JSON as ISO strings
+_NOTIFY_DATE_COLUMNS = ("loan_date", "due_date", "return_date", "ready_until")
+
+# imports serialise on this so two files with the same new ISBN can't both insert it
+_IMPORT_LOCK_KEY = 0x4C4942494D50
+
+# a member's active holds with their place in the queue: waiting holds ahead
+# in queue order (see schema migration 8), counting itself
+MEMBER_HOLDS_SQL = """
+    SELECT h.hold_id, h.book_id, b.title, h.status,
+           CASE WHEN h.status = 'waiting' THEN
+               (SELECT count(*) FROM holds q
+                WHERE q.book_id = h.book_id AND q.status = 'waiting'
+                  AND (q.priority > h.priority OR (q.priority = h.priority
+                       AND (q.created_at, q.hold_id) <= (h.created_at, h.hold_id))))
+           END AS position,
+           h.ready_until
+    FROM holds h
+    JOIN books b ON b.book_id = h.book_id
+    WHERE h.member_id = %s AND h.status IN ('waiting', 'ready')
+"""
+
+# the first `n` waiting holds of each book, taken in queue order straight off
+# holds_queue_idx. SKIP LOCKED: a hold another transaction is allocating is
+# passed over for the next one instead of waited for.
+ALLOCATE_SQL = """
+    UPDATE holds h SET status = 'ready', ready_until = CURRENT_DATE + %s
+    FROM (SELECT q.hold_id
+          FROM unnest(%s::int[], %s::int[]) AS r(book_id, n)
+          CROSS JOIN LATERAL (
+              SELECT hold_id FROM holds
+              WHERE book_id = r.book_id AND status = 'waiting'
+              ORDER BY priority DESC, created_at, hold_id
+              LIMIT r.n
+              FOR UPDATE SKIP LOCKED
+          ) q) next_holds
+    WHERE h.hold_id = next_holds.hold_id
+    RETURNING h.hold_id, h.book_id, h.member_id, h.status, h.ready_until
+"""
+
+STAGING_SQL = """
+    CREATE TEMP TABLE import_staging (
+        line      integer,
+        title     text,
+        isbn      text,
+        author_id integer,
+        category  text,
+        copies    integer
+    ) ON COMMIT DROP
+"""
+
+MERGE_SQL = """
+    WITH src AS (
+        SELECT isbn,
+               (array_agg(title ORDER BY line))[1]     AS title,
+               (array_agg(author_id ORDER BY line))[1] AS author_id,
+               (array_agg(category ORDER BY line))[1]  AS category,
+               sum(copies)                             AS copies
+        FROM import_staging
+        GROUP BY isbn
+    ), upd AS (
+        UPDATE books b
+           SET copies_total = b.copies_total + s.copies,
+               copies_available = b.copies_available + s.copies
+          FROM src s
+         WHERE b.isbn = s.isbn
+           -- the oldest title only, where an ISBN was entered twice
+           AND NOT EXISTS (SELECT 1 FROM books d WHERE d.isbn = b.isbn AND d.book_id < b.book_id)
+        RETURNING b.isbn
+    ), ins AS (
+        INSERT INTO books (title, isbn, author_id, category, copies_total, copies_available)
+        SELECT s.title, s.isbn, s.author_id, s.category, s.copies, s.copies
+          FROM src s
+         WHERE NOT EXISTS (SELECT 1 FROM books b WHERE b.isbn = s.isbn)
+        RETURNING 1
+    )
+    SELECT (SELECT count(DISTINCT isbn) FROM upd), (SELECT count(*) FROM ins)
+"""
+
+
+def prefix_tsquery(words):
+    # ["harry", "pott"] -> "harry:* & pott:*"; only word characters reach to_tsquery
+    return " & ".join(f"{w}:*" for w in words)
+
+
+class _CopySource:
+    # File-like view of rows in COPY's CSV format, so COPY reads the import
+    # straight from the generator without the file ever being held in memory.
+    def __init__(self, rows):
+        self._rows = rows
+        self._buf = io.StringIO()
+        self._writer = csv.writer(self._buf, lineterminator="\n")
+        self._pending = ""
+
+    def read(self, size=-1):
+        out = self._pending
+        while size < 0 or len(out) < size:
+            chunk = list(itertools.islice(self._rows, 1000))
+            if not chunk:
+                break
+            self._buf.seek(0)
+            self._buf.truncate()
+            self._writer.writerows(chunk)
+            out += self._buf.getvalue()
+        if size < 0:
+            self._pending = ""
+            return out
+        self._pending = out[size:]
+        return out[:size]
+
+
+class _ChangeFeed:
+    # A connection of its own, outside the pool, LISTENing on CHANGE_CHANNEL.
+    # The owner waits for fileno() to turn readable (a QSocketNotifier in the
+    # GUI) and then calls read(), which never blocks.
+    def __init__(self):
+        self._conn = get_connection()
+        self._conn.autocommit = True
+        with self._conn.cursor() as cur:
+            cur.execute(f"LISTEN {CHANGE_CHANNEL}")
+
+    def fileno(self):
+        return self._conn.fileno()
+
+    def read(self):
+        self._conn.poll()
+        changes, reloads = ChangeSet(), set()
+        while self._conn.notifies:
+            note = json.loads(self._conn.notifies.pop(0).payload)
+            table, row = note["table"], note.get("row")
+            if note["op"] == "reload":
+                reloads.add(table)
+                continue
+            for column in _NOTIFY_DATE_COLUMNS:
+                if row.get(column) is not None:
+                    row[column] = datetime.date.fromisoformat(row[column])
+            if note["op"] == "delete":
+                changes.delete(table, [row])
+            else:
+                changes.upsert(table, [row])
+        return changes, reloads
+
+    def close(self):
+        self._conn.close()
+
+
+class PostgresBackend(Backend):
+    name = "postgres"
+
+    def prepare(self):
+        schema.migrate()
+
+    def close(self):
+        close_pool()
+
+    # plain reads, which a read replica may serve (see database.REPLICA_CONFIG)
+    def _fetch_all(self, sql, params=None):
+        return self._read(sql, params, lambda cur: cur.fetchall())
+
+    def _fetch_one(self, sql, params=None):
+        return self._read(sql, params, lambda cur: cur.fetchone())
+
+    def _read(self, sql, params, fetch):
+        # A replica that dies under a read is marked down and the read goes to
+        # the primary instead, so the first read after a failure still answers.
+        try:
+            with connection(read_only=True) as conn, conn.cursor() as cur:
+                cur.execute(sql, params)
+                return fetch(cur)
+        except ReplicaDown:
+            with connection(read_only=True, use_replica=False) as conn, conn.cursor() as cur:
+                cur.execute(sql, params)
+                return fetch(cur)
+
+    def _write(self, sql, params, table, delete=False):
+        # one statement with RETURNING -> ChangeSet
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            rows = rows_as_dicts(cur)
+            conn.commit()
+        changes = ChangeSet()
+        return changes.delete(table, rows) if delete else changes.upsert(table, rows)
+
+    # ---- accounts ----
+    def authenticate(self, username, password, role=None):
+        if role is None:
+            return self._fetch_one("SELECT user_id, username, role FROM users WHERE username=%s AND password=%s",
+                                   (username, password))
+        return self._fetch_one("SELECT user_id, username, role FROM users WHERE username=%s AND password=%s AND role=%s",
+                               (username, password, role))
+
+    def create_account(self, username, password, role, full_name=None):
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("""INSERT INTO users (username, password, role) VALUES (%s, %s, %s)
+                           ON CONFLICT (username) DO NOTHING RETURNING user_id""",
+                        (username, password, role))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            if role == "member":
+                cur.execute("INSERT INTO members (user_id, full_name) VALUES (%s, %s)", (row[0], full_name))
+            conn.commit()
+        return row[0]
+
+    def member_id_for_user(self, user_id):
+        row = self._fetch_one("SELECT member_id FROM members WHERE user_id=%s", (user_id,))
+        return row[0] if row else None
+
+    def members(self):
+        return self._fetch_all("""
+            SELECT m.member_id, u.username, m.full_name, m.join_date
+            FROM members m
+            LEFT JOIN users u ON m.user_id = u.user_id
+            ORDER BY m.member_id
+        """)
+
+    # ---- catalogue ----
+    def books_page(self, after, limit, columns):
+        cols = ", ".join(columns)
+        if after is None:
+            rows = self._fetch_all(f"SELECT {cols} FROM books ORDER BY title, book_id LIMIT %s", (limit,))
+        else:
+            rows = self._fetch_all(f"""SELECT {cols} FROM books
+                                       WHERE (title, book_id) > (%s, %s)
+                                       ORDER BY title, book_id LIMIT %s""",
+                                   (after[0], after[1], limit))
+        return rows, page_key(rows, limit, columns)
+
+    def search_books(self, text, columns, limit):
+        # Titles and categories are matched with full-text search (prefix matching
+        # on every word, so results show up while the user is still typing); titles
+        # and author names also match by trigram word similarity so a typo still
+        # finds the book; ISBNs match on their leading digits. Every branch is an
+        # index scan (indexes in database/schema.py) and the candidates are ranked
+        # together.
+        words, isbn_prefix = parse_search(text)
+        tsquery = prefix_tsquery(words)
+        isbn_prefix = isbn_prefix + "%" if isbn_prefix else None
+
+        branches = ["SELECT book_id FROM books WHERE %(text)s <%% title LIMIT %(candidates)s",
+                    """SELECT b.book_id FROM authors a JOIN books b ON b.author_id = a.author_id
+                       WHERE %(text)s <%% a.name LIMIT %(candidates)s"""]
+        if tsquery:
+            branches.append("""SELECT book_id FROM books
+                               WHERE search_vector @@ to_tsquery('simple', %(tsquery)s) LIMIT %(candidates)s""")
+        if isbn_prefix:
+            branches.append("SELECT book_id FROM books WHERE isbn LIKE %(isbn_prefix)s LIMIT %(candidates)s")
+        hits = " UNION ".join(f"({b})" for b in branches)
+
+        cols = ", ".join(f"b.{c}" for c in columns)
+        sql = f"""
+            WITH hits AS ({hits})
+            SELECT {cols}
+            FROM hits
+            JOIN books b ON b.book_id = hits.book_id
+            LEFT JOIN authors a ON a.author_id = b.author_id
+            ORDER BY (CASE WHEN %(tsquery)s <> '' THEN ts_rank(b.search_vector, to_tsquery('simple', %(tsquery)s)) ELSE 0 END
+                      + word_similarity(%(text)s, b.title)
+                      + 0.5 * coalesce(word_similarity(%(text)s, a.name), 0)
+                      + CASE WHEN %(isbn_prefix)s IS NOT NULL AND b.isbn LIKE %(isbn_prefix)s THEN 1 ELSE 0 END) DESC,
+                     b.title, b.book_id
+            LIMIT %(limit)s
+        """
+        params = {"text": text, "tsquery": tsquery, "isbn_prefix": isbn_prefix,
+                  "candidates": SEARCH_CANDIDATE_LIMIT, "limit": limit}
+        with connection(read_only=True) as conn, conn.cursor() as cur:
+            cur.execute("SET LOCAL statement_timeout = %s", (SEARCH_TIMEOUT_MS,))
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+    def book_title(self, book_id):
+        row = self._fetch_one("SELECT title FROM books WHERE book_id=%s", (book_id,))
+        return row[0] if row else None
+
+    def catalogue_version(self):
+        return self._fetch_one(CURRENT_XMIN_SQL)[0]
+
+    def books_changed_since(self, version, columns):
+        with connection(read_only=True) as conn, conn.cursor() as cur:
+            # taken before the reads, which therefore see every change before it
+            cur.execute(CURRENT_XMIN_SQL)
+            now = cur.fetchone()[0]
+            cur.execute(f"SELECT {', '.join(columns)} FROM books WHERE change_xid >= %s::text::xid8 ORDER BY version",
+                        (version,))
+            changed = cur.fetchall()
+            cur.execute("SELECT book_id FROM deleted_books WHERE change_xid >= %s::text::xid8", (version,))
+            deleted = [book_id for book_id, in cur.fetchall()]
+        return changed, deleted, now
+
+    def add_book(self, title, isbn, author_id, category, copies, columns):
+        return self._write(f"""INSERT INTO books (title, isbn, author_id, category, copies_total, copies_available)
+                               VALUES (%s, %s, %s, %s, %s, %s)
+                               RETURNING {", ".join(columns)}""",
+                           (title, isbn, author_id, category, copies, copies), "books")
+
+    def update_book_title(self, book_id, title):
+        return self._write("UPDATE books SET title=%s WHERE book_id=%s RETURNING book_id, title",
+                           (title, book_id), "books")
+
+    def delete_book(self, book_id):
+        return self._write("DELETE FROM books WHERE book_id=%s RETURNING book_id", (book_id,), "books", delete=True)
+
+    def merge_catalogue(self, rows, checkpoint=None):
+        # COPYs the rows into a temporary staging table, then one set-based
+        # statement merges them into books. Nothing is visible to other sessions
+        # until the whole file has been merged.
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (_IMPORT_LOCK_KEY,))
+            # the import is one transaction that can be re-run if it is lost
+            cur.execute("SET LOCAL synchronous_commit = off")
+            cur.execute("SET LOCAL library.bulk_write = on")
+            cur.execute(STAGING_SQL)
+            cur.copy_expert("COPY import_staging (line, title, isbn, author_id, category, copies) "
+                            "FROM STDIN WITH (FORMAT csv)", _CopySource(rows), size=1 << 16)
+            if checkpoint is not None:
+                checkpoint()
+            cur.execute("ANALYZE import_staging")
+            cur.execute(MERGE_SQL)
+            updated, inserted = cur.fetchone()
+            if updated or inserted:
+                self._notify_reload(cur, "books")
+            conn.commit()
+        return updated, inserted
+
+    # ---- circulation ----
+    def borrow(self, member_id, book_id, max_loans):
+        # library_borrow() (see database/schema.py) checks the member, the loan limit
+        # and the copies, decrements and inserts the loan as one atomic call
+        with connection() as conn:
+            # autocommit: the function call is its own transaction, no BEGIN/COMMIT round trips
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("""SELECT result, new_loan_id, new_loan_date, new_due_date, book_title, available,
+                                          collected_hold
+                                   FROM library_borrow(%s, %s, %s)""",
+                                (member_id, book_id, max_loans))
+                    code, loan_id, loan_date, due_date, title, available, hold_id = cur.fetchone()
+            finally:
+                conn.autocommit = False
+        changes = ChangeSet()
+        if code == BORROW_OK:
+            changes.upsert("loans", [{"loan_id": loan_id, "book_id": book_id, "member_id": member_id,
+                                      "title": title, "loan_date": loan_date, "due_date": due_date,
+                                      "return_date": None, "status": "borrowed"}])
+        if hold_id is not None:
+            changes.upsert("holds", [{"hold_id": hold_id, "book_id": book_id, "member_id": member_id,
+                                      "status": "collected"}])
+        if available is not None:
+            changes.upsert("books", [{"book_id": book_id, "copies_available": available}])
+        return code, changes
+
+    def borrow_many(self, member_id, isbns, book_ids, max_loans, loan_days):
+        requests = borrow_requests(isbns, book_ids)
+        # match scans as typed and normalised, whichever way the catalogue stores them
+        isbn_keys = sorted({v for kind, v in requests if kind == "isbn"} | {str(i).strip() for i in isbns})
+        id_keys = sorted({v for kind, v in requests if kind == "id"})
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT member_id FROM members WHERE member_id=%s FOR UPDATE", (member_id,))
+            if cur.fetchone() is None:
+                return BORROW_NO_MEMBER, ChangeSet(), [(v, BORROW_NO_MEMBER) for _, v in requests]
+            cur.execute("""SELECT count(*) FROM loans
+                           WHERE member_id=%s AND status IN ('borrowed', 'overdue')""", (member_id,))
+            active = cur.fetchone()[0]
+
+            # lock every requested book in a fixed order so concurrent batches can't deadlock
+            cur.execute("""
+                SELECT book_id, isbn, copies_available FROM books
+                WHERE isbn = ANY(%s) OR book_id = ANY(%s)
+                ORDER BY book_id FOR UPDATE
+            """, (isbn_keys, id_keys))
+            by_isbn, by_id = {}, {}
+            for book_id, isbn, available in cur.fetchall():
+                by_id[book_id] = [book_id, available]
+                if isbn is not None:
+                    by_isbn.setdefault(normalize_isbn(isbn), by_id[book_id])
+            # copies set aside for this member count as available to them
+            cur.execute("""SELECT book_id, hold_id FROM holds
+                           WHERE member_id = %s AND status = 'ready' AND book_id = ANY(%s)
+                           FOR UPDATE""", (member_id, list(by_id)))
+            ready = {}
+            for book_id, hold_id in cur.fetchall():
+                ready.setdefault(book_id, []).append(hold_id)
+                by_id[book_id][1] += 1
+
+            granted, rejects, over_limit = plan_borrow(requests, by_isbn, by_id, active, max_loans)
+            if over_limit:
+                conn.rollback()
+                return BORROW_LIMIT_REACHED, ChangeSet(), [(v, BORROW_LIMIT_REACHED) for _, v in requests]
+            if not granted:
+                conn.rollback()
+                return rejects[0][1], ChangeSet(), rejects
+
+            collected, counts = split_collections(granted, ready)
+            holds = []
+            if collected:
+                cur.execute("""UPDATE holds SET status = 'collected' WHERE hold_id = ANY(%s)
+                               RETURNING hold_id, book_id, member_id, status""", (collected,))
+                holds = rows_as_dicts(cur)
+            cur.execute("""
+                WITH dec AS (
+                    UPDATE books b SET copies_available = b.copies_available - t.n
+                    FROM unnest(%s::int[], %s::int[]) AS t(book_id, n)
+                    WHERE b.book_id = t.book_id
+                    RETURNING b.book_id, b.title, b.copies_available
+                ), ins AS (
+                    INSERT INTO loans (book_id, member_id, due_date, status)
+                    SELECT t.book_id, %s, CURRENT_DATE + %s, 'borrowed'
+                    FROM unnest(%s::int[]) AS t(book_id)
+                    RETURNING loan_id, book_id, member_id, loan_date, due_date, return_date, status
+                )
+                SELECT ins.*, dec.title, dec.copies_available FROM ins JOIN dec USING (book_id)
+            """, (list(counts), list(counts.values()), member_id, loan_days, granted))
+            changes = loan_changes(rows_as_dicts(cur)).upsert("holds", holds)
+            conn.commit()
+        return BORROW_OK, changes, rejects
+
+    def return_many(self, member_id, loan_ids, isbns, book_ids, shelf_days):
+        requests = return_requests(loan_ids, isbns, book_ids)
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT l.loan_id, l.book_id, b.isbn
+                FROM loans l JOIN books b ON b.book_id = l.book_id
+                WHERE l.member_id = %s AND l.status IN ('borrowed', 'overdue')
+                ORDER BY l.loan_date, l.loan_id
+                FOR UPDATE OF l
+            """, (member_id,))
+            chosen, rejects = match_returns(requests, cur.fetchall())
+            if not chosen:
+                conn.rollback()
+                return ChangeSet(), rejects
+            cur.execute("""
+                UPDATE loans SET status = 'returned', return_date = CURRENT_DATE
+                WHERE loan_id = ANY(%s) AND status IN ('borrowed', 'overdue')
+                RETURNING loan_id, book_id, member_id, loan_date, due_date, return_date, status
+            """, ([loan_id for loan_id, _ in chosen],))
+            rows = rows_as_dicts(cur)
+            counts = {}
+            for row in rows:
+                counts[row["book_id"]] = counts.get(row["book_id"], 0) + 1
+            holds, available = self._allocate_copies(cur, counts, shelf_days)
+            for row in rows:
+                row["copies_available"] = available[row["book_id"]]
+            changes = loan_changes(rows).upsert("holds", holds)
+            conn.commit()
+        return changes, rejects
+
+    def _allocate_copies(self, cur, counts, shelf_days):
+        # Copies coming back ({book_id: n}) go to the books' next waiting holds,
+        # set aside for shelf_days; the rest go back on the shelf.
+        # Returns (ready holds, {book_id: copies_available}). The books are
+        # locked first, in book_id order, so a hold being placed on one of them
+        # is either queued before the waiting holds are read or sees the copy.
+        cur.execute("SELECT 1 FROM books WHERE book_id = ANY(%s) ORDER BY book_id FOR UPDATE", (list(counts),))
+        cur.execute(ALLOCATE_SQL, (shelf_days, list(counts), list(counts.values())))
+        holds = rows_as_dicts(cur)
+        shelved = dict(counts)
+        for hold in holds:
+            shelved[hold["book_id"]] -= 1
+        cur.execute("""
+            UPDATE books b SET copies_available = b.copies_available + t.n
+            FROM unnest(%s::int[], %s::int[]) AS t(book_id, n)
+            WHERE b.book_id = t.book_id
+            RETURNING b.book_id, b.copies_available
+        """, (list(shelved), list(shelved.values())))
+        return holds, dict(cur.fetchall())
+
+    def open_loans(self, member_id):
+        return self._fetch_all("""
+            SELECT l.loan_id, b.book_id, b.title, l.loan_date, l.due_date
+            FROM loans l
+            JOIN books b ON l.book_id = b.book_id
+            WHERE l.member_id=%s AND l.status IN ('borrowed', 'overdue')
+        """, (member_id,))
+
+    def member_loan_history(self, member_id):
+        return self._fetch_all("""
+            SELECT l.loan_id, b.title, l.loan_date, l.due_date, l.return_date, l.status
+            FROM loans l
+            JOIN books b ON l.book_id = b.book_id
+            WHERE l.member_id = %s
+            ORDER BY l.loan_date DESC
+        """, (member_id,))
+
+    def recent_loans(self, limit):
+        return self._fetch_all("""
+            SELECT l.loan_id, l.member_id, COALESCE(m.full_name, u.username) AS member_name,
+                   b.book_id, b.title, l.status
+            FROM loans l
+            JOIN books b ON l.book_id = b.book_id
+            LEFT JOIN members m ON l.member_id = m.member_id
+            LEFT JOIN users u ON m.user_id = u.user_id
+            ORDER BY l.loan_date DESC
+            LIMIT %s
+        """, (limit,))
+
+    # ---- loan archive ----
+    def archive_loans(self, before, limit):
+        with connection() as conn, conn.cursor() as cur:
+            # archived loans are long returned and on nobody's screen; no notifications
+            cur.execute("SET LOCAL library.bulk_write = on")
+            cur.execute("""
+                WITH moved AS (
+                    DELETE FROM loans
+                    WHERE loan_id IN (SELECT loan_id FROM loans l
+                                      WHERE l.loan_date < %(before)s AND l.status = 'returned'
+                                        AND l.return_date < %(before)s
+                                        AND NOT EXISTS (SELECT 1 FROM fines f
+                                                        WHERE f.loan_id = l.loan_id AND NOT f.final)
+                                      ORDER BY l.loan_date
+                                      LIMIT %(limit)s
+                                      FOR UPDATE SKIP LOCKED)
+                    RETURNING loan_id, book_id, member_id, loan_date, due_date, return_date, status
+                )
+                INSERT INTO loans_archive (loan_id, book_id, member_id, loan_date, due_date, return_date, status)
+                SELECT loan_id, book_id, member_id, loan_date, due_date, return_date, status FROM moved
+            """, {"before": before, "limit": limit})
+            moved = cur.rowcount
+            conn.commit()
+        return moved
+
+    def archived_loans(self, member_id):
+        return self._fetch_all("""
+            SELECT a.loan_id, b.title, a.loan_date, a.due_date, a.return_date, a.status
+            FROM loans_archive a
+            JOIN books b ON a.book_id = b.book_id
+            WHERE a.member_id = %s
+            ORDER BY a.loan_date DESC
+        """, (member_id,))
+
+    # ---- holds ----
+    def place_hold(self, member_id, book_id, priority):
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM members WHERE member_id=%s", (member_id,))
+            if cur.fetchone() is None:
+                return BORROW_NO_MEMBER, ChangeSet()
+            # the book row stays locked until the hold is queued: a copy coming
+            # back meanwhile waits, then goes to this hold instead of the shelf
+            cur.execute("SELECT copies_available FROM books WHERE book_id=%s FOR UPDATE", (book_id,))
+            row = cur.fetchone()
+            if row is None:
+                conn.rollback()
+                return BORROW_NO_BOOK, ChangeSet()
+            if row[0] > 0:
+                conn.rollback()
+                return HOLD_COPIES_AVAILABLE, ChangeSet()
+            cur.execute("""
+                INSERT INTO holds (book_id, member_id, priority) VALUES (%s, %s, %s)
+                ON CONFLICT (member_id, book_id) WHERE status IN ('waiting', 'ready') DO NOTHING
+                RETURNING hold_id
+            """, (book_id, member_id, priority))
+            row = cur.fetchone()
+            if row is None:
+                conn.rollback()
+                return HOLD_ALREADY_QUEUED, ChangeSet()
+            cur.execute(MEMBER_HOLDS_SQL + " AND h.hold_id = %s", (member_id, row[0]))
+            holds = rows_as_dicts(cur)
+            conn.commit()
+        for hold in holds:
+            hold["member_id"] = member_id
+        return HOLD_OK, ChangeSet().upsert("holds", holds)
+
+    def cancel_hold(self, member_id, hold_id, shelf_days):
+        with connection() as conn, conn.cursor() as cur:
+            # the book is locked before the hold, the order borrow_many and
+            # returns take them in; the hold's status is checked again under
+            # the locks
+            cur.execute("""SELECT book_id FROM holds
+                           WHERE hold_id = %s AND member_id = %s AND status IN ('waiting', 'ready')""",
+                        (hold_id, member_id))
+            row = cur.fetchone()
+            if row is None:
+                conn.rollback()
+                return ChangeSet()
+            cur.execute("SELECT 1 FROM books WHERE book_id = %s FOR UPDATE", row)
+            cur.execute("""
+                WITH old AS (
+                    SELECT hold_id, status FROM holds
+                    WHERE hold_id = %s AND member_id = %s AND status IN ('waiting', 'ready')
+                    FOR UPDATE
+                )
+                UPDATE holds h SET status = 'cancelled', ready_until = NULL
+                FROM old WHERE h.hold_id = old.hold_id
+                RETURNING h.hold_id, h.book_id, h.member_id, h.status, old.status AS was
+            """, (hold_id, member_id))
+            holds = rows_as_dicts(cur)
+            changes = ChangeSet()
+            for hold in holds:
+                if hold.pop("was") == "ready":
+                    ready, available = self._allocate_copies(cur, {hold["book_id"]: 1}, shelf_days)
+                    changes.upsert("holds", ready)
+                    changes.upsert("books", [{"book_id": b, "copies_available": n} for b, n in available.items()])
+            conn.commit()
+        return changes.upsert("holds", holds)
+
+    def member_holds(self, member_id):
+        return self._fetch_all(MEMBER_HOLDS_SQL + " ORDER BY h.created_at, h.hold_id", (member_id,))
+
+    def expire_holds(self, as_of, limit, shelf_days):
+        with connection() as conn, conn.cursor() as cur:
+            # books first, in book_id order, then the holds, as in cancel_hold;
+            # a hold collected or expired by someone else meanwhile is passed over
+            cur.execute("""SELECT hold_id, book_id FROM holds
+                           WHERE status = 'ready' AND ready_until < %s
+                           ORDER BY ready_until
+                           LIMIT %s""", (as_of, limit))
+            due = cur.fetchall()
+            if not due:
+                conn.rollback()
+                return ChangeSet()
+            cur.execute("SELECT 1 FROM books WHERE book_id = ANY(%s) ORDER BY book_id FOR UPDATE",
+                        (sorted({book_id for _, book_id in due}),))
+            cur.execute("""
+                WITH due AS (
+                    SELECT hold_id FROM holds
+                    WHERE hold_id = ANY(%s) AND status = 'ready' AND ready_until < %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE holds h SET status = 'expired'
+                FROM due WHERE h.hold_id = due.hold_id
+                RETURNING h.hold_id, h.book_id, h.member_id, h.status
+            """, ([hold_id for hold_id, _ in due], as_of))
+            holds = rows_as_dicts(cur)
+            changes = ChangeSet()
+            if holds:
+                counts = {}
+                for hold in holds:
+                    counts[hold["book_id"]] = counts.get(hold["book_id"], 0) + 1
+                ready, available = self._allocate_copies(cur, counts, shelf_days)
+                changes.upsert("holds", holds + ready)
+                changes.upsert("books", [{"book_id": b, "copies_available": n} for b, n in available.items()])
+            conn.commit()
+        return changes
+
+    # ---- overdue and fines ----
+    def loan_id_range(self):
+        return self._fetch_one("SELECT min(loan_id), max(loan_id) FROM loans")
+
+    def assess_overdue(self, first, last, as_of, fine_per_day, fine_cap):
+        params = {"first": first, "last": last, "as_of": as_of, "per_day": fine_per_day, "cap": fine_cap}
+        with connection() as conn, conn.cursor() as cur:
+            # one reload notification per chunk instead of one per loan
+            cur.execute("SET LOCAL library.bulk_write = on")
+            cur.execute("""
+                UPDATE loans SET status = 'overdue'
+                WHERE loan_id BETWEEN %(first)s AND %(last)s AND status = 'borrowed' AND due_date < %(as_of)s
+            """, params)
+            marked = cur.rowcount
+            # fines that come out the same are left alone, so a rerun writes
+            # only what changed: open loans a day later, loans returned since
+            cur.execute("""
+                INSERT INTO fines (loan_id, member_id, days_late, amount, final, assessed_on)
+                SELECT loan_id, member_id, days_late,
+                       least(days_late * %(per_day)s::numeric, %(cap)s::numeric), return_date IS NOT NULL, %(as_of)s
+                FROM (SELECT loan_id, member_id, return_date,
+                             COALESCE(return_date, %(as_of)s::date) - due_date AS days_late
+                      FROM loans
+                      WHERE loan_id BETWEEN %(first)s AND %(last)s
+                        AND due_date < COALESCE(return_date, %(as_of)s::date)) late
+                ON CONFLICT (loan_id) DO UPDATE
+                    SET days_late = EXCLUDED.days_late, amount = EXCLUDED.amount,
+                        final = EXCLUDED.final, assessed_on = EXCLUDED.assessed_on
+                    WHERE (fines.days_late, fines.amount, fines.final)
+                          IS DISTINCT FROM (EXCLUDED.days_late, EXCLUDED.amount, EXCLUDED.final)
+            """, params)
+            fined = cur.rowcount
+            if marked:
+                self._notify_reload(cur, "loans")
+            conn.commit()
+        return marked, fined
+
+    def fine_totals(self):
+        return self._fetch_one("""
+            SELECT count(DISTINCT member_id), count(*) FILTER (WHERE NOT final), count(*), COALESCE(sum(amount), 0)
+            FROM fines
+        """)
+
+    def member_fines(self, limit):
+        return self._fetch_all("""
+            SELECT f.member_id, COALESCE(m.full_name, u.username) AS member_name,
+                   f.overdue_loans, f.fined_loans, f.days_late, f.amount
+            FROM (SELECT member_id, count(*) FILTER (WHERE NOT final) AS overdue_loans, count(*) AS fined_loans,
+                         sum(days_late) AS days_late, sum(amount) AS amount
+                  FROM fines
+                  GROUP BY member_id
+                  ORDER BY amount DESC, member_id
+                  LIMIT %s) f
+            JOIN members m ON m.member_id = f.member_id
+            LEFT JOIN users u ON u.user_id = m.user_id
+            ORDER BY f.amount DESC, f.member_id
+        """, (limit,))
+
+    # ---- statistics ----
+    def circulation_totals(self):
+        return self._fetch_one("""SELECT COALESCE(sum(active_loans), 0), COALESCE(sum(overdue_loans), 0)
+                                  FROM circulation_totals""")
+
+    def daily_circulation(self, since):
+        return self._fetch_all("""
+            SELECT day, sum(loans), sum(returns) FROM circulation_daily
+            WHERE day >= %s
+            GROUP BY day
+            ORDER BY day
+        """, (since,))
+
+    def top_books(self, limit):
+        return self._fetch_all("""
+            SELECT b.book_id, b.title, bl.loans
+            FROM (SELECT book_id, loans FROM book_loans ORDER BY loans DESC, book_id LIMIT %s) bl
+            JOIN books b ON b.book_id = bl.book_id
+            ORDER BY bl.loans DESC, bl.book_id
+        """, (limit,))
+
+    def top_categories(self, limit):
+        return self._fetch_all("""
+            SELECT category, sum(loans) AS loans FROM category_loans
+            GROUP BY category
+            ORDER BY loans DESC, category
+            LIMIT %s
+        """, (limit,))
+
+    def largest_clubs(self, limit):
+        return self._fetch_all("""
+            SELECT bc.club_id, bc.name, cs.members
+            FROM club_sizes cs
+            JOIN book_clubs bc ON bc.club_id = cs.club_id
+            WHERE cs.members > 0
+            ORDER BY cs.members DESC, cs.club_id
+            LIMIT %s
+        """, (limit,))
+
+    # ---- recommendations ----
+    def queue_recommendations(self, history, rebuild):
+        with connection() as conn, conn.cursor() as cur:
+            # one run at a time; a second one waits here and finds little left to do
+            cur.execute("SELECT last_loan_id FROM recommender_state FOR UPDATE")
+            mark = 0 if rebuild else cur.fetchone()[0]
+            if rebuild:
+                cur.execute("INSERT INTO recommender_queue SELECT DISTINCT book_id FROM book_neighbours "
+                            "ON CONFLICT DO NOTHING")
+            cur.execute("SELECT COALESCE(max(loan_id), 0) FROM loans")
+            upto = cur.fetchone()[0]
+            cur.execute("""CREATE TEMP TABLE recommender_members ON COMMIT DROP AS
+                           SELECT DISTINCT member_id FROM loans WHERE loan_id > %s AND loan_id <= %s""",
+                        (mark, upto))
+            # the books leaving the baskets and those coming in both change
+            queue_baskets = """
+                INSERT INTO recommender_queue
+                SELECT DISTINCT book_id FROM recommender_baskets
+                WHERE member_id IN (SELECT member_id FROM recommender_members)
+                ON CONFLICT DO NOTHING
+            """
+            cur.execute(queue_baskets)
+            cur.execute("DELETE FROM recommender_baskets WHERE member_id IN (SELECT member_id FROM recommender_members)")
+            cur.execute("""
+                INSERT INTO recommender_baskets (member_id, book_id)
+                SELECT member_id, book_id
+                FROM (SELECT member_id, book_id,
+                             row_number() OVER (PARTITION BY member_id ORDER BY max(loan_id) DESC) AS n
+                      FROM loans
+                      WHERE member_id IN (SELECT member_id FROM recommender_members)
+                      GROUP BY member_id, book_id) recent
+                WHERE n <= %s
+            """, (history,))
+            cur.execute(queue_baskets)
+            cur.execute("DELETE FROM book_borrowers WHERE book_id IN (SELECT book_id FROM recommender_queue)")
+            cur.execute("""
+                INSERT INTO book_borrowers (book_id, members)
+                SELECT book_id, count(*) FROM recommender_baskets
+                WHERE book_id IN (SELECT book_id FROM recommender_queue)
+                GROUP BY book_id
+            """)
+            cur.execute("UPDATE recommender_state SET last_loan_id = %s", (upto,))
+            cur.execute("SELECT count(*) FROM recommender_queue")
+            queued = cur.fetchone()[0]
+            conn.commit()
+        return queued
+
+    def rank_recommendations(self, limit, top, min_together):
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                DELETE FROM recommender_queue
+                WHERE book_id IN (SELECT book_id FROM recommender_queue ORDER BY book_id LIMIT %s
+                                  FOR UPDATE SKIP LOCKED)
+                RETURNING book_id
+            """, (limit,))
+            batch = [row[0] for row in cur.fetchall()]
+            if batch:
+                cur.execute("DELETE FROM book_neighbours WHERE book_id = ANY(%s)", (batch,))
+                cur.execute("""
+                    INSERT INTO book_neighbours (book_id, rank, neighbour_id, score)
+                    SELECT book_id, rank, neighbour_id, score
+                    FROM (SELECT p.book_id, p.neighbour_id, p.together / sqrt(ba.members::float8 * bb.members) AS score,
+                                 row_number() OVER (PARTITION BY p.book_id
+                                                    ORDER BY p.together / sqrt(ba.members::float8 * bb.members) DESC,
+                                                             p.neighbour_id) AS rank
+                          FROM (SELECT a.book_id, b.book_id AS neighbour_id, count(*) AS together
+                                FROM unnest(%(batch)s::integer[]) AS q (book_id)
+                                JOIN recommender_baskets a ON a.book_id = q.book_id
+                                JOIN recommender_baskets b ON b.member_id = a.member_id AND b.book_id <> a.book_id
+                                GROUP BY a.book_id, b.book_id
+                                HAVING count(*) >= %(min_together)s) p
+                          JOIN book_borrowers ba ON ba.book_id = p.book_id
+                          JOIN book_borrowers bb ON bb.book_id = p.neighbour_id) ranked
+                    WHERE rank <= %(top)s
+                """, {"batch": batch, "top": top, "min_together": min_together})
+            conn.commit()
+        return len(batch)
+
+    def similar_books(self, book_id, limit):
+        return self._fetch_all("""
+            SELECT b.book_id, b.title, b.category, b.copies_available, n.score
+            FROM book_neighbours n
+            JOIN books b ON b.book_id = n.neighbour_id
+            WHERE n.book_id = %s
+            ORDER BY n.rank
+            LIMIT %s
+        """, (book_id, limit))
+
+    # ---- book clubs ----
+    def clubs(self):
+        return self._fetch_all("SELECT club_id, name, description FROM book_clubs ORDER BY name")
+
+    def club_members(self, club_id):
+        return self._fetch_all("""
+            SELECT m.member_id, m.full_name, u.username
+            FROM club_members cm
+            JOIN members m ON cm.member_id = m.member_id
+            LEFT JOIN users u ON m.user_id = u.user_id
+            WHERE cm.club_id = %s
+            ORDER BY m.full_name
+        """, (club_id,))
+
+    def member_clubs(self, member_id):
+        return self._fetch_all("""
+            SELECT bc.club_id, bc.name
+            FROM club_members cm
+            JOIN book_clubs bc ON cm.club_id = bc.club_id
+            WHERE cm.member_id = %s
+            ORDER BY bc.name
+        """, (member_id,))
+
+    def create_club(self, name, description):
+        return self._write("""INSERT INTO book_clubs (name, description) VALUES (%s, %s)
+                              RETURNING club_id, name, description""", (name, description), "book_clubs")
+
+    def delete_club(self, club_id):
+        return self._write("DELETE FROM book_clubs WHERE club_id=%s RETURNING club_id", (club_id,),
+                           "book_clubs", delete=True)
+
+    def join_club(self, member_id, club_id):
+        return self._write("""
+            WITH ins AS (
+                INSERT INTO club_members (member_id, club_id) VALUES (%s, %s)
+                ON CONFLICT (club_id, member_id) DO NOTHING
+                RETURNING club_id, member_id
+            )
+            SELECT ins.club_id, ins.member_id, m.full_name, u.username
+            FROM ins
+            LEFT JOIN members m ON m.member_id = ins.member_id
+            LEFT JOIN users u ON u.user_id = m.user_id
+        """, (member_id, club_id), "club_members")
+
+    def leave_club(self, member_id, club_id):
+        return self._write("DELETE FROM club_members WHERE member_id=%s AND club_id=%s RETURNING club_id, member_id",
+                           (member_id, club_id), "club_members", delete=True)
+
+    def member_id_range(self):
+        return self._fetch_one("SELECT min(member_id), max(member_id) FROM members")
+
+    def profile_readers(self, first, last, categories):
+        params = {"first": first, "last": last, "categories": categories}
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM reader_categories WHERE member_id BETWEEN %(first)s AND %(last)s", params)
+            cur.execute("""
+                INSERT INTO reader_categories (member_id, category, weight)
+                SELECT member_id, category, loans / sqrt(sum(loans * loans) OVER (PARTITION BY member_id))
+                FROM (SELECT member_id, category, loans,
+                             row_number() OVER (PARTITION BY member_id ORDER BY loans DESC, category) AS n
+                      FROM (SELECT l.member_id, b.category, count(*) AS loans
+                            FROM loans l
+                            JOIN books b ON b.book_id = l.book_id
+                            WHERE l.member_id BETWEEN %(first)s AND %(last)s AND b.category <> ''
+                            GROUP BY l.member_id, b.category) counted) ranked
+                WHERE n <= %(categories)s
+            """, params)
+            cur.execute("""SELECT count(DISTINCT member_id) FROM reader_categories
+                           WHERE member_id BETWEEN %(first)s AND %(last)s""", params)
+            profiled = cur.fetchone()[0]
+            conn.commit()
+        return profiled
+
+    def profile_clubs(self):
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM club_categories")
+            cur.execute("""
+                INSERT INTO club_categories (category, club_id, weight)
+                SELECT category, club_id, weight / sqrt(sum(weight * weight) OVER (PARTITION BY club_id))
+                FROM (SELECT cm.club_id, rc.category, sum(rc.weight) AS weight
+                      FROM club_members cm
+                      JOIN reader_categories rc ON rc.member_id = cm.member_id
+                      GROUP BY cm.club_id, rc.category) summed
+            """)
+            cur.execute("SELECT count(DISTINCT club_id) FROM club_categories")
+            profiled = cur.fetchone()[0]
+            conn.commit()
+        return profiled
+
+    def suggest_clubs(self, first, last, top):
+        params = {"first": first, "last": last, "top": top}
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM club_suggestions WHERE member_id BETWEEN %(first)s AND %(last)s", params)
+            cur.execute("""
+                INSERT INTO club_suggestions (member_id, rank, club_id, score)
+                SELECT member_id, rank, club_id, score
+                FROM (SELECT member_id, club_id, score,
+                             row_number() OVER (PARTITION BY member_id ORDER BY score DESC, club_id) AS rank
+                      FROM (SELECT rc.member_id, cc.club_id, sum(rc.weight * cc.weight) AS score
+                            FROM reader_categories rc
+                            JOIN club_categories cc ON cc.category = rc.category
+                            WHERE rc.member_id BETWEEN %(first)s AND %(last)s
+                            GROUP BY rc.member_id, cc.club_id) scored
+                      WHERE NOT EXISTS (SELECT 1 FROM club_members cm
+                                        WHERE cm.club_id = scored.club_id AND cm.member_id = scored.member_id)) ranked
+                WHERE rank <= %(top)s
+            """, params)
+            cur.execute("""SELECT count(*) FROM club_suggestions
+                           WHERE member_id BETWEEN %(first)s AND %(last)s AND rank = 1""", params)
+            suggested = cur.fetchone()[0]
+            conn.commit()
+        return suggested
+
+    def suggested_clubs(self, member_id):
+        return self._fetch_all("""
+            SELECT bc.club_id, bc.name, bc.description, s.score
+            FROM club_suggestions s
+            JOIN book_clubs bc ON bc.club_id = s.club_id
+            WHERE s.member_id = %s
+              AND NOT EXISTS (SELECT 1 FROM club_members cm WHERE cm.club_id = s.club_id AND cm.member_id = s.member_id)
+            ORDER BY s.rank
+        """, (member_id,))
+
+    # ---- reports and tooling ----
+    def bulk_load(self, table, columns, rows):
+        loaded = [0]
+
+        def counted():
+            for row in rows:
+                loaded[0] += 1
+                yield row
+
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("SET LOCAL library.bulk_write = on")
+            cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                            _CopySource(counted()), size=1 << 16)
+            # rows came with their ids; move the serial past them
+            cur.execute("SELECT pg_get_serial_sequence(%s, %s)", (table, columns[0]))
+            sequence = cur.fetchone()[0]
+            if sequence is not None:
+                cur.execute(f"SELECT setval(%s, (SELECT max({columns[0]}) FROM {table}))", (sequence,))
+            cur.execute(f"ANALYZE {table}")
+            self._notify_reload(cur, table)
+            conn.commit()
+        return loaded[0]
+
+    def stream_query(self, sql, itersize):
+        # Rows come off a named (server-side) cursor `itersize` at a time. The
+        # pooled connection is held until the generator is exhausted or closed.
+        with connection(read_only=True) as conn:
+            with conn.cursor(name="export_stream") as cur:
+                cur.itersize = itersize
+                cur.execute(sql)
+                first = next(cur, None)
+                yield [d[0] for d in cur.description]
+                if first is not None:
+                    yield first
+                    yield from cur
+
+    def estimate_rows(self, table):
+        # planner estimate, no table scan
+        row = self._fetch_one("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+        return max(row[0], 0) if row and row[0] is not None else 0
+
+    # ---- live updates ----
+    def change_feed(self):
+        return _ChangeFeed()
+
+    def _notify_reload(self, cur, table):
+        # one notification for a bulk write, which the per-row triggers skipped
+        cur.execute("SELECT pg_notify(%s, %s)", (CHANGE_CHANNEL, json.dumps({"table": table, "op": "reload"})))
@@ -0,0 +1,41 @@
+from database.backend import get_backend
+
+# "Members who borrowed this also borrowed". Every member has a basket: the
+# distinct books of their `history` most recent loans. Two books are similar
+# when the same baskets hold them, scored by cosine -- baskets holding both /
+# sqrt(baskets holding one * baskets holding the other) -- so a bestseller is
+# not everybody's neighbour. The `top` neighbours of every book are stored, and
+# looking them up when a book is selected is one index range.
+#
+# refresh() is incremental: the baskets of members who borrowed since the last
+# run are rebuilt and only the books going in or out of them are re-ranked, in
+# transactions of `chunk` books, so an interrupted run carries on where it
+# stopped. Capping the baskets keeps the work per book bounded however long
+# the loan history gets. rebuild=True recounts every loan, e.g. after the
+# settings change. Run it nightly (tools/refresh_recommendations.py).
+RECOMMENDER_CONFIG = {
+    'history': 50,       # loans per member's basket
+    'top': 10,           # neighbours kept per book
+    'min_together': 2,   # baskets two books must share to be neighbours
+    'chunk': 500,        # books re-ranked per transaction
+}
+
+
+def refresh(rebuild=False, progress=None):
+    # progress(done, queued) is called after every chunk. Returns the number of
+    # books re-ranked.
+    db = get_backend()
+    queued = db.queue_recommendations(RECOMMENDER_CONFIG['history'], rebuild)
+    done = 0
+    while True:
+        n = db.rank_recommendations(RECOMMENDER_CONFIG['chunk'], RECOMMENDER_CONFIG['top'],
+                                    RECOMMENDER_CONFIG['min_together'])
+        if not n:
+            return done
+        done += n
+        if progress:
+            progress(done, queued)
+
+
+def similar_books(book_id, limit=None):
+    return get_backend().similar_books(book_id, limit or RECOMMENDER_CONFIG['top'])
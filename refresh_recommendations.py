@@ -0,0 +1,31 @@
+# tools/refresh_recommendations.py
+# Brings the "members who borrowed this also borrowed" lists up to date with
+# the loans made since the last run (see models/recommendations.py). Meant to
+# run nightly, after tools/overdue_job.py; --rebuild recounts every loan:
+#
+#   30 0 * * *  cd /srv/library && python -m tools.refresh_recommendations
+#   python -m tools.refresh_recommendations --rebuild
+import argparse
+import sys
+import time
+
+from models.recommendations import refresh
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Refresh book recommendations")
+    parser.add_argument("--rebuild", action="store_true", help="recount every loan instead of the new ones")
+    args = parser.parse_args(argv)
+
+    def progress(done, queued):
+        print(f"\r{done}/{queued} books ranked", end="", file=sys.stderr)
+
+    start = time.monotonic()
+    done = refresh(args.rebuild, progress=progress)
+    print(file=sys.stderr)
+    print(f"{done} books ranked in {time.monotonic() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import threading
+import weakref
+
+from database.backend import get_backend
+from models.book import Book
+from models.book_club import BookClub
+from models.member import Member
+from models.search import RESULT_LIMIT, search_books
+
+
+class Repository:
+    """Model objects for one session, hydrated from backend rows.
+
+    Every read turns its rows into slotted model instances in a single pass, and
+    an identity map keeps one instance per primary key: a book on the catalogue
+    page, in search results and in a write's ChangeSet is the same object. A
+    partial read (e.g. the member-facing catalogue columns) fills in just those
+    attributes. Instances are held weakly, so once no view shows one it is gone.
+
+    Reads run on worker threads, so the map is guarded by a lock.
+    """
+
+    MODELS = (Book, Member, BookClub)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._identity = {cls: weakref.WeakValueDictionary() for cls in self.MODELS}
+
+    def hydrate(self, cls, rows, columns):
+        columns = tuple(columns)
+        k = columns.index(cls.KEY)
+        identity = self._identity[cls]
+        objects = []
+        with self._lock:
+            for row in rows:
+                obj = identity.get(row[k])
+                if obj is None:
+                    obj = cls(**dict(zip(columns, row)))
+                    identity[row[k]] = obj
+                else:
+                    for name, value in zip(columns, row):
+                        setattr(obj, name, value)
+                objects.append(obj)
+        return objects
+
+    def record(self, cls, values):
+        # the instance for a dict of column -> value, e.g. a new row from a ChangeSet
+        columns = [c for c in values if c in cls.__slots__]
+        return self.hydrate(cls, [tuple(values[c] for c in columns)], columns)[0]
+
+    def get(self, cls, key):
+        return self._identity[cls].get(key)
+
+    def apply(self, changes):
+        # Brings the instances already in memory up to date with a write. New
+        # rows are left to the views that want them (see RowTableModel.patch).
+        with self._lock:
+            for cls in self.MODELS:
+                identity = self._identity[cls]
+                for row in changes.upserted(cls.TABLE):
+                    obj = identity.get(row.get(cls.KEY))
+                    if obj is not None:
+                        for name, value in row.items():
+                            if name in cls.__slots__:
+                                setattr(obj, name, value)
+                for row in changes.deleted(cls.TABLE):
+                    identity.pop(row.get(cls.KEY), None)
+
+    def __len__(self):
+        return sum(len(identity) for identity in self._identity.values())
+
+    # ---- reads ----
+    def books_page(self, after=None, limit=Book.PAGE_SIZE, columns=Book.CATALOGUE_COLUMNS):
+        rows, next_key = Book.page(after, limit, columns)
+        return self.hydrate(Book, rows, columns), next_key
+
+    def search_books(self, text, columns=Book.CATALOGUE_COLUMNS, limit=RESULT_LIMIT):
+        return self.hydrate(Book, search_books(text, columns, limit), columns)
+
+    def members(self):
+        return self.hydrate(Member, get_backend().members(), Member.DIRECTORY_COLUMNS)
+
+    def club_members(self, club_id):
+        return self.hydrate(Member, get_backend().club_members(club_id), Member.CLUB_COLUMNS)
+
+    def clubs(self):
+        return self.hydrate(BookClub, get_backend().clubs(), BookClub.COLUMNS)
+
+    def member_clubs(self, member_id):
+        return self.hydrate(BookClub, get_backend().member_clubs(member_id), BookClub.MEMBERSHIP_COLUMNS)
@@ -0,0 +1,95 @@
+# gui/scan_batch_dialog.py
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QListWidget, QPushButton, QMessageBox
+)
+from database.backend import split_scans
+from models.changes import ChangeSet
+from models.member import Member
+
+
+class ScanBatchDialog(QDialog):
+    # Collects a stream of barcode scans (keyboard-wedge scanners type the code and
+    # press Enter) and applies the whole queue as one borrow or return batch.
+    def __init__(self, member_id, mode="borrow", parent=None):
+        super().__init__(parent)
+        self.member_id = member_id
+        self.mode = mode
+        self.changes = ChangeSet()  # everything applied so far, for the caller to patch its views
+        self.setWindowTitle("Scan to Borrow" if mode == "borrow" else "Scan to Return")
+        self.setFixedSize(420, 480)
+
+        layout = QVBoxLayout()
+        layout.addWidget(QLabel("Scan or type an ISBN or book number and press Enter:"))
+        self.scan_input = QLineEdit()
+        self.scan_input.returnPressed.connect(self.queue_scan)
+        layout.addWidget(self.scan_input)
+
+        self.queue_list = QListWidget()
+        layout.addWidget(self.queue_list)
+        self.count_label = QLabel()
+        layout.addWidget(self.count_label)
+
+        btn_h = QHBoxLayout()
+        remove_btn = QPushButton("Remove Selected"); remove_btn.clicked.connect(self.remove_selected)
+        clear_btn = QPushButton("Clear"); clear_btn.clicked.connect(self.clear_queue)
+        self.process_btn = QPushButton("Borrow All" if mode == "borrow" else "Return All")
+        self.process_btn.clicked.connect(self.process_batch)
+        btn_h.addWidget(remove_btn); btn_h.addWidget(clear_btn); btn_h.addWidget(self.process_btn)
+        layout.addLayout(btn_h)
+        self.setLayout(layout)
+
+        self.update_count()
+        self.scan_input.setFocus()
+
+    def queue_scan(self):
+        code = self.scan_input.text().strip()
+        self.scan_input.clear()
+        if code:
+            self.queue_list.addItem(code)
+            self.queue_list.scrollToBottom()
+            self.update_count()
+
+    def remove_selected(self):
+        for item in self.queue_list.selectedItems():
+            self.queue_list.takeItem(self.queue_list.row(item))
+        self.update_count()
+
+    def clear_queue(self):
+        self.queue_list.clear()
+        self.update_count()
+
+    def update_count(self):
+        n = self.queue_list.count()
+        self.count_label.setText(f"{n} item(s) queued")
+        self.process_btn.setEnabled(n > 0)
+
+    def process_batch(self):
+        isbns, book_ids = split_scans(self.queue_list.item(i).text() for i in range(self.queue_list.count()))
+        try:
+            if self.mode == "borrow":
+                code, changes, rejects = Member.borrow_many(self.member_id, isbns=isbns, book_ids=book_ids)
+                if code == Member.BORROW_LIMIT_REACHED:
+                    QMessageBox.warning(self, "Error", Member.BORROW_MESSAGES[code])
+                    return
+                reasons = Member.BORROW_MESSAGES
+                done = f"{len(changes.upserted('loans'))} book(s) borrowed."
+            else:
+                changes, rejects = Member.return_many(self.member_id, isbns=isbns, book_ids=book_ids)
+                reasons = {Member.RETURN_NOT_ON_LOAN: "Not on loan to this member"}
+                done = f"{len(changes.upserted('loans'))} book(s) returned."
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Batch failed:\n{e}")
+            return
+
+        self.changes.merge(changes)
+        self.queue_list.clear()
+        for value, reason in rejects:
+            # keep rejected scans queued so they can be fixed and retried
+            self.queue_list.addItem(f"{value}")
+        self.update_count()
+        if rejects:
+            details = "\n".join(f"{value}: {reasons.get(reason, reason)}" for value, reason in rejects)
+            QMessageBox.warning(self, "Batch Processed", f"{done}\n\nNot processed:\n{details}")
+        else:
+            QMessageBox.information(self, "Success", done)
+            self.accept()
@@ -0,0 +1,874 @@
+# database/schema.py
+# Versioned schema for the library database. Migrations run once each, in
+# order, every one in its own transaction; applied versions are recorded in
+# schema_migrations. Run at application start-up, or by hand:
+#
+#   python -m database.schema                # apply pending migrations
+#   python -m database.schema --status       # list applied / pending versions
+#   python -m database.schema --check-plans  # fail if a hot query seq-scans
+import argparse
+import json
+import sys
+import uuid
+
+from database.database import connection
+
+MIGRATIONS = [
+    (1, "base tables", """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id   serial PRIMARY KEY,
+            username  text NOT NULL,
+            password  text NOT NULL,
+            role      text NOT NULL DEFAULT 'member'
+        );
+        CREATE TABLE IF NOT EXISTS members (
+            member_id serial PRIMARY KEY,
+            user_id   integer REFERENCES users (user_id),
+            full_name text,
+            join_date date NOT NULL DEFAULT CURRENT_DATE
+        );
+        CREATE TABLE IF NOT EXISTS authors (
+            author_id serial PRIMARY KEY,
+            name      text NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS books (
+            book_id          serial PRIMARY KEY,
+            title            text NOT NULL,
+            isbn             text,
+            author_id        integer,
+            category         text,
+            copies_total     integer NOT NULL DEFAULT 1,
+            copies_available integer NOT NULL DEFAULT 1 CHECK (copies_available >= 0)
+        );
+        CREATE TABLE IF NOT EXISTS loans (
+            loan_id     serial PRIMARY KEY,
+            book_id     integer NOT NULL REFERENCES books (book_id),
+            member_id   integer NOT NULL REFERENCES members (member_id),
+            loan_date   date NOT NULL DEFAULT CURRENT_DATE,
+            due_date    date,
+            return_date date,
+            status      text NOT NULL DEFAULT 'borrowed'
+        );
+        CREATE TABLE IF NOT EXISTS book_clubs (
+            club_id     serial PRIMARY KEY,
+            name        text NOT NULL,
+            description text
+        );
+        CREATE TABLE IF NOT EXISTS club_members (
+            club_id   integer NOT NULL REFERENCES book_clubs (club_id) ON DELETE CASCADE,
+            member_id integer NOT NULL REFERENCES members (member_id) ON DELETE CASCADE
+        );
+    """),
+    (2, "hot query indexes and unique keys", """
+        -- joins used to be guarded by SELECT-then-INSERT, which races; keep the
+        -- first row of any duplicate before the unique index makes them impossible
+        DELETE FROM club_members a USING club_members b
+         WHERE a.club_id = b.club_id AND a.member_id = b.member_id AND a.ctid > b.ctid;
+        CREATE UNIQUE INDEX IF NOT EXISTS club_members_club_member_key ON club_members (club_id, member_id);
+        CREATE INDEX IF NOT EXISTS club_members_member_idx ON club_members (member_id);
+        CREATE UNIQUE INDEX IF NOT EXISTS users_username_key ON users (username);
+        CREATE UNIQUE INDEX IF NOT EXISTS members_user_key ON members (user_id);
+        CREATE INDEX IF NOT EXISTS loans_member_status_idx ON loans (member_id, status);
+        CREATE INDEX IF NOT EXISTS loans_loan_date_idx ON loans (loan_date DESC);
+        CREATE INDEX IF NOT EXISTS loans_book_idx ON loans (book_id);
+        CREATE INDEX IF NOT EXISTS books_title_key_idx ON books (title, book_id);
+    """),
+    (3, "atomic borrow function", """
+        -- single round-trip borrow, see Member.borrow(). The member row lock
+        -- serialises concurrent borrows by the same member; the conditional
+        -- UPDATE keeps copies_available from going negative. Besides the result
+        -- code it hands back the new loan and the book's remaining copies.
+        -- dropped from the schema being built only: check_plans() builds one
+        -- beside public, and an unqualified name would find public's
+        DO $$ BEGIN
+            EXECUTE format('DROP FUNCTION IF EXISTS %I.library_borrow(integer, integer, integer)', current_schema());
+        END $$;
+        CREATE FUNCTION library_borrow(p_member_id integer, p_book_id integer, p_max_loans integer,
+                                       OUT result text, OUT new_loan_id integer,
+                                       OUT new_loan_date date, OUT new_due_date date,
+                                       OUT book_title text, OUT available integer)
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            v_active integer;
+        BEGIN
+            PERFORM 1 FROM members WHERE member_id = p_member_id FOR UPDATE;
+            IF NOT FOUND THEN
+                result := 'no_member';
+                RETURN;
+            END IF;
+
+            SELECT count(*) INTO v_active FROM loans WHERE member_id = p_member_id AND status = 'borrowed';
+            IF v_active >= p_max_loans THEN
+                result := 'limit_reached';
+                RETURN;
+            END IF;
+
+            UPDATE books SET copies_available = copies_available - 1
+             WHERE book_id = p_book_id AND copies_available > 0
+            RETURNING books.title, books.copies_available INTO book_title, available;
+            IF NOT FOUND THEN
+                SELECT b.title, b.copies_available INTO book_title, available FROM books b WHERE b.book_id = p_book_id;
+                IF FOUND THEN
+                    result := 'no_copies';
+                ELSE
+                    result := 'no_book';
+                END IF;
+                RETURN;
+            END IF;
+
+            INSERT INTO loans (book_id, member_id, due_date, status)
+            VALUES (p_book_id, p_member_id, CURRENT_DATE + 14, 'borrowed')
+            RETURNING loans.loan_id, loans.loan_date, loans.due_date INTO new_loan_id, new_loan_date, new_due_date;
+            result := 'ok';
+        END
+        $$;
+    """),
+    (4, "catalogue search", """
+        -- see PostgresBackend.search_books: weighted full-text vector over title and
+        -- category, trigram indexes for typo-tolerant title/author matching and
+        -- a pattern index for ISBN prefixes
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        ALTER TABLE books ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(category, '')), 'C')
+            ) STORED;
+        CREATE INDEX IF NOT EXISTS books_search_vector_idx ON books USING gin (search_vector);
+        CREATE INDEX IF NOT EXISTS books_title_trgm_idx ON books USING gin (title gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS books_isbn_prefix_idx ON books (isbn text_pattern_ops);
+        CREATE INDEX IF NOT EXISTS authors_name_trgm_idx ON authors USING gin (name gin_trgm_ops);
+    """),
+    (5, "catalogue change tracking", """
+        -- see CatalogueCache: every insert or update of a book takes a new
+        -- version number and a deletion leaves a tombstone, so a reader can ask
+        -- for what changed since the version it last saw
+        CREATE SEQUENCE IF NOT EXISTS books_version_seq;
+        ALTER TABLE books ADD COLUMN IF NOT EXISTS version bigint NOT NULL DEFAULT nextval('books_version_seq');
+        CREATE INDEX IF NOT EXISTS books_version_idx ON books (version);
+        CREATE TABLE IF NOT EXISTS deleted_books (
+            book_id integer PRIMARY KEY,
+            version bigint NOT NULL DEFAULT nextval('books_version_seq')
+        );
+        CREATE INDEX IF NOT EXISTS deleted_books_version_idx ON deleted_books (version);
+
+        CREATE OR REPLACE FUNCTION books_touch_version() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.version := nextval('books_version_seq');
+            RETURN NEW;
+        END
+        $$;
+        DROP TRIGGER IF EXISTS books_touch_version ON books;
+        CREATE TRIGGER books_touch_version BEFORE UPDATE ON books
+            FOR EACH ROW EXECUTE FUNCTION books_touch_version();
+
+        CREATE OR REPLACE FUNCTION books_record_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO deleted_books (book_id) VALUES (OLD.book_id)
+            ON CONFLICT (book_id) DO UPDATE SET version = nextval('books_version_seq');
+            RETURN OLD;
+        END
+        $$;
+        DROP TRIGGER IF EXISTS books_record_delete ON books;
+        CREATE TRIGGER books_record_delete AFTER DELETE ON books
+            FOR EACH ROW EXECUTE FUNCTION books_record_delete();
+    """),
+    (6, "change notifications", """
+        -- every committed change to a row the desks display is announced on the
+        -- library_changes channel as {"table", "op": "upsert"|"delete", "row"},
+        -- the row in the shape the write's ChangeSet has (see PostgresBackend.
+        -- change_feed). Bulk writes set library.bulk_write and announce a single
+        -- {"table", "op": "reload"} instead of a notification per row.
+        CREATE OR REPLACE FUNCTION library_notify_change() RETURNS trigger LANGUAGE plpgsql AS $$
+        DECLARE
+            r record;
+            payload jsonb;
+        BEGIN
+            IF current_setting('library.bulk_write', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP = 'DELETE' THEN
+                r := OLD;
+            ELSE
+                r := NEW;
+            END IF;
+            IF TG_TABLE_NAME = 'books' THEN
+                payload := jsonb_build_object('book_id', r.book_id);
+                IF TG_OP <> 'DELETE' THEN
+                    payload := payload || jsonb_build_object(
+                        'title', r.title, 'isbn', r.isbn, 'author_id', r.author_id, 'category', r.category,
+                        'copies_total', r.copies_total, 'copies_available', r.copies_available);
+                END IF;
+            ELSIF TG_TABLE_NAME = 'loans' THEN
+                payload := jsonb_build_object(
+                    'loan_id', r.loan_id, 'book_id', r.book_id, 'member_id', r.member_id,
+                    'loan_date', r.loan_date, 'due_date', r.due_date, 'return_date', r.return_date,
+                    'status', r.status, 'title', (SELECT title FROM books WHERE book_id = r.book_id));
+            ELSIF TG_TABLE_NAME = 'club_members' THEN
+                payload := jsonb_build_object('club_id', r.club_id, 'member_id', r.member_id);
+                IF TG_OP <> 'DELETE' THEN
+                    payload := payload || (SELECT jsonb_build_object('full_name', m.full_name, 'username', u.username)
+                                           FROM members m LEFT JOIN users u ON u.user_id = m.user_id
+                                           WHERE m.member_id = r.member_id);
+                END IF;
+            ELSIF TG_TABLE_NAME = 'book_clubs' THEN
+                payload := jsonb_build_object('club_id', r.club_id);
+                IF TG_OP <> 'DELETE' THEN
+                    payload := payload || jsonb_build_object('name', r.name, 'description', r.description);
+                END IF;
+            END IF;
+            PERFORM pg_notify('library_changes', jsonb_build_object(
+                'table', TG_TABLE_NAME,
+                'op', CASE WHEN TG_OP = 'DELETE' THEN 'delete' ELSE 'upsert' END,
+                'row', payload)::text);
+            RETURN NULL;
+        END
+        $$;
+        DROP TRIGGER IF EXISTS books_notify_change ON books;
+        CREATE TRIGGER books_notify_change AFTER INSERT OR UPDATE OR DELETE ON books
+            FOR EACH ROW EXECUTE FUNCTION library_notify_change();
+        DROP TRIGGER IF EXISTS loans_notify_change ON loans;
+        CREATE TRIGGER loans_notify_change AFTER INSERT OR UPDATE OR DELETE ON loans
+            FOR EACH ROW EXECUTE FUNCTION library_notify_change();
+        DROP TRIGGER IF EXISTS club_members_notify_change ON club_members;
+        CREATE TRIGGER club_members_notify_change AFTER INSERT OR UPDATE OR DELETE ON club_members
+            FOR EACH ROW EXECUTE FUNCTION library_notify_change();
+        DROP TRIGGER IF EXISTS book_clubs_notify_change ON book_clubs;
+        CREATE TRIGGER book_clubs_notify_change AFTER INSERT OR UPDATE OR DELETE ON book_clubs
+            FOR EACH ROW EXECUTE FUNCTION library_notify_change();
+    """),
+    (7, "overdue loans and fines", """
+        -- see models/fines.py: the overdue job marks loans still out past their
+        -- due date 'overdue' and keeps one fine per late loan, recomputed until
+        -- the loan is returned, when it becomes final. Overdue loans still
+        -- count against the loan limit.
+        CREATE TABLE IF NOT EXISTS fines (
+            loan_id     integer PRIMARY KEY REFERENCES loans (loan_id) ON DELETE CASCADE,
+            member_id   integer NOT NULL REFERENCES members (member_id),
+            days_late   integer NOT NULL,
+            amount      numeric(10, 2) NOT NULL,
+            final       boolean NOT NULL DEFAULT false,
+            assessed_on date NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS fines_member_idx ON fines (member_id);
+
+        CREATE OR REPLACE FUNCTION library_borrow(p_member_id integer, p_book_id integer, p_max_loans integer,
+                                                  OUT result text, OUT new_loan_id integer,
+                                                  OUT new_loan_date date, OUT new_due_date date,
+                                                  OUT book_title text, OUT available integer)
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            v_active integer;
+        BEGIN
+            PERFORM 1 FROM members WHERE member_id = p_member_id FOR UPDATE;
+            IF NOT FOUND THEN
+                result := 'no_member';
+                RETURN;
+            END IF;
+
+            SELECT count(*) INTO v_active FROM loans
+             WHERE member_id = p_member_id AND status IN ('borrowed', 'overdue');
+            IF v_active >= p_max_loans THEN
+                result := 'limit_reached';
+                RETURN;
+            END IF;
+
+            UPDATE books SET copies_available = copies_available - 1
+             WHERE book_id = p_book_id AND copies_available > 0
+            RETURNING books.title, books.copies_available INTO book_title, available;
+            IF NOT FOUND THEN
+                SELECT b.title, b.copies_available INTO book_title, available FROM books b WHERE b.book_id = p_book_id;
+                IF FOUND THEN
+                    result := 'no_copies';
+                ELSE
+                    result := 'no_book';
+                END IF;
+                RETURN;
+            END IF;
+
+            INSERT INTO loans (book_id, member_id, due_date, status)
+            VALUES (p_book_id, p_member_id, CURRENT_DATE + 14, 'borrowed')
+            RETURNING loans.loan_id, loans.loan_date, loans.due_date INTO new_loan_id, new_loan_date, new_due_date;
+            result := 'ok';
+        END
+        $$;
+    """),
+    (8, "hold queue", """
+        -- see Member.place_hold: members queue for books with no copy on the
+        -- shelf. A returned copy goes to the first waiting hold -- highest
+        -- priority, then oldest -- and is set aside until ready_until; borrowing
+        -- the book then collects it. holds_queue_idx holds exactly the waiting
+        -- holds in queue order, so the next one for a book is one index probe
+        -- however long its queue.
+        CREATE TABLE IF NOT EXISTS holds (
+            hold_id     serial PRIMARY KEY,
+            book_id     integer NOT NULL REFERENCES books (book_id) ON DELETE CASCADE,
+            member_id   integer NOT NULL REFERENCES members (member_id) ON DELETE CASCADE,
+            priority    integer NOT NULL DEFAULT 0,
+            created_at  timestamptz NOT NULL DEFAULT now(),
+            status      text NOT NULL DEFAULT 'waiting',
+            ready_until date
+        );
+        CREATE INDEX IF NOT EXISTS holds_queue_idx ON holds (book_id, priority DESC, created_at, hold_id)
+            WHERE status = 'waiting';
+        CREATE INDEX IF NOT EXISTS holds_ready_idx ON holds (ready_until) WHERE status = 'ready';
+        CREATE UNIQUE INDEX IF NOT EXISTS holds_member_book_key ON holds (member_id, book_id)
+            WHERE status IN ('waiting', 'ready');
+
+        -- a member borrowing a book set aside for them collects it instead of
+        -- taking a copy off the shelf; collected_hold says which hold that was
+        DO $$ BEGIN
+            EXECUTE format('DROP FUNCTION IF EXISTS %I.library_borrow(integer, integer, integer)', current_schema());
+        END $$;
+        CREATE FUNCTION library_borrow(p_member_id integer, p_book_id integer, p_max_loans integer,
+                                       OUT result text, OUT new_loan_id integer,
+                                       OUT new_loan_date date, OUT new_due_date date,
+                                       OUT book_title text, OUT available integer,
+                                       OUT collected_hold integer)
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            v_active integer;
+        BEGIN
+            PERFORM 1 FROM members WHERE member_id = p_member_id FOR UPDATE;
+            IF NOT FOUND THEN
+                result := 'no_member';
+                RETURN;
+            END IF;
+
+            SELECT count(*) INTO v_active FROM loans
+             WHERE member_id = p_member_id AND status IN ('borrowed', 'overdue');
+            IF v_active >= p_max_loans THEN
+                result := 'limit_reached';
+                RETURN;
+            END IF;
+
+            UPDATE holds SET status = 'collected'
+             WHERE member_id = p_member_id AND book_id = p_book_id AND status = 'ready'
+            RETURNING holds.hold_id INTO collected_hold;
+            IF FOUND THEN
+                SELECT b.title, b.copies_available INTO book_title, available FROM books b WHERE b.book_id = p_book_id;
+            ELSE
+                UPDATE books SET copies_available = copies_available - 1
+                 WHERE book_id = p_book_id AND copies_available > 0
+                RETURNING books.title, books.copies_available INTO book_title, available;
+                IF NOT FOUND THEN
+                    SELECT b.title, b.copies_available INTO book_title, available FROM books b WHERE b.book_id = p_book_id;
+                    IF FOUND THEN
+                        result := 'no_copies';
+                    ELSE
+                        result := 'no_book';
+                    END IF;
+                    RETURN;
+                END IF;
+            END IF;
+
+            INSERT INTO loans (book_id, member_id, due_date, status)
+            VALUES (p_book_id, p_member_id, CURRENT_DATE + 14, 'borrowed')
+            RETURNING loans.loan_id, loans.loan_date, loans.due_date INTO new_loan_id, new_loan_date, new_due_date;
+            result := 'ok';
+        END
+        $$;
+
+        -- announced like the other tables' rows (see migration 6)
+        CREATE OR REPLACE FUNCTION library_notify_hold() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF current_setting('library.bulk_write', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            PERFORM pg_notify('library_changes', jsonb_build_object(
+                'table', 'holds',
+                'op', CASE WHEN TG_OP = 'DELETE' THEN 'delete' ELSE 'upsert' END,
+                'row', CASE WHEN TG_OP = 'DELETE' THEN jsonb_build_object('hold_id', OLD.hold_id, 'member_id', OLD.member_id)
+                            ELSE jsonb_build_object(
+                                'hold_id', NEW.hold_id, 'book_id', NEW.book_id, 'member_id', NEW.member_id,
+                                'status', NEW.status, 'ready_until', NEW.ready_until,
+                                'title', (SELECT title FROM books WHERE book_id = NEW.book_id)) END)::text);
+            RETURN NULL;
+        END
+        $$;
+        DROP TRIGGER IF EXISTS holds_notify_change ON holds;
+        CREATE TRIGGER holds_notify_change AFTER INSERT OR UPDATE OR DELETE ON holds
+            FOR EACH ROW EXECUTE FUNCTION library_notify_hold();
+    """),
+    (9, "circulation statistics", """
+        -- see models/stats.py: running totals behind the librarians' dashboard,
+        -- kept up to date by statement-level triggers that fold each write's
+        -- transition table in with one upsert per table, so reading them costs
+        -- the same whatever the size of loans. Counters every borrow touches
+        -- are split over 8 shards picked by backend pid, which keeps concurrent
+        -- desks off each other's row locks; readers add the shards up. Loans
+        -- per day, per book and per category are history and stay when old
+        -- loans are deleted; the active and overdue totals follow deletes.
+        CREATE TABLE IF NOT EXISTS circulation_totals (
+            shard         smallint PRIMARY KEY,
+            active_loans  bigint NOT NULL DEFAULT 0,
+            overdue_loans bigint NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS circulation_daily (
+            day     date NOT NULL,
+            shard   smallint NOT NULL,
+            loans   integer NOT NULL DEFAULT 0,
+            returns integer NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, shard)
+        );
+        CREATE TABLE IF NOT EXISTS book_loans (
+            book_id integer PRIMARY KEY REFERENCES books (book_id) ON DELETE CASCADE,
+            loans   bigint NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS book_loans_loans_idx ON book_loans (loans DESC, book_id);
+        CREATE TABLE IF NOT EXISTS category_loans (
+            category text NOT NULL,  -- '' for books without one
+            shard    smallint NOT NULL,
+            loans    bigint NOT NULL DEFAULT 0,
+            PRIMARY KEY (category, shard)
+        );
+        CREATE TABLE IF NOT EXISTS club_sizes (
+            club_id integer PRIMARY KEY REFERENCES book_clubs (club_id) ON DELETE CASCADE,
+            members integer NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS club_sizes_members_idx ON club_sizes (members DESC, club_id);
+
+        CREATE OR REPLACE FUNCTION library_stats_shard() RETURNS smallint LANGUAGE sql AS $$
+            SELECT (pg_backend_pid() % 8)::smallint
+        $$;
+
+        CREATE OR REPLACE FUNCTION library_stats_loans() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO circulation_daily AS d (day, shard, loans)
+                SELECT loan_date, library_stats_shard(), count(*) FROM new_loans GROUP BY loan_date
+                ON CONFLICT (day, shard) DO UPDATE SET loans = d.loans + EXCLUDED.loans;
+                INSERT INTO book_loans AS b (book_id, loans)
+                SELECT book_id, count(*) FROM new_loans GROUP BY book_id
+                ON CONFLICT (book_id) DO UPDATE SET loans = b.loans + EXCLUDED.loans;
+                INSERT INTO category_loans AS c (category, shard, loans)
+                SELECT COALESCE(bk.category, ''), library_stats_shard(), count(*)
+                FROM new_loans n JOIN books bk ON bk.book_id = n.book_id
+                GROUP BY 1
+                ON CONFLICT (category, shard) DO UPDATE SET loans = c.loans + EXCLUDED.loans;
+                INSERT INTO circulation_totals AS t (shard, active_loans, overdue_loans)
+                SELECT library_stats_shard(), count(*) FILTER (WHERE status IN ('borrowed', 'overdue')),
+                       count(*) FILTER (WHERE status = 'overdue')
+                FROM new_loans
+                ON CONFLICT (shard) DO UPDATE SET active_loans = t.active_loans + EXCLUDED.active_loans,
+                                                  overdue_loans = t.overdue_loans + EXCLUDED.overdue_loans;
+            ELSIF TG_OP = 'UPDATE' THEN
+                INSERT INTO circulation_daily AS d (day, shard, returns)
+                SELECT n.return_date, library_stats_shard(), count(*)
+                FROM new_loans n JOIN old_loans o ON o.loan_id = n.loan_id
+                WHERE o.return_date IS NULL AND n.return_date IS NOT NULL
+                GROUP BY n.return_date
+                ON CONFLICT (day, shard) DO UPDATE SET returns = d.returns + EXCLUDED.returns;
+                INSERT INTO circulation_totals AS t (shard, active_loans, overdue_loans)
+                SELECT library_stats_shard(), active, overdue
+                FROM (SELECT sum((n.status IN ('borrowed', 'overdue'))::int - (o.status IN ('borrowed', 'overdue'))::int)
+                                 AS active,
+                             sum((n.status = 'overdue')::int - (o.status = 'overdue')::int) AS overdue
+                      FROM new_loans n JOIN old_loans o ON o.loan_id = n.loan_id) delta
+                WHERE active <> 0 OR overdue <> 0
+                ON CONFLICT (shard) DO UPDATE SET active_loans = t.active_loans + EXCLUDED.active_loans,
+                                                  overdue_loans = t.overdue_loans + EXCLUDED.overdue_loans;
+            ELSE
+                INSERT INTO circulation_totals AS t (shard, active_loans, overdue_loans)
+                SELECT library_stats_shard(), -active, -overdue
+                FROM (SELECT count(*) FILTER (WHERE status IN ('borrowed', 'overdue')) AS active,
+                             count(*) FILTER (WHERE status = 'overdue') AS overdue
+                      FROM old_loans) delta
+                WHERE active <> 0
+                ON CONFLICT (shard) DO UPDATE SET active_loans = t.active_loans + EXCLUDED.active_loans,
+                                                  overdue_loans = t.overdue_loans + EXCLUDED.overdue_loans;
+            END IF;
+            RETURN NULL;
+        END
+        $$;
+        DROP TRIGGER IF EXISTS loans_stats_insert ON loans;
+        CREATE TRIGGER loans_stats_insert AFTER INSERT ON loans REFERENCING NEW TABLE AS new_loans
+            FOR EACH STATEMENT EXECUTE FUNCTION library_stats_loans();
+        DROP TRIGGER IF EXISTS loans_stats_update ON loans;
+        CREATE TRIGGER loans_stats_update AFTER UPDATE ON loans REFERENCING OLD TABLE AS old_loans NEW TABLE AS new_loans
+            FOR EACH STATEMENT EXECUTE FUNCTION library_stats_loans();
+        DROP TRIGGER IF EXISTS loans_stats_delete ON loans;
+        CREATE TRIGGER loans_stats_delete AFTER DELETE ON loans REFERENCING OLD TABLE AS old_loans
+            FOR EACH STATEMENT EXECUTE FUNCTION library_stats_loans();
+
+        CREATE OR REPLACE FUNCTION library_stats_clubs() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO club_sizes AS s (club_id, members)
+                SELECT club_id, count(*) FROM new_members GROUP BY club_id
+                ON CONFLICT (club_id) DO UPDATE SET members = s.members + EXCLUDED.members;
+            ELSE
+                UPDATE club_sizes s SET members = s.members - gone.n
+                FROM (SELECT club_id, count(*) AS n FROM old_members GROUP BY club_id) gone
+                WHERE s.club_id = gone.club_id;
+            END IF;
+            RETURN NULL;
+        END
+        $$;
+        DROP TRIGGER IF EXISTS club_members_stats_insert ON club_members;
+        CREATE TRIGGER club_members_stats_insert AFTER INSERT ON club_members REFERENCING NEW TABLE AS new_members
+            FOR EACH STATEMENT EXECUTE FUNCTION library_stats_clubs();
+        DROP TRIGGER IF EXISTS club_members_stats_delete ON club_members;
+        CREATE TRIGGER club_members_stats_delete AFTER DELETE ON club_members REFERENCING OLD TABLE AS old_members
+            FOR EACH STATEMENT EXECUTE FUNCTION library_stats_clubs();
+
+        -- the history so far, counted once; writers wait so nothing falls between
+        LOCK TABLE loans, club_members IN SHARE MODE;
+        INSERT INTO circulation_totals (shard, active_loans, overdue_loans)
+        SELECT 0, count(*) FILTER (WHERE status IN ('borrowed', 'overdue')), count(*) FILTER (WHERE status = 'overdue')
+        FROM loans;
+        INSERT INTO circulation_daily (day, shard, loans)
+        SELECT loan_date, 0, count(*) FROM loans GROUP BY loan_date;
+        INSERT INTO circulation_daily AS d (day, shard, returns)
+        SELECT return_date, 0, count(*) FROM loans WHERE return_date IS NOT NULL GROUP BY return_date
+        ON CONFLICT (day, shard) DO UPDATE SET returns = EXCLUDED.returns;
+        INSERT INTO book_loans (book_id, loans)
+        SELECT book_id, count(*) FROM loans GROUP BY book_id;
+        INSERT INTO category_loans (category, shard, loans)
+        SELECT COALESCE(b.category, ''), 0, count(*) FROM loans l JOIN books b ON b.book_id = l.book_id GROUP BY 1;
+        INSERT INTO club_sizes (club_id, members)
+        SELECT club_id, count(*) FROM club_members GROUP BY club_id;
+    """),
+    (10, "book recommendations", """
+        -- see models/recommendations.py: "members who borrowed this also
+        -- borrowed". A member's basket is the books of their most recent loans;
+        -- book_neighbours holds the best cosine matches of every book over the
+        -- baskets, worked out ahead so showing them is one index range.
+        -- recommender_state.last_loan_id is the newest loan counted so far and
+        -- books whose neighbours are out of date wait in recommender_queue.
+        CREATE TABLE IF NOT EXISTS recommender_baskets (
+            member_id integer NOT NULL REFERENCES members (member_id) ON DELETE CASCADE,
+            book_id   integer NOT NULL REFERENCES books (book_id) ON DELETE CASCADE,
+            PRIMARY KEY (member_id, book_id)
+        );
+        CREATE INDEX IF NOT EXISTS recommender_baskets_book_idx ON recommender_baskets (book_id, member_id);
+        CREATE TABLE IF NOT EXISTS book_borrowers (
+            book_id integer PRIMARY KEY REFERENCES books (book_id) ON DELETE CASCADE,
+            members integer NOT NULL  -- baskets holding the book
+        );
+        CREATE TABLE IF NOT EXISTS book_neighbours (
+            book_id      integer NOT NULL REFERENCES books (book_id) ON DELETE CASCADE,
+            rank         smallint NOT NULL,
+            neighbour_id integer NOT NULL,  -- a deleted book drops out of the join with books
+            score        real NOT NULL,
+            PRIMARY KEY (book_id, rank)
+        );
+        CREATE TABLE IF NOT EXISTS recommender_queue (
+            book_id integer PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS recommender_state (
+            last_loan_id integer NOT NULL
+        );
+        INSERT INTO recommender_state SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM recommender_state);
+    """),
+    (11, "club suggestions", """
+        -- see BookClub.suggest: every reader's top categories and every club's
+        -- blend of its members' as unit vectors, and for each member the clubs
+        -- closest to their reading, worked out nightly
+        CREATE TABLE IF NOT EXISTS reader_categories (
+            member_id integer NOT NULL REFERENCES members (member_id) ON DELETE CASCADE,
+            category  text NOT NULL,
+            weight    real NOT NULL,
+            PRIMARY KEY (member_id, category)
+        );
+        CREATE TABLE IF NOT EXISTS club_categories (
+            category text NOT NULL,
+            club_id  integer NOT NULL REFERENCES book_clubs (club_id) ON DELETE CASCADE,
+            weight   real NOT NULL,
+            PRIMARY KEY (category, club_id)
+        );
+        CREATE INDEX IF NOT EXISTS club_categories_club_idx ON club_categories (club_id);
+        CREATE TABLE IF NOT EXISTS club_suggestions (
+            member_id integer NOT NULL REFERENCES members (member_id) ON DELETE CASCADE,
+            rank      smallint NOT NULL,
+            club_id   integer NOT NULL REFERENCES book_clubs (club_id) ON DELETE CASCADE,
+            score     real NOT NULL,
+            PRIMARY KEY (member_id, rank)
+        );
+        CREATE INDEX IF NOT EXISTS club_suggestions_club_idx ON club_suggestions (club_id);
+    """),
+    (12, "loan archive", """
+        -- see models/archive.py: loans returned long ago move to loans_archive
+        -- in batches, so loans holds the recent history and whatever is still
+        -- out, however many years the library has been lending. Fines outlive
+        -- their loan's move and no longer cascade from loans.
+        CREATE TABLE IF NOT EXISTS loans_archive (
+            loan_id     integer PRIMARY KEY,
+            book_id     integer NOT NULL REFERENCES books (book_id),
+            member_id   integer NOT NULL REFERENCES members (member_id),
+            loan_date   date NOT NULL,
+            due_date    date,
+            return_date date,
+            status      text NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS loans_archive_member_idx ON loans_archive (member_id, loan_date DESC);
+        CREATE INDEX IF NOT EXISTS loans_archive_book_idx ON loans_archive (book_id);
+        ALTER TABLE fines DROP CONSTRAINT IF EXISTS fines_loan_id_fkey;
+    """),
+    (13, "canonical ISBNs", """
+        -- books.isbn holds the canonical 13-digit ISBN (backend.isbn13), the form
+        -- imports merge on and ISBN searches match; books added with an ISBN-10
+        -- or with hyphens used to keep what was typed. Codes that are not valid
+        -- ISBNs are left as they are.
+        CREATE OR REPLACE FUNCTION library_isbn13(code text) RETURNS text LANGUAGE plpgsql IMMUTABLE AS $$
+        DECLARE
+            digits text := regexp_replace(upper(code), '[^0-9X]', '', 'g');
+            body text;
+            total integer := 0;
+            expected integer;
+        BEGIN
+            IF length(digits) = 10 AND substr(digits, 1, 9) ~ '^[0-9]{9}$' THEN
+                FOR i IN 1..9 LOOP
+                    total := total + (11 - i) * substr(digits, i, 1)::integer;
+                END LOOP;
+                expected := (11 - total % 11) % 11;
+                IF substr(digits, 10, 1) <> CASE WHEN expected = 10 THEN 'X' ELSE expected::text END THEN
+                    RETURN NULL;
+                END IF;
+                body := '978' || substr(digits, 1, 9);
+            ELSIF digits ~ '^[0-9]{13}$' THEN
+                body := substr(digits, 1, 12);
+            ELSE
+                RETURN NULL;
+            END IF;
+            total := 0;
+            FOR i IN 1..12 LOOP
+                total := total + substr(body, i, 1)::integer * CASE WHEN i % 2 = 0 THEN 3 ELSE 1 END;
+            END LOOP;
+            body := body || ((10 - total % 10) % 10)::text;
+            IF length(digits) = 13 AND digits <> body THEN
+                RETURN NULL;
+            END IF;
+            RETURN body;
+        END
+        $$;
+        SET LOCAL library.bulk_write = on;
+        UPDATE books SET isbn = library_isbn13(isbn)
+         WHERE library_isbn13(isbn) IS NOT NULL AND library_isbn13(isbn) <> isbn;
+        SELECT pg_notify('library_changes', json_build_object('table', 'books', 'op', 'reload')::text);
+    """),
+    (14, "catalogue changes in commit order", """
+        -- a writer takes its version number when it writes the row, not when it
+        -- commits, so versions become visible out of order. Every change now also
+        -- records the writing transaction: a reader asks for the changes of
+        -- transactions from the oldest one still running at its last look on,
+        -- which cannot have committed before that look, whatever their version.
+        -- Rows written before this migration have none and are never re-sent.
+        ALTER TABLE books ADD COLUMN IF NOT EXISTS change_xid xid8;
+        ALTER TABLE books ALTER COLUMN change_xid SET DEFAULT pg_current_xact_id();
+        CREATE INDEX IF NOT EXISTS books_change_xid_idx ON books (change_xid);
+        ALTER TABLE deleted_books ADD COLUMN IF NOT EXISTS change_xid xid8;
+        ALTER TABLE deleted_books ALTER COLUMN change_xid SET DEFAULT pg_current_xact_id();
+        CREATE INDEX IF NOT EXISTS deleted_books_change_xid_idx ON deleted_books (change_xid);
+
+        CREATE OR REPLACE FUNCTION books_touch_version() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.version := nextval('books_version_seq');
+            NEW.change_xid := pg_current_xact_id();
+            RETURN NEW;
+        END
+        $$;
+
+        CREATE OR REPLACE FUNCTION books_record_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO deleted_books (book_id) VALUES (OLD.book_id)
+            ON CONFLICT (book_id) DO UPDATE SET version = nextval('books_version_seq'),
+                                                change_xid = pg_current_xact_id();
+            RETURN OLD;
+        END
+        $$;
+    """),
+]
+
+# any fixed key serialises concurrent start-ups migrating the same database
+_MIGRATION_LOCK_KEY = 0x4C49425359
+
+
+def _apply(conn, migrations=MIGRATIONS):
+    # Applies pending migrations on `conn`; returns the versions applied.
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (_MIGRATION_LOCK_KEY,))
+        cur.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                           version    integer PRIMARY KEY,
+                           name       text NOT NULL,
+                           applied_at timestamptz NOT NULL DEFAULT now()
+                       )""")
+        conn.commit()
+    applied = []
+    for version, name, sql in migrations:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (_MIGRATION_LOCK_KEY,))
+            cur.execute("SELECT 1 FROM schema_migrations WHERE version=%s", (version,))
+            if cur.fetchone() is not None:
+                conn.rollback()
+                continue
+            cur.execute(sql)
+            cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        conn.commit()
+        applied.append(version)
+    return applied
+
+
+def migrate():
+    with connection() as conn:
+        return _apply(conn)
+
+
+def status():
+    # Returns [(version, name, applied_at or None)] for every known migration.
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+        done = {}
+        if cur.fetchone()[0]:
+            cur.execute("SELECT version, applied_at FROM schema_migrations")
+            done = dict(cur.fetchall())
+    return [(version, name, done.get(version)) for version, name, _ in MIGRATIONS]
+
+
+# ---- query plan check ----
+
+# tables large enough in production that a sequential scan on them is a bug
+PLAN_CHECKED_TABLES = {"users", "members", "books", "loans", "club_members", "holds"}
+
+SEED_SQL = """
+    INSERT INTO users (username, password, role)
+    SELECT 'seed_' || g, md5(g::text), CASE WHEN g %% 100 = 0 THEN 'librarian' ELSE 'member' END
+    FROM generate_series(1, %(members)s) g;
+    INSERT INTO members (user_id, full_name) SELECT user_id, 'Seed Member ' || user_id FROM users;
+    INSERT INTO authors (name) SELECT 'Seed Author ' || md5(g::text) FROM generate_series(1, %(authors)s) g;
+    INSERT INTO books (title, isbn, author_id, category, copies_total, copies_available)
+    SELECT 'Seed ' || md5(g::text), (9780000000000 + g)::text,
+           (SELECT min(author_id) FROM authors) + g %% %(authors)s, 'Category ' || g %% 40, 3, 3
+    FROM generate_series(1, %(books)s) g;
+    INSERT INTO loans (book_id, member_id, loan_date, due_date, return_date, status)
+    SELECT b.first + g %% %(books)s, m.first + g %% %(members)s, CURRENT_DATE - g %% 700, CURRENT_DATE - g %% 700 + 14,
+           CASE WHEN g %% 20 = 0 THEN NULL ELSE CURRENT_DATE - g %% 700 + 7 END,
+           CASE WHEN g %% 20 = 0 THEN 'borrowed' ELSE 'returned' END
+    FROM generate_series(1, %(loans)s) g,
+         (SELECT min(book_id) AS first FROM books) b, (SELECT min(member_id) AS first FROM members) m;
+    INSERT INTO book_clubs (name, description) SELECT 'Seed Club ' || g, '' FROM generate_series(1, %(clubs)s) g;
+    INSERT INTO club_members (club_id, member_id)
+    SELECT c.club_id, m.member_id FROM book_clubs c JOIN members m ON m.member_id %% %(clubs)s = c.club_id %% %(clubs)s;
+    INSERT INTO holds (book_id, member_id, created_at)
+    SELECT b.first + g %% 500, m.first + g %% %(members)s, now() - g * interval '1 minute'
+    FROM generate_series(1, %(holds)s) g,
+         (SELECT min(book_id) AS first FROM books) b, (SELECT min(member_id) AS first FROM members) m;
+"""
+
+SEED_SIZES = {"members": 20000, "authors": 2000, "books": 50000, "loans": 200000, "clubs": 200, "holds": 20000}
+
+# (name, sql, params) -- the statements the application runs on every click;
+# %(member_id)s and friends are filled with keys that exist in the seeded data
+HOT_QUERIES = [
+    ("login", "SELECT user_id, role FROM users WHERE username=%(username)s AND password=%(password)s", {}),
+    ("member lookup", "SELECT member_id FROM members WHERE user_id=%(user_id)s", {}),
+    ("loan limit check", """SELECT count(*) FROM loans
+                            WHERE member_id=%(member_id)s AND status IN ('borrowed', 'overdue')""", {}),
+    ("open loans", """SELECT l.loan_id, b.book_id, b.title, l.loan_date, l.due_date
+                      FROM loans l JOIN books b ON l.book_id = b.book_id
+                      WHERE l.member_id=%(member_id)s AND l.status IN ('borrowed', 'overdue')""", {}),
+    ("recent loans", """SELECT l.loan_id, l.member_id, COALESCE(m.full_name, u.username), b.book_id, b.title, l.status
+                        FROM loans l
+                        JOIN books b ON l.book_id = b.book_id
+                        LEFT JOIN members m ON l.member_id = m.member_id
+                        LEFT JOIN users u ON m.user_id = u.user_id
+                        ORDER BY l.loan_date DESC LIMIT 500""", {}),
+    ("club membership check", "SELECT 1 FROM club_members WHERE club_id=%(club_id)s AND member_id=%(member_id)s", {}),
+    ("member clubs", "SELECT club_id FROM club_members WHERE member_id=%(member_id)s", {}),
+    ("catalogue page", """SELECT book_id, title FROM books WHERE (title, book_id) > (%(title)s, %(book_id)s)
+                          ORDER BY title, book_id LIMIT 100""", {}),
+    ("title search", "SELECT book_id FROM books WHERE search_vector @@ to_tsquery('simple', 'ab:*') LIMIT 100", {}),
+    ("isbn prefix", "SELECT book_id FROM books WHERE isbn LIKE '978000001234%%'", {}),
+    ("catalogue changes", """SELECT book_id FROM books
+                             WHERE change_xid >= pg_snapshot_xmin(pg_current_snapshot())""", {}),
+    ("next hold", """SELECT hold_id FROM holds WHERE book_id=%(book_id)s AND status = 'waiting'
+                     ORDER BY priority DESC, created_at, hold_id LIMIT 1""", {}),
+    ("dashboard top books", """SELECT b.book_id, b.title, bl.loans
+                               FROM (SELECT book_id, loans FROM book_loans ORDER BY loans DESC, book_id LIMIT 10) bl
+                               JOIN books b ON b.book_id = bl.book_id""", {}),
+    ("member loan history", """SELECT l.loan_id, b.title, l.loan_date FROM loans l
+                               JOIN books b ON l.book_id = b.book_id
+                               WHERE l.member_id=%(member_id)s ORDER BY l.loan_date DESC""", {}),
+    ("similar books", """SELECT b.book_id, b.title, n.score FROM book_neighbours n
+                         JOIN books b ON b.book_id = n.neighbour_id
+                         WHERE n.book_id=%(book_id)s ORDER BY n.rank LIMIT 10""", {}),
+    ("suggested clubs", """SELECT bc.club_id, bc.name, s.score FROM club_suggestions s
+                           JOIN book_clubs bc ON bc.club_id = s.club_id
+                           WHERE s.member_id=%(member_id)s ORDER BY s.rank""", {}),
+    # one chunk of the overdue job; a smaller range than production's, sized to the seed
+    ("overdue chunk", """SELECT loan_id FROM loans WHERE loan_id BETWEEN 1 AND 5000
+                         AND due_date < COALESCE(return_date, CURRENT_DATE)""", {}),
+]
+
+
+def _seq_scans(plan, tables):
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in tables:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(_seq_scans(child, tables))
+    return found
+
+
+def check_plans(sizes=SEED_SIZES):
+    # Builds the schema in a scratch namespace, seeds it, and EXPLAINs every hot
+    # query. Nothing is kept: the whole run is rolled back.
+    # Returns [(query name, [tables seq-scanned])] for the offending queries.
+    scratch = f"plan_check_{uuid.uuid4().hex[:8]}"
+    failures = []
+    with connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"CREATE SCHEMA {scratch}")
+                cur.execute(f"SET LOCAL search_path = {scratch}, public")
+                for _, _, sql in MIGRATIONS:
+                    cur.execute(sql)
+                cur.execute(SEED_SQL, sizes)
+                for table in PLAN_CHECKED_TABLES | {"authors", "book_clubs"}:
+                    cur.execute(f"ANALYZE {table}")
+                cur.execute("""SELECT u.username, u.password, u.user_id, m.member_id, cm.club_id
+                               FROM club_members cm JOIN members m USING (member_id) JOIN users u USING (user_id)
+                               ORDER BY cm.member_id DESC LIMIT 1""")
+                username, password, user_id, member_id, club_id = cur.fetchone()
+                cur.execute("SELECT title, book_id FROM books ORDER BY title, book_id OFFSET %s LIMIT 1",
+                            (sizes["books"] // 2,))
+                title, book_id = cur.fetchone()
+                keys = {"username": username, "password": password, "user_id": user_id, "member_id": member_id,
+                        "club_id": club_id, "title": title, "book_id": book_id}
+                for name, sql, params in HOT_QUERIES:
+                    cur.execute("EXPLAIN (FORMAT JSON) " + sql, {**keys, **params})
+                    plan = cur.fetchone()[0]
+                    if isinstance(plan, str):
+                        plan = json.loads(plan)
+                    scans = _seq_scans(plan[0]["Plan"], PLAN_CHECKED_TABLES)
+                    if scans:
+                        failures.append((name, scans))
+        finally:
+            conn.rollback()
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Library database schema migrations")
+    parser.add_argument("--status", action="store_true", help="list migrations and exit")
+    parser.add_argument("--check-plans", action="store_true",
+                        help="EXPLAIN the hot queries on a seeded scratch schema and fail on sequential scans")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        for version, name, applied_at in status():
+            print(f"{version:4d}  {'applied ' + str(applied_at) if applied_at else 'pending':40s}  {name}")
+        return 0
+    if args.check_plans:
+        failures = check_plans()
+        for name, scans in failures:
+            print(f"FAIL: {name}: sequential scan on {', '.join(scans)}")
+        if not failures:
+            print(f"ok: {len(HOT_QUERIES)} hot queries use indexes")
+        return 1 if failures else 0
+    applied = migrate()
+    print(f"applied {applied}" if applied else "schema is up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
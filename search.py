@@ -0,0 +1,17 @@
+from database.backend import get_backend
+from models.book import Book
+
+# Catalogue search: title, category, author name and ISBN prefix, best match
+# first. How matching and ranking work depends on the engine -- see
+# PostgresBackend.search_books (full-text and trigram indexes, typo tolerant)
+# and SqliteBackend.search_books (word prefixes only).
+
+RESULT_LIMIT = 100
+
+
+def search_books(text, columns=Book.CATALOGUE_COLUMNS, limit=RESULT_LIMIT):
+    # Returns up to `limit` catalogue rows (in `columns` order), best match first.
+    text = text.strip()
+    if not text:
+        return []
+    return get_backend().search_books(text, columns, limit)
@@ -0,0 +1,38 @@
+# gui/search_box.py
+from PyQt5.QtCore import QTimer, pyqtSignal
+from PyQt5.QtWidgets import QLineEdit
+
+
+class SearchBox(QLineEdit):
+    # Emits search_requested once typing pauses, so a burst of keystrokes costs
+    # one query. Text shorter than MIN_CHARS is sent as "" (back to browsing).
+    DEBOUNCE_MS = 250
+    MIN_CHARS = 2
+
+    search_requested = pyqtSignal(str)
+
+    def __init__(self, placeholder="Search...", parent=None):
+        super().__init__(parent)
+        self.setPlaceholderText(placeholder)
+        self.setClearButtonEnabled(True)
+        self._last = ""
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.DEBOUNCE_MS)
+        self._timer.timeout.connect(self._fire)
+        self.textChanged.connect(self._timer.start)
+        self.returnPressed.connect(self.search_now)
+
+    def query(self):
+        text = self.text().strip()
+        return text if len(text) >= self.MIN_CHARS else ""
+
+    def search_now(self):
+        # always emits, e.g. to re-run the current search after a reload
+        self._timer.stop()
+        self._last = self.query()
+        self.search_requested.emit(self._last)
+
+    def _fire(self):
+        if self.query() != self._last:
+            self.search_now()
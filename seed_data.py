@@ -0,0 +1,184 @@
+# tools/seed_data.py
+# Deterministic synthetic library for benchmarks and load tests. The same seed,
+# scale and --as-of date always give the same rows. Everything else is sized
+# from the number of loans (1k up to 10M), and rows are streamed into the
+# backend's bulk_load(), so memory stays flat at any scale. It needs an empty
+# catalogue.
+#
+#   python -m tools.seed_data --loans 1000000 --seed 7
+#   python -m tools.seed_data --engine sqlite --sqlite-path bench.db --loans 100000
+#
+# Every account's password is PASSWORD. Members are member1..memberN and
+# librarians librarian1..librarianN.
+import argparse
+import datetime
+import random
+import sys
+import time
+
+from database import backend
+from database.backend import get_backend
+
+PASSWORD = "password"
+
+# share of all loans that are still out
+OPEN_LOAN_SHARE = 0.05
+MAX_OPEN_PER_MEMBER = 3
+
+WORDS = ["shadow", "river", "garden", "winter", "silent", "empire", "stone", "light", "journey", "secret",
+         "ocean", "forest", "city", "night", "storm", "crown", "fire", "glass", "mountain", "harbor",
+         "memory", "island", "desert", "kingdom", "voice", "letter", "bridge", "dream", "war", "song",
+         "history", "science", "design", "market", "data", "code", "theory", "practice", "art", "mind"]
+CATEGORIES = ["Fiction", "Fantasy", "Mystery", "Science", "History", "Business", "Design", "Computing",
+              "Biography", "Poetry", "Engineering", "Art"]
+FIRST_NAMES = ["Aminata", "Mohamed", "Fatmata", "Ibrahim", "Mariama", "Abdul", "Isatu", "Alhaji", "Kadiatu",
+               "Sorie", "Hawa", "Samuel", "Christiana", "Joseph", "Adama", "Emmanuel", "Zainab", "Musa"]
+LAST_NAMES = ["Kamara", "Sesay", "Koroma", "Conteh", "Bangura", "Turay", "Kallon", "Jalloh", "Mansaray",
+              "Fofanah", "Kargbo", "Bah", "Barrie", "Cole", "Johnson", "Williams", "Kanu", "Sankoh"]
+CLUB_TOPICS = ["Readers", "Writers", "Sci-Fi", "Poetry", "History", "Philosophy", "Design", "Coding", "Classics"]
+
+
+class Scale:
+    def __init__(self, loans, members=None, books=None):
+        self.loans = loans
+        self.members = members or max(20, loans // 20)
+        self.books = books or max(50, loans // 10)
+        self.authors = max(10, self.books // 8)
+        self.librarians = max(1, self.members // 1000)
+        self.clubs = max(3, self.members // 500)
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def isbn_for(n):
+    # a valid ISBN-13 for catalogue number n
+    body = f"978{n:09d}"
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(body))
+    return body + str((10 - total % 10) % 10)
+
+
+def _name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def _popular(rng, n):
+    # 1..n, skewed towards the low end so a few books and members dominate
+    return int(n * rng.random() ** 2) + 1
+
+
+def _open_loans(rng, scale, copies):
+    # Picks the loans still out: at most MAX_OPEN_PER_MEMBER per member and
+    # never more than a book's copies. Returns [(member_id, book_id)].
+    target = min(int(scale.loans * OPEN_LOAN_SHARE), scale.members * MAX_OPEN_PER_MEMBER)
+    out = [0] * (scale.books + 1)
+    per_member = {}
+    loans = []
+    attempts = 0
+    while len(loans) < target and attempts < target * 10:
+        attempts += 1
+        member_id = rng.randint(1, scale.members)
+        book_id = _popular(rng, scale.books)
+        if per_member.get(member_id, 0) >= MAX_OPEN_PER_MEMBER or out[book_id] >= copies[book_id]:
+            continue
+        per_member[member_id] = per_member.get(member_id, 0) + 1
+        out[book_id] += 1
+        loans.append((member_id, book_id))
+    return loans, out
+
+
+def generate(db, scale, seed=0, as_of=None, progress=None):
+    # Fills an empty database; progress(table, rows) is called after each table.
+    # Returns {table: rows loaded}.
+    if db.books_page(None, 1, ("book_id", "title"))[0]:
+        raise RuntimeError("the catalogue is not empty; seed a fresh database")
+    rng = random.Random(seed)
+    as_of = as_of or datetime.date.today()
+    counts = {}
+
+    def load(table, columns, rows):
+        counts[table] = db.bulk_load(table, columns, rows)
+        if progress is not None:
+            progress(table, counts[table])
+
+    load("authors", ("author_id", "name"),
+         ((i, _name(rng)) for i in range(1, scale.authors + 1)))
+
+    users = scale.members + scale.librarians
+    load("users", ("user_id", "username", "password", "role"),
+         ((i, f"member{i}" if i <= scale.members else f"librarian{i - scale.members}", PASSWORD,
+           "member" if i <= scale.members else "librarian") for i in range(1, users + 1)))
+    load("members", ("member_id", "user_id", "full_name", "join_date"),
+         ((i, i, _name(rng), as_of - datetime.timedelta(days=rng.randint(30, 4 * 365)))
+          for i in range(1, scale.members + 1)))
+
+    copies = [0] + [rng.choice((1, 1, 2, 2, 3, 5)) for _ in range(scale.books)]
+    open_loans, out = _open_loans(rng, scale, copies)
+
+    def books():
+        for i in range(1, scale.books + 1):
+            title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).title()
+            yield (i, title, isbn_for(i), rng.randint(1, scale.authors), rng.choice(CATEGORIES),
+                   copies[i], copies[i] - out[i])
+
+    load("books", ("book_id", "title", "isbn", "author_id", "category", "copies_total", "copies_available"),
+         books())
+
+    def loans():
+        loan_id = 0
+        for _ in range(scale.loans - len(open_loans)):
+            loan_id += 1
+            loan_date = as_of - datetime.timedelta(days=rng.randint(15, 3 * 365))
+            returned = loan_date + datetime.timedelta(days=rng.randint(1, 21))
+            yield (loan_id, _popular(rng, scale.books), rng.randint(1, scale.members), loan_date,
+                   loan_date + datetime.timedelta(days=14), min(returned, as_of), "returned")
+        for member_id, book_id in open_loans:
+            loan_id += 1
+            loan_date = as_of - datetime.timedelta(days=rng.randint(0, 30))
+            yield (loan_id, book_id, member_id, loan_date, loan_date + datetime.timedelta(days=14), None, "borrowed")
+
+    load("loans", ("loan_id", "book_id", "member_id", "loan_date", "due_date", "return_date", "status"), loans())
+
+    load("book_clubs", ("club_id", "name", "description"),
+         ((i, f"{rng.choice(CLUB_TOPICS)} Club {i}", f"Synthetic club {i}") for i in range(1, scale.clubs + 1)))
+
+    def club_members():
+        for member_id in range(1, scale.members + 1):
+            for club_id in sorted(set(rng.randint(1, scale.clubs) for _ in range(rng.choice((0, 1, 1, 2, 3))))):
+                yield club_id, member_id
+
+    load("club_members", ("club_id", "member_id"), club_members())
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill an empty library database with synthetic data")
+    parser.add_argument("--loans", type=int, default=10000, help="total loans, 1000 to 10000000")
+    parser.add_argument("--members", type=int, help="default: loans / 20")
+    parser.add_argument("--books", type=int, help="default: loans / 10")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--as-of", type=datetime.date.fromisoformat,
+                        help="date the data ends on (YYYY-MM-DD); default today")
+    parser.add_argument("--engine", choices=("postgres", "sqlite"), default=backend.BACKEND_CONFIG['engine'])
+    parser.add_argument("--sqlite-path", default=backend.BACKEND_CONFIG['sqlite_path'])
+    args = parser.parse_args(argv)
+
+    backend.BACKEND_CONFIG['engine'] = args.engine
+    backend.BACKEND_CONFIG['sqlite_path'] = args.sqlite_path
+    db = get_backend()
+    db.prepare()
+    scale = Scale(args.loans, args.members, args.books)
+    start = time.monotonic()
+    try:
+        generate(db, scale, args.seed, args.as_of,
+                 progress=lambda table, rows: print(f"{table:14s} {rows:>10d} rows  {time.monotonic() - start:7.1f}s"))
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        backend.close_backend()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
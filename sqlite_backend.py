@@ -0,0 +1,1175 @@
+# database/sqlite_backend.py
+# Embedded backend on the standard library's sqlite3: a local file or
+# ':memory:', no server, no psycopg2. Same tables, same row shapes and the same
+# all-or-nothing borrow/return semantics as PostgresBackend, so tests and
+# benchmarks can run the whole application in-process.
+#
+# One connection is shared by every thread and serialised by a lock; writes
+# take the database write lock up front (BEGIN IMMEDIATE), which is what the
+# row locks and advisory locks do on Postgres. Catalogue search has no trigram
+# or full-text index here: it matches word prefixes with LIKE, so it finds the
+# same books for correctly spelled queries but is not typo tolerant.
+import datetime
+import math
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from database import instrument
+from database.backend import (
+    Backend, INSTRUMENT_CONFIG, BORROW_OK, BORROW_NO_COPIES, BORROW_NO_BOOK, BORROW_NO_MEMBER,
+    BORROW_LIMIT_REACHED, HOLD_OK, HOLD_COPIES_AVAILABLE, HOLD_ALREADY_QUEUED, isbn13, normalize_isbn, parse_search,
+    borrow_requests, return_requests, plan_borrow, split_collections, match_returns, loan_changes, page_key,
+)
+from models.changes import ChangeSet, rows_as_dicts
+
+# tables and indexes of schema migrations 1 and 2
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+        username  text NOT NULL,
+        password  text NOT NULL,
+        role      text NOT NULL DEFAULT 'member'
+    );
+    CREATE TABLE IF NOT EXISTS members (
+        member_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id   integer REFERENCES users (user_id),
+        full_name text,
+        join_date date NOT NULL DEFAULT (date('now', 'localtime'))
+    );
+    CREATE TABLE IF NOT EXISTS authors (
+        author_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name      text NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS books (
+        book_id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        title            text NOT NULL,
+        isbn             text,
+        author_id        integer,
+        category         text,
+        copies_total     integer NOT NULL DEFAULT 1,
+        copies_available integer NOT NULL DEFAULT 1 CHECK (copies_available >= 0)
+    );
+    CREATE TABLE IF NOT EXISTS loans (
+        loan_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_id     integer NOT NULL REFERENCES books (book_id),
+        member_id   integer NOT NULL REFERENCES members (member_id),
+        loan_date   date NOT NULL DEFAULT (date('now', 'localtime')),
+        due_date    date,
+        return_date date,
+        status      text NOT NULL DEFAULT 'borrowed'
+    );
+    CREATE TABLE IF NOT EXISTS book_clubs (
+        club_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+        name        text NOT NULL,
+        description text
+    );
+    CREATE TABLE IF NOT EXISTS club_members (
+        club_id   integer NOT NULL REFERENCES book_clubs (club_id) ON DELETE CASCADE,
+        member_id integer NOT NULL REFERENCES members (member_id) ON DELETE CASCADE
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS club_members_club_member_key ON club_members (club_id, member_id);
+    CREATE INDEX IF NOT EXISTS club_members_member_idx ON club_members (member_id);
+    CREATE UNIQUE INDEX IF NOT EXISTS users_username_key ON users (username);
+    CREATE UNIQUE INDEX IF NOT EXISTS members_user_key ON members (user_id);
+    CREATE INDEX IF NOT EXISTS loans_member_status_idx ON loans (member_id, status);
+    CREATE INDEX IF NOT EXISTS loans_loan_date_idx ON loans (loan_date DESC);
+    CREATE INDEX IF NOT EXISTS loans_book_idx ON loans (book_id);
+    CREATE INDEX IF NOT EXISTS books_title_key_idx ON books (title, book_id);
+    CREATE INDEX IF NOT EXISTS books_isbn_idx ON books (isbn);
+"""
+
+# migration 5, catalogue change tracking: a one-row counter stands in for the
+# version sequence
+CATALOGUE_VERSION_SQL = """
+    ALTER TABLE books ADD COLUMN version integer NOT NULL DEFAULT 0;
+    CREATE INDEX IF NOT EXISTS books_version_idx ON books (version);
+    CREATE TABLE IF NOT EXISTS catalogue_version (n integer NOT NULL);
+    INSERT INTO catalogue_version SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM catalogue_version);
+    CREATE TABLE IF NOT EXISTS deleted_books (
+        book_id integer PRIMARY KEY,
+        version integer NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS deleted_books_version_idx ON deleted_books (version);
+    CREATE TRIGGER IF NOT EXISTS books_version_insert AFTER INSERT ON books BEGIN
+        UPDATE catalogue_version SET n = n + 1;
+        UPDATE books SET version = (SELECT n FROM catalogue_version) WHERE book_id = NEW.book_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS books_version_update
+    AFTER UPDATE OF title, isbn, author_id, category, copies_total, copies_available ON books BEGIN
+        UPDATE catalogue_version SET n = n + 1;
+        UPDATE books SET version = (SELECT n FROM catalogue_version) WHERE book_id = NEW.book_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS books_version_delete AFTER DELETE ON books BEGIN
+        UPDATE catalogue_version SET n = n + 1;
+        INSERT OR REPLACE INTO deleted_books (book_id, version) VALUES (OLD.book_id, (SELECT n FROM catalogue_version));
+    END;
+"""
+
+# migration 7, overdue loans and fines
+FINES_SQL = """
+    CREATE TABLE IF NOT EXISTS fines (
+        loan_id     integer PRIMARY KEY REFERENCES loans (loan_id) ON DELETE CASCADE,
+        member_id   integer NOT NULL REFERENCES members (member_id),
+        days_late   integer NOT NULL,
+        amount      real NOT NULL,
+        final       integer NOT NULL DEFAULT 0,
+        assessed_on date NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS fines_member_idx ON fines (member_id);
+"""
+
+# migration 8, the hold queue
+HOLDS_SQL = """
+    CREATE TABLE IF NOT EXISTS holds (
+        hold_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_id     integer NOT NULL REFERENCES books (book_id) ON DELETE CASCADE,
+        member_id   integer NOT NULL REFERENCES members (member_id) ON DELETE CASCADE,
+        priority    integer NOT NULL DEFAULT 0,
+        created_at  text NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+        status      text NOT NULL DEFAULT 'waiting',
+        ready_until date
+    );
+    CREATE INDEX IF NOT EXISTS holds_queue_idx ON holds (book_id, priority DESC, created_at, hold_id)
+        WHERE status = 'waiting';
+    CREATE INDEX IF NOT EXISTS holds_ready_idx ON holds (ready_until) WHERE status = 'ready';
+    CREATE UNIQUE INDEX IF NOT EXISTS holds_member_book_key ON holds (member_id, book_id)
+        WHERE status IN ('waiting', 'ready');
+"""
+
+# migration 9, circulation statistics: row triggers instead of statement
+# triggers, and one shard, as there is only ever one writer
+STATS_SQL = """
+    CREATE TABLE IF NOT EXISTS circulation_totals (
+        shard         integer PRIMARY KEY,
+        active_loans  integer NOT NULL DEFAULT 0,
+        overdue_loans integer NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS circulation_daily (
+        day     date NOT NULL,
+        shard   integer NOT NULL,
+        loans   integer NOT NULL DEFAULT 0,
+        returns integer NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, shard)
+    );
+    CREATE TABLE IF NOT EXISTS book_loans (
+        book_id integer PRIMARY KEY REFERENCES books (book_id) ON DELETE CASCADE,
+        loans   integer NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS book_loans_loans_idx ON book_loans (loans DESC, book_id);
+    CREATE TABLE IF NOT EXISTS category_loans (
+        category text NOT NULL,
+        shard    integer NOT NULL,
+        loans    integer NOT NULL DEFAULT 0,
+        PRIMARY KEY (category, shard)
+    );
+    CREATE TABLE IF NOT EXISTS club_sizes (
+        club_id integer PRIMARY KEY REFERENCES book_clubs (club_id) ON DELETE CASCADE,
+        members integer NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS club_sizes_members_idx ON club_sizes (members DESC, club_id);
+
+    INSERT INTO circulation_totals (shard, active_loans, overdue_loans)
+    SELECT 0, COALESCE(sum(status IN ('borrowed', 'overdue')), 0), COALESCE(sum(status = 'overdue'), 0) FROM loans;
+    INSERT INTO circulation_daily (day, shard, loans)
+    SELECT loan_date, 0, count(*) FROM loans GROUP BY loan_date;
+    INSERT INTO circulation_daily (day, shard, returns)
+    SELECT return_date, 0, count(*) FROM loans WHERE return_date IS NOT NULL GROUP BY return_date
+    ON CONFLICT (day, shard) DO UPDATE SET returns = excluded.returns;
+    INSERT INTO book_loans (book_id, loans)
+    SELECT book_id, count(*) FROM loans GROUP BY book_id;
+    INSERT INTO category_loans (category, shard, loans)
+    SELECT COALESCE(b.category, ''), 0, count(*) FROM loans l JOIN books b ON b.book_id = l.book_id GROUP BY 1;
+    INSERT INTO club_sizes (club_id, members)
+    SELECT club_id, count(*) FROM club_members GROUP BY club_id;
+
+    CREATE TRIGGER IF NOT EXISTS loans_stats_insert AFTER INSERT ON loans BEGIN
+        INSERT INTO circulation_daily (day, shard, loans) VALUES (NEW.loan_date, 0, 1)
+        ON CONFLICT (day, shard) DO UPDATE SET loans = loans + 1;
+        INSERT INTO book_loans (book_id, loans) VALUES (NEW.book_id, 1)
+        ON CONFLICT (book_id) DO UPDATE SET loans = loans + 1;
+        INSERT INTO category_loans (category, shard, loans)
+        VALUES ((SELECT COALESCE(category, '') FROM books WHERE book_id = NEW.book_id), 0, 1)
+        ON CONFLICT (category, shard) DO UPDATE SET loans = loans + 1;
+        UPDATE circulation_totals SET active_loans = active_loans + (NEW.status IN ('borrowed', 'overdue')),
+                                      overdue_loans = overdue_loans + (NEW.status = 'overdue');
+    END;
+    CREATE TRIGGER IF NOT EXISTS loans_stats_update AFTER UPDATE OF status, return_date ON loans BEGIN
+        INSERT INTO circulation_daily (day, shard, returns)
+        SELECT NEW.return_date, 0, 1 WHERE OLD.return_date IS NULL AND NEW.return_date IS NOT NULL
+        ON CONFLICT (day, shard) DO UPDATE SET returns = returns + 1;
+        UPDATE circulation_totals
+           SET active_loans = active_loans + (NEW.status IN ('borrowed', 'overdue')) - (OLD.status IN ('borrowed', 'overdue')),
+               overdue_loans = overdue_loans + (NEW.status = 'overdue') - (OLD.status = 'overdue')
+         WHERE NEW.status IS NOT OLD.status;
+    END;
+    CREATE TRIGGER IF NOT EXISTS loans_stats_delete AFTER DELETE ON loans BEGIN
+        UPDATE circulation_totals SET active_loans = active_loans - (OLD.status IN ('borrowed', 'overdue')),
+                                      overdue_loans = overdue_loans - (OLD.status = 'overdue');
+    END;
+    CREATE TRIGGER IF NOT EXISTS club_members_stats_insert AFTER INSERT ON club_members BEGIN
+        INSERT INTO club_sizes (club_id, members) VALUES (NEW.club_id, 1)
+        ON CONFLICT (club_id) DO UPDATE SET members = members + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS club_members_stats_delete AFTER DELETE ON club_members BEGIN
+        UPDATE club_sizes SET members = members - 1 WHERE club_id = OLD.club_id;
+    END;
+"""
+
+# migration 10, book recommendations
+RECOMMENDER_SQL = """
+    CREATE TABLE IF NOT EXISTS recommender_baskets (
+        member_id integer NOT NULL REFERENCES members (member_id) ON DELETE CASCADE,
+        book_id   integer NOT NULL REFERENCES books (book_id) ON DELETE CASCADE,
+        PRIMARY KEY (member_id, book_id)
+    );
+    CREATE INDEX IF NOT EXISTS recommender_baskets_book_idx ON recommender_baskets (book_id, member_id);
+    CREATE TABLE IF NOT EXISTS book_borrowers (
+        book_id integer PRIMARY KEY REFERENCES books (book_id) ON DELETE CASCADE,
+        members integer NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS book_neighbours (
+        book_id      integer NOT NULL REFERENCES books (book_id) ON DELETE CASCADE,
+        rank         integer NOT NULL,
+        neighbour_id integer NOT NULL,
+        score        real NOT NULL,
+        PRIMARY KEY (book_id, rank)
+    );
+    CREATE TABLE IF NOT EXISTS recommender_queue (
+        book_id integer PRIMARY KEY
+    );
+    CREATE TABLE IF NOT EXISTS recommender_state (
+        last_loan_id integer NOT NULL
+    );
+    INSERT INTO recommender_state SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM recommender_state);
+"""
+
+# migration 11, club suggestions
+CLUB_SUGGESTIONS_SQL = """
+    CREATE TABLE IF NOT EXISTS reader_categories (
+        member_id integer NOT NULL REFERENCES members (member_id) ON DELETE CASCADE,
+        category  text NOT NULL,
+        weight    real NOT NULL,
+        PRIMARY KEY (member_id, category)
+    );
+    CREATE TABLE IF NOT EXISTS club_categories (
+        category text NOT NULL,
+        club_id  integer NOT NULL REFERENCES book_clubs (club_id) ON DELETE CASCADE,
+        weight   real NOT NULL,
+        PRIMARY KEY (category, club_id)
+    );
+    CREATE INDEX IF NOT EXISTS club_categories_club_idx ON club_categories (club_id);
+    CREATE TABLE IF NOT EXISTS club_suggestions (
+        member_id integer NOT NULL REFERENCES members (member_id) ON DELETE CASCADE,
+        rank      integer NOT NULL,
+        club_id   integer NOT NULL REFERENCES book_clubs (club_id) ON DELETE CASCADE,
+        score     real NOT NULL,
+        PRIMARY KEY (member_id, rank)
+    );
+    CREATE INDEX IF NOT EXISTS club_suggestions_club_idx ON club_suggestions (club_id);
+"""
+
+# migration 12, the loan archive; SQLite can't drop a foreign key, so fines
+# is copied into a table without the one on loans
+ARCHIVE_SQL = """
+    CREATE TABLE IF NOT EXISTS loans_archive (
+        loan_id     integer PRIMARY KEY,
+        book_id     integer NOT NULL REFERENCES books (book_id),
+        member_id   integer NOT NULL REFERENCES members (member_id),
+        loan_date   date NOT NULL,
+        due_date    date,
+        return_date date,
+        status      text NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS loans_archive_member_idx ON loans_archive (member_id, loan_date DESC);
+    CREATE INDEX IF NOT EXISTS loans_archive_book_idx ON loans_archive (book_id);
+    CREATE TABLE fines_unlinked (
+        loan_id     integer PRIMARY KEY,
+        member_id   integer NOT NULL REFERENCES members (member_id),
+        days_late   integer NOT NULL,
+        amount      real NOT NULL,
+        final       integer NOT NULL DEFAULT 0,
+        assessed_on date NOT NULL
+    );
+    INSERT INTO fines_unlinked SELECT loan_id, member_id, days_late, amount, final, assessed_on FROM fines;
+    DROP TABLE fines;
+    ALTER TABLE fines_unlinked RENAME TO fines;
+    CREATE INDEX IF NOT EXISTS fines_member_idx ON fines (member_id);
+"""
+
+# migration 13, canonical ISBNs; library_isbn13() is backend.isbn13, registered
+# on the connection
+CANONICAL_ISBN_SQL = """
+    UPDATE books SET isbn = library_isbn13(isbn)
+     WHERE library_isbn13(isbn) IS NOT NULL AND library_isbn13(isbn) <> isbn;
+"""
+
+# PRAGMA user_version -> script that brings the database to it
+MIGRATIONS = [(1, SCHEMA_SQL), (2, CATALOGUE_VERSION_SQL), (3, FINES_SQL), (4, HOLDS_SQL), (5, STATS_SQL),
+              (6, RECOMMENDER_SQL), (7, CLUB_SUGGESTIONS_SQL), (8, ARCHIVE_SQL), (9, CANONICAL_ISBN_SQL)]
+
+# loan period of a single borrow, as in library_borrow()
+BORROW_LOAN_DAYS = 14
+# rows per executemany() while staging an import or bulk loading
+STAGING_CHUNK = 1000
+
+# as in pg_backend
+MEMBER_HOLDS_SQL = """
+    SELECT h.hold_id, h.book_id, b.title, h.status,
+           CASE WHEN h.status = 'waiting' THEN
+               (SELECT count(*) FROM holds q
+                WHERE q.book_id = h.book_id AND q.status = 'waiting'
+                  AND (q.priority > h.priority OR (q.priority = h.priority
+                       AND (q.created_at, q.hold_id) <= (h.created_at, h.hold_id))))
+           END AS position,
+           h.ready_until
+    FROM holds h
+    JOIN books b ON b.book_id = h.book_id
+    WHERE h.member_id = ? AND h.status IN ('waiting', 'ready')
+"""
+
+sqlite3.register_adapter(datetime.date, lambda d: d.isoformat())
+sqlite3.register_converter("date", lambda b: datetime.date.fromisoformat(b.decode()))
+
+
+def _like_escape(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class SqliteBackend(Backend):
+    name = "sqlite"
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self._lock = threading.RLock()
+        # autocommit mode; transactions are explicit BEGIN IMMEDIATE ... COMMIT
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        # the math functions are a compile-time option of SQLite
+        self._conn.create_function("sqrt", 1, math.sqrt, deterministic=True)
+        self._conn.create_function("library_isbn13", 1, isbn13, deterministic=True)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA busy_timeout = 10000")
+        self._timed = instrument.configure(INSTRUMENT_CONFIG)
+
+    def prepare(self):
+        with self._lock:
+            current = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            for version, script in MIGRATIONS:
+                if version > current:
+                    self._conn.executescript(f"BEGIN; {script} PRAGMA user_version = {version}; COMMIT;")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, cur, sql, params=()):
+        if not self._timed:
+            return cur.execute(sql, params)
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = cur.execute(sql, params)
+            failed = False
+            return result
+        finally:
+            instrument.record(sql, params, (time.perf_counter() - start) * 1000.0, cur.rowcount, failed)
+
+    @contextmanager
+    def _cursor(self):
+        with self._lock:
+            cur = self._conn.cursor()
+            try:
+                yield cur
+            finally:
+                cur.close()
+
+    @contextmanager
+    def _transaction(self):
+        # one write transaction; rolled back unless the block finishes
+        with self._cursor() as cur:
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                yield cur
+            except BaseException:
+                self._conn.rollback()
+                raise
+            if self._conn.in_transaction:
+                self._conn.commit()
+
+    def _fetch_all(self, sql, params=()):
+        with self._cursor() as cur:
+            return self._execute(cur, sql, params).fetchall()
+
+    def _fetch_one(self, sql, params=()):
+        with self._cursor() as cur:
+            return self._execute(cur, sql, params).fetchone()
+
+    def _write(self, sql, params, table, delete=False):
+        with self._transaction() as cur:
+            self._execute(cur, sql, params)
+            rows = rows_as_dicts(cur)
+        changes = ChangeSet()
+        return changes.delete(table, rows) if delete else changes.upsert(table, rows)
+
+    # ---- accounts ----
+    def authenticate(self, username, password, role=None):
+        if role is None:
+            return self._fetch_one("SELECT user_id, username, role FROM users WHERE username=? AND password=?",
+                                   (username, password))
+        return self._fetch_one("SELECT user_id, username, role FROM users WHERE username=? AND password=? AND role=?",
+                               (username, password, role))
+
+    def create_account(self, username, password, role, full_name=None):
+        with self._transaction() as cur:
+            self._execute(cur, """INSERT INTO users (username, password, role) VALUES (?, ?, ?)
+                                  ON CONFLICT (username) DO NOTHING RETURNING user_id""",
+                          (username, password, role))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            if role == "member":
+                self._execute(cur, "INSERT INTO members (user_id, full_name) VALUES (?, ?)", (row[0], full_name))
+        return row[0]
+
+    def member_id_for_user(self, user_id):
+        row = self._fetch_one("SELECT member_id FROM members WHERE user_id=?", (user_id,))
+        return row[0] if row else None
+
+    def members(self):
+        return self._fetch_all("""
+            SELECT m.member_id, u.username, m.full_name, m.join_date
+            FROM members m
+            LEFT JOIN users u ON m.user_id = u.user_id
+            ORDER BY m.member_id
+        """)
+
+    # ---- catalogue ----
+    def books_page(self, after, limit, columns):
+        cols = ", ".join(columns)
+        if after is None:
+            rows = self._fetch_all(f"SELECT {cols} FROM books ORDER BY title, book_id LIMIT ?", (limit,))
+        else:
+            rows = self._fetch_all(f"""SELECT {cols} FROM books
+                                       WHERE (title, book_id) > (?, ?)
+                                       ORDER BY title, book_id LIMIT ?""",
+                                   (after[0], after[1], limit))
+        return rows, page_key(rows, limit, columns)
+
+    def search_books(self, text, columns, limit):
+        # Every word has to start a word of the title, the category or the
+        # author's name; books score by where their words matched, and an ISBN
+        # prefix match counts on its own.
+        words, isbn_prefix = parse_search(text)
+        if not words and not isbn_prefix:
+            return []
+        word_matches, scores, params, score_params = [], [], [], []
+        for w in words:
+            start, inner = _like_escape(w) + "%", "% " + _like_escape(w) + "%"
+            fields = [("b.title", 1.0), ("a.name", 0.5), ("b.category", 0.3)]
+            word_matches.append("(" + " OR ".join(f"{f} LIKE ? ESCAPE '\\' OR {f} LIKE ? ESCAPE '\\'"
+                                                  for f, _ in fields) + ")")
+            for f, weight in fields:
+                params += [start, inner]
+                scores.append(f"CASE WHEN {f} LIKE ? ESCAPE '\\' OR {f} LIKE ? ESCAPE '\\' THEN {weight} ELSE 0 END")
+                score_params += [start, inner]
+        conditions = []
+        if word_matches:
+            conditions.append("(" + " AND ".join(word_matches) + ")")
+        if isbn_prefix:
+            conditions.append("b.isbn LIKE ?")
+            params.append(isbn_prefix + "%")
+            scores.append("CASE WHEN b.isbn LIKE ? THEN 1 ELSE 0 END")
+            score_params.append(isbn_prefix + "%")
+        cols = ", ".join(f"b.{c}" for c in columns)
+        sql = f"""
+            SELECT {cols}
+            FROM books b
+            LEFT JOIN authors a ON a.author_id = b.author_id
+            WHERE {" OR ".join(conditions)}
+            ORDER BY ({" + ".join(scores)}) DESC, b.title, b.book_id
+            LIMIT ?
+        """
+        return self._fetch_all(sql, params + score_params + [limit])
+
+    def book_title(self, book_id):
+        row = self._fetch_one("SELECT title FROM books WHERE book_id=?", (book_id,))
+        return row[0] if row else None
+
+    def catalogue_version(self):
+        return self._fetch_one("SELECT n FROM catalogue_version")[0]
+
+    def books_changed_since(self, version, columns):
+        with self._cursor() as cur:
+            # the counter first: a change that lands in between is read now and again next time
+            now = self._execute(cur, "SELECT n FROM catalogue_version").fetchone()[0]
+            changed = self._execute(cur, f"SELECT {', '.join(columns)} FROM books WHERE version > ? ORDER BY version",
+                                    (version,)).fetchall()
+            deleted = self._execute(cur, "SELECT book_id FROM deleted_books WHERE version > ?", (version,)).fetchall()
+        return changed, [row[0] for row in deleted], now
+
+    def add_book(self, title, isbn, author_id, category, copies, columns):
+        return self._write(f"""INSERT INTO books (title, isbn, author_id, category, copies_total, copies_available)
+                               VALUES (?, ?, ?, ?, ?, ?)
+                               RETURNING {", ".join(columns)}""",
+                           (title, isbn, author_id, category, copies, copies), "books")
+
+    def update_book_title(self, book_id, title):
+        return self._write("UPDATE books SET title=? WHERE book_id=? RETURNING book_id, title",
+                           (title, book_id), "books")
+
+    def delete_book(self, book_id):
+        return self._write("DELETE FROM books WHERE book_id=? RETURNING book_id", (book_id,), "books", delete=True)
+
+    def merge_catalogue(self, rows, checkpoint=None):
+        with self._transaction() as cur:
+            self._execute(cur, """CREATE TEMP TABLE import_staging (
+                                      line integer, title text, isbn text,
+                                      author_id integer, category text, copies integer)""")
+            try:
+                while True:
+                    chunk = [row for _, row in zip(range(STAGING_CHUNK), rows)]
+                    if not chunk:
+                        break
+                    cur.executemany("INSERT INTO import_staging VALUES (?, ?, ?, ?, ?, ?)", chunk)
+                if checkpoint is not None:
+                    checkpoint()
+                # per ISBN: the first row's details and the sum of the copies
+                self._execute(cur, """
+                    CREATE TEMP TABLE import_src AS
+                    SELECT s.isbn, s.title, s.author_id, s.category, t.copies
+                    FROM import_staging s
+                    JOIN (SELECT isbn, min(line) AS line, sum(copies) AS copies
+                          FROM import_staging GROUP BY isbn) t
+                      ON t.isbn = s.isbn AND t.line = s.line
+                """)
+                updated = self._execute(cur, "SELECT count(*) FROM import_src WHERE isbn IN (SELECT isbn FROM books)"
+                                        ).fetchone()[0]
+                self._execute(cur, """
+                    UPDATE books
+                       SET copies_total = books.copies_total + s.copies,
+                           copies_available = books.copies_available + s.copies
+                      FROM import_src s
+                     WHERE books.isbn = s.isbn
+                       -- the oldest title only, where an ISBN was entered twice
+                       AND NOT EXISTS (SELECT 1 FROM books d WHERE d.isbn = books.isbn AND d.book_id < books.book_id)
+                """)
+                self._execute(cur, """
+                    INSERT INTO books (title, isbn, author_id, category, copies_total, copies_available)
+                    SELECT s.title, s.isbn, s.author_id, s.category, s.copies, s.copies
+                      FROM import_src s
+                     WHERE NOT EXISTS (SELECT 1 FROM books b WHERE b.isbn = s.isbn)
+                """)
+                inserted = cur.rowcount
+            finally:
+                cur.execute("DROP TABLE IF EXISTS temp.import_staging")
+                cur.execute("DROP TABLE IF EXISTS temp.import_src")
+        return updated, inserted
+
+    # ---- circulation ----
+    def borrow(self, member_id, book_id, max_loans):
+        # the same checks, in the same order, as library_borrow()
+        changes = ChangeSet()
+        with self._transaction() as cur:
+            if self._execute(cur, "SELECT 1 FROM members WHERE member_id=?", (member_id,)).fetchone() is None:
+                return BORROW_NO_MEMBER, changes
+            active = self._execute(cur, """SELECT count(*) FROM loans
+                                            WHERE member_id=? AND status IN ('borrowed', 'overdue')""",
+                                   (member_id,)).fetchone()[0]
+            if active >= max_loans:
+                return BORROW_LIMIT_REACHED, changes
+            hold = self._execute(cur, """UPDATE holds SET status = 'collected'
+                                         WHERE member_id=? AND book_id=? AND status = 'ready'
+                                         RETURNING hold_id, book_id, member_id, status""",
+                                 (member_id, book_id)).fetchone()
+            if hold is not None:
+                changes.upsert("holds", [dict(zip(("hold_id", "book_id", "member_id", "status"), hold))])
+                row = self._execute(cur, "SELECT title, copies_available FROM books WHERE book_id=?",
+                                    (book_id,)).fetchone()
+            else:
+                row = self._execute(cur, """UPDATE books SET copies_available = copies_available - 1
+                                            WHERE book_id=? AND copies_available > 0
+                                            RETURNING title, copies_available""", (book_id,)).fetchone()
+            if row is None:
+                row = self._execute(cur, "SELECT title, copies_available FROM books WHERE book_id=?",
+                                    (book_id,)).fetchone()
+                if row is None:
+                    return BORROW_NO_BOOK, changes
+                changes.upsert("books", [{"book_id": book_id, "copies_available": row[1]}])
+                return BORROW_NO_COPIES, changes
+            title, available = row
+            self._execute(cur, """INSERT INTO loans (book_id, member_id, due_date, status)
+                                  VALUES (?, ?, date('now', 'localtime', ?), 'borrowed')
+                                  RETURNING loan_id, book_id, member_id, loan_date, due_date, return_date, status""",
+                          (book_id, member_id, f"+{BORROW_LOAN_DAYS} days"))
+            loan = rows_as_dicts(cur)[0]
+        loan["title"] = title
+        changes.upsert("loans", [loan])
+        changes.upsert("books", [{"book_id": book_id, "copies_available": available}])
+        return BORROW_OK, changes
+
+    def borrow_many(self, member_id, isbns, book_ids, max_loans, loan_days):
+        requests = borrow_requests(isbns, book_ids)
+        with self._transaction() as cur:
+            if self._execute(cur, "SELECT 1 FROM members WHERE member_id=?", (member_id,)).fetchone() is None:
+                return BORROW_NO_MEMBER, ChangeSet(), [(v, BORROW_NO_MEMBER) for _, v in requests]
+            active = self._execute(cur, """SELECT count(*) FROM loans
+                                            WHERE member_id=? AND status IN ('borrowed', 'overdue')""",
+                                   (member_id,)).fetchone()[0]
+
+            isbn_keys = sorted({v for kind, v in requests if kind == "isbn"} | {str(i).strip() for i in isbns})
+            id_keys = sorted({v for kind, v in requests if kind == "id"})
+            self._execute(cur, f"""
+                SELECT book_id, isbn, copies_available FROM books
+                WHERE isbn IN ({", ".join("?" * len(isbn_keys)) or "NULL"})
+                   OR book_id IN ({", ".join("?" * len(id_keys)) or "NULL"})
+                ORDER BY book_id
+            """, isbn_keys + id_keys)
+            by_isbn, by_id = {}, {}
+            for book_id, isbn, available in cur.fetchall():
+                by_id[book_id] = [book_id, available]
+                if isbn is not None:
+                    by_isbn.setdefault(normalize_isbn(isbn), by_id[book_id])
+            # copies set aside for this member count as available to them
+            self._execute(cur, f"""SELECT book_id, hold_id FROM holds
+                                   WHERE member_id = ? AND status = 'ready'
+                                     AND book_id IN ({", ".join("?" * len(by_id)) or "NULL"})""",
+                          [member_id] + list(by_id))
+            ready = {}
+            for book_id, hold_id in cur.fetchall():
+                ready.setdefault(book_id, []).append(hold_id)
+                by_id[book_id][1] += 1
+
+            granted, rejects, over_limit = plan_borrow(requests, by_isbn, by_id, active, max_loans)
+            if over_limit:
+                self._conn.rollback()
+                return BORROW_LIMIT_REACHED, ChangeSet(), [(v, BORROW_LIMIT_REACHED) for _, v in requests]
+            if not granted:
+                self._conn.rollback()
+                return rejects[0][1], ChangeSet(), rejects
+
+            collected, shelf = split_collections(granted, ready)
+            holds = []
+            for hold_id in collected:
+                self._execute(cur, """UPDATE holds SET status = 'collected' WHERE hold_id = ?
+                                      RETURNING hold_id, book_id, member_id, status""", (hold_id,))
+                holds.extend(rows_as_dicts(cur))
+            rows, books = [], {}
+            for book_id, n in shelf.items():
+                books[book_id] = self._execute(cur, """UPDATE books SET copies_available = copies_available - ?
+                                                       WHERE book_id=? RETURNING title, copies_available""",
+                                               (n, book_id)).fetchone()
+            for book_id in granted:
+                self._execute(cur, """INSERT INTO loans (book_id, member_id, due_date, status)
+                                      VALUES (?, ?, date('now', 'localtime', ?), 'borrowed')
+                                      RETURNING loan_id, book_id, member_id, loan_date, due_date, return_date, status""",
+                              (book_id, member_id, f"+{int(loan_days)} days"))
+                rows.extend(rows_as_dicts(cur))
+        for row in rows:
+            row["title"], row["copies_available"] = books[row["book_id"]]
+        return BORROW_OK, loan_changes(rows).upsert("holds", holds), rejects
+
+    def return_many(self, member_id, loan_ids, isbns, book_ids, shelf_days):
+        requests = return_requests(loan_ids, isbns, book_ids)
+        with self._transaction() as cur:
+            self._execute(cur, """
+                SELECT l.loan_id, l.book_id, b.isbn
+                FROM loans l JOIN books b ON b.book_id = l.book_id
+                WHERE l.member_id = ? AND l.status IN ('borrowed', 'overdue')
+                ORDER BY l.loan_date, l.loan_id
+            """, (member_id,))
+            chosen, rejects = match_returns(requests, cur.fetchall())
+            if not chosen:
+                self._conn.rollback()
+                return ChangeSet(), rejects
+            rows, counts = [], {}
+            for loan_id, book_id in chosen:
+                self._execute(cur, """UPDATE loans SET status = 'returned', return_date = date('now', 'localtime')
+                                      WHERE loan_id = ? AND status IN ('borrowed', 'overdue')
+                                      RETURNING loan_id, book_id, member_id, loan_date, due_date, return_date, status""",
+                              (loan_id,))
+                rows.extend(rows_as_dicts(cur))
+                counts[book_id] = counts.get(book_id, 0) + 1
+            holds, available = self._allocate_copies(cur, counts, shelf_days)
+        for row in rows:
+            row["copies_available"] = available[row["book_id"]]
+        return loan_changes(rows).upsert("holds", holds), rejects
+
+    def _allocate_copies(self, cur, counts, shelf_days):
+        # as PostgresBackend._allocate_copies; the write lock keeps other
+        # returns out, so there is nothing to skip
+        holds, available = [], {}
+        for book_id, n in counts.items():
+            self._execute(cur, """
+                UPDATE holds SET status = 'ready', ready_until = date('now', 'localtime', ?)
+                WHERE hold_id IN (SELECT hold_id FROM holds
+                                  WHERE book_id = ? AND status = 'waiting'
+                                  ORDER BY priority DESC, created_at, hold_id
+                                  LIMIT ?)
+                RETURNING hold_id, book_id, member_id, status, ready_until
+            """, (f"+{int(shelf_days)} days", book_id, n))
+            ready = rows_as_dicts(cur)
+            holds.extend(ready)
+            available[book_id] = self._execute(cur, """UPDATE books SET copies_available = copies_available + ?
+                                                       WHERE book_id=? RETURNING copies_available""",
+                                               (n - len(ready), book_id)).fetchone()[0]
+        return holds, available
+
+    def open_loans(self, member_id):
+        return self._fetch_all("""
+            SELECT l.loan_id, b.book_id, b.title, l.loan_date, l.due_date
+            FROM loans l
+            JOIN books b ON l.book_id = b.book_id
+            WHERE l.member_id=? AND l.status IN ('borrowed', 'overdue')
+        """, (member_id,))
+
+    def member_loan_history(self, member_id):
+        return self._fetch_all("""
+            SELECT l.loan_id, b.title, l.loan_date, l.due_date, l.return_date, l.status
+            FROM loans l
+            JOIN books b ON l.book_id = b.book_id
+            WHERE l.member_id = ?
+            ORDER BY l.loan_date DESC
+        """, (member_id,))
+
+    def recent_loans(self, limit):
+        return self._fetch_all("""
+            SELECT l.loan_id, l.member_id, COALESCE(m.full_name, u.username) AS member_name,
+                   b.book_id, b.title, l.status
+            FROM loans l
+            JOIN books b ON l.book_id = b.book_id
+            LEFT JOIN members m ON l.member_id = m.member_id
+            LEFT JOIN users u ON m.user_id = u.user_id
+            ORDER BY l.loan_date DESC
+            LIMIT ?
+        """, (limit,))
+
+    # ---- loan archive ----
+    def archive_loans(self, before, limit):
+        with self._transaction() as cur:
+            self._execute(cur, """
+                DELETE FROM loans
+                WHERE loan_id IN (SELECT loan_id FROM loans l
+                                  WHERE l.loan_date < :before AND l.status = 'returned' AND l.return_date < :before
+                                    AND NOT EXISTS (SELECT 1 FROM fines f WHERE f.loan_id = l.loan_id AND NOT f.final)
+                                  ORDER BY l.loan_date
+                                  LIMIT :limit)
+                RETURNING loan_id, book_id, member_id, loan_date, due_date, return_date, status
+            """, {"before": before, "limit": limit})
+            rows = cur.fetchall()
+            cur.executemany("""INSERT INTO loans_archive (loan_id, book_id, member_id, loan_date, due_date,
+                                                          return_date, status)
+                               VALUES (?, ?, ?, ?, ?, ?, ?)""", rows)
+        return len(rows)
+
+    def archived_loans(self, member_id):
+        return self._fetch_all("""
+            SELECT a.loan_id, b.title, a.loan_date, a.due_date, a.return_date, a.status
+            FROM loans_archive a
+            JOIN books b ON a.book_id = b.book_id
+            WHERE a.member_id = ?
+            ORDER BY a.loan_date DESC
+        """, (member_id,))
+
+    # ---- holds ----
+    def place_hold(self, member_id, book_id, priority):
+        with self._transaction() as cur:
+            if self._execute(cur, "SELECT 1 FROM members WHERE member_id=?", (member_id,)).fetchone() is None:
+                return BORROW_NO_MEMBER, ChangeSet()
+            row = self._execute(cur, "SELECT copies_available FROM books WHERE book_id=?", (book_id,)).fetchone()
+            if row is None:
+                return BORROW_NO_BOOK, ChangeSet()
+            if row[0] > 0:
+                return HOLD_COPIES_AVAILABLE, ChangeSet()
+            row = self._execute(cur, """
+                INSERT INTO holds (book_id, member_id, priority) VALUES (?, ?, ?)
+                ON CONFLICT (member_id, book_id) WHERE status IN ('waiting', 'ready') DO NOTHING
+                RETURNING hold_id
+            """, (book_id, member_id, priority)).fetchone()
+            if row is None:
+                return HOLD_ALREADY_QUEUED, ChangeSet()
+            self._execute(cur, MEMBER_HOLDS_SQL + " AND h.hold_id = ?", (member_id, row[0]))
+            holds = rows_as_dicts(cur)
+        for hold in holds:
+            hold["member_id"] = member_id
+        return HOLD_OK, ChangeSet().upsert("holds", holds)
+
+    def cancel_hold(self, member_id, hold_id, shelf_days):
+        changes = ChangeSet()
+        with self._transaction() as cur:
+            row = self._execute(cur, """SELECT status FROM holds
+                                        WHERE hold_id = ? AND member_id = ? AND status IN ('waiting', 'ready')""",
+                                (hold_id, member_id)).fetchone()
+            if row is None:
+                return changes
+            self._execute(cur, """UPDATE holds SET status = 'cancelled', ready_until = NULL WHERE hold_id = ?
+                                  RETURNING hold_id, book_id, member_id, status""", (hold_id,))
+            holds = rows_as_dicts(cur)
+            if row[0] == "ready":
+                ready, available = self._allocate_copies(cur, {holds[0]["book_id"]: 1}, shelf_days)
+                holds.extend(ready)
+                changes.upsert("books", [{"book_id": b, "copies_available": n} for b, n in available.items()])
+        return changes.upsert("holds", holds)
+
+    def member_holds(self, member_id):
+        return self._fetch_all(MEMBER_HOLDS_SQL + " ORDER BY h.created_at, h.hold_id", (member_id,))
+
+    def expire_holds(self, as_of, limit, shelf_days):
+        changes = ChangeSet()
+        with self._transaction() as cur:
+            self._execute(cur, """
+                UPDATE holds SET status = 'expired'
+                WHERE hold_id IN (SELECT hold_id FROM holds
+                                  WHERE status = 'ready' AND ready_until < ?
+                                  ORDER BY ready_until
+                                  LIMIT ?)
+                RETURNING hold_id, book_id, member_id, status
+            """, (as_of, limit))
+            holds = rows_as_dicts(cur)
+            if holds:
+                counts = {}
+                for hold in holds:
+                    counts[hold["book_id"]] = counts.get(hold["book_id"], 0) + 1
+                ready, available = self._allocate_copies(cur, counts, shelf_days)
+                changes.upsert("holds", holds + ready)
+                changes.upsert("books", [{"book_id": b, "copies_available": n} for b, n in available.items()])
+        return changes
+
+    # ---- overdue and fines ----
+    def loan_id_range(self):
+        return self._fetch_one("SELECT min(loan_id), max(loan_id) FROM loans")
+
+    def assess_overdue(self, first, last, as_of, fine_per_day, fine_cap):
+        params = {"first": first, "last": last, "as_of": as_of,
+                  "per_day": float(fine_per_day), "cap": float(fine_cap)}
+        with self._transaction() as cur:
+            self._execute(cur, """
+                UPDATE loans SET status = 'overdue'
+                WHERE loan_id BETWEEN :first AND :last AND status = 'borrowed' AND due_date < :as_of
+            """, params)
+            marked = cur.rowcount
+            self._execute(cur, """
+                INSERT INTO fines (loan_id, member_id, days_late, amount, final, assessed_on)
+                SELECT loan_id, member_id, days_late, round(min(days_late * :per_day, :cap), 2),
+                       return_date IS NOT NULL, :as_of
+                FROM (SELECT loan_id, member_id, return_date,
+                             CAST(julianday(COALESCE(return_date, :as_of)) - julianday(due_date) AS integer) AS days_late
+                      FROM loans
+                      WHERE loan_id BETWEEN :first AND :last AND due_date < COALESCE(return_date, :as_of))
+                WHERE true
+                ON CONFLICT (loan_id) DO UPDATE
+                    SET days_late = excluded.days_late, amount = excluded.amount,
+                        final = excluded.final, assessed_on = excluded.assessed_on
+                    WHERE (fines.days_late, fines.amount, fines.final)
+                          IS NOT (excluded.days_late, excluded.amount, excluded.final)
+            """, params)
+            fined = cur.rowcount
+        return marked, fined
+
+    def fine_totals(self):
+        return self._fetch_one("""
+            SELECT count(DISTINCT member_id), COALESCE(sum(NOT final), 0), count(*), COALESCE(sum(amount), 0)
+            FROM fines
+        """)
+
+    def member_fines(self, limit):
+        return self._fetch_all("""
+            SELECT f.member_id, COALESCE(m.full_name, u.username) AS member_name,
+                   f.overdue_loans, f.fined_loans, f.days_late, f.amount
+            FROM (SELECT member_id, sum(NOT final) AS overdue_loans, count(*) AS fined_loans,
+                         sum(days_late) AS days_late, round(sum(amount), 2) AS amount
+                  FROM fines
+                  GROUP BY member_id
+                  ORDER BY amount DESC, member_id
+                  LIMIT ?) f
+            JOIN members m ON m.member_id = f.member_id
+            LEFT JOIN users u ON u.user_id = m.user_id
+            ORDER BY f.amount DESC, f.member_id
+        """, (limit,))
+
+    # ---- statistics ----
+    def circulation_totals(self):
+        return self._fetch_one("""SELECT COALESCE(sum(active_loans), 0), COALESCE(sum(overdue_loans), 0)
+                                  FROM circulation_totals""")
+
+    def daily_circulation(self, since):
+        return self._fetch_all("""
+            SELECT day, sum(loans), sum(returns) FROM circulation_daily
+            WHERE day >= ?
+            GROUP BY day
+            ORDER BY day
+        """, (since,))
+
+    def top_books(self, limit):
+        return self._fetch_all("""
+            SELECT b.book_id, b.title, bl.loans
+            FROM (SELECT book_id, loans FROM book_loans ORDER BY loans DESC, book_id LIMIT ?) bl
+            JOIN books b ON b.book_id = bl.book_id
+            ORDER BY bl.loans DESC, bl.book_id
+        """, (limit,))
+
+    def top_categories(self, limit):
+        return self._fetch_all("""
+            SELECT category, sum(loans) AS loans FROM category_loans
+            GROUP BY category
+            ORDER BY loans DESC, category
+            LIMIT ?
+        """, (limit,))
+
+    def largest_clubs(self, limit):
+        return self._fetch_all("""
+            SELECT bc.club_id, bc.name, cs.members
+            FROM club_sizes cs
+            JOIN book_clubs bc ON bc.club_id = cs.club_id
+            WHERE cs.members > 0
+            ORDER BY cs.members DESC, cs.club_id
+            LIMIT ?
+        """, (limit,))
+
+    # ---- recommendations ----
+    def queue_recommendations(self, history, rebuild):
+        with self._transaction() as cur:
+            if rebuild:
+                self._execute(cur, "UPDATE recommender_state SET last_loan_id = 0")
+                self._execute(cur, """INSERT INTO recommender_queue SELECT DISTINCT book_id FROM book_neighbours
+                                      WHERE true ON CONFLICT DO NOTHING""")
+            mark = self._execute(cur, "SELECT last_loan_id FROM recommender_state").fetchone()[0]
+            upto = self._execute(cur, "SELECT COALESCE(max(loan_id), 0) FROM loans").fetchone()[0]
+            self._execute(cur, "DROP TABLE IF EXISTS temp.recommender_members")
+            self._execute(cur, """CREATE TEMP TABLE recommender_members AS
+                                  SELECT DISTINCT member_id FROM loans WHERE loan_id > ? AND loan_id <= ?""",
+                          (mark, upto))
+            # the books leaving the baskets and those coming in both change
+            queue_baskets = """
+                INSERT INTO recommender_queue
+                SELECT DISTINCT book_id FROM recommender_baskets
+                WHERE member_id IN (SELECT member_id FROM temp.recommender_members)
+                ON CONFLICT DO NOTHING
+            """
+            self._execute(cur, queue_baskets)
+            self._execute(cur, """DELETE FROM recommender_baskets
+                                  WHERE member_id IN (SELECT member_id FROM temp.recommender_members)""")
+            self._execute(cur, """
+                INSERT INTO recommender_baskets (member_id, book_id)
+                SELECT member_id, book_id
+                FROM (SELECT member_id, book_id,
+                             row_number() OVER (PARTITION BY member_id ORDER BY max(loan_id) DESC) AS n
+                      FROM loans
+                      WHERE member_id IN (SELECT member_id FROM temp.recommender_members)
+                      GROUP BY member_id, book_id)
+                WHERE n <= ?
+            """, (history,))
+            self._execute(cur, queue_baskets)
+            self._execute(cur, "DROP TABLE temp.recommender_members")
+            self._execute(cur, """DELETE FROM book_borrowers
+                                  WHERE book_id IN (SELECT book_id FROM recommender_queue)""")
+            self._execute(cur, """
+                INSERT INTO book_borrowers (book_id, members)
+                SELECT book_id, count(*) FROM recommender_baskets
+                WHERE book_id IN (SELECT book_id FROM recommender_queue)
+                GROUP BY book_id
+            """)
+            self._execute(cur, "UPDATE recommender_state SET last_loan_id = ?", (upto,))
+            return self._execute(cur, "SELECT count(*) FROM recommender_queue").fetchone()[0]
+
+    def rank_recommendations(self, limit, top, min_together):
+        params = {"limit": limit, "top": top, "min_together": min_together}
+        with self._transaction() as cur:
+            # the batch is the queued books up to `last`; nothing else writes meanwhile
+            params["last"] = self._execute(cur, """
+                SELECT max(book_id) FROM (SELECT book_id FROM recommender_queue ORDER BY book_id LIMIT :limit)
+            """, params).fetchone()[0]
+            if params["last"] is None:
+                return 0
+            self._execute(cur, """DELETE FROM book_neighbours
+                                  WHERE book_id IN (SELECT book_id FROM recommender_queue WHERE book_id <= :last)""",
+                          params)
+            self._execute(cur, """
+                INSERT INTO book_neighbours (book_id, rank, neighbour_id, score)
+                SELECT book_id, rank, neighbour_id, score
+                FROM (SELECT book_id, neighbour_id, score,
+                             row_number() OVER (PARTITION BY book_id ORDER BY score DESC, neighbour_id) AS rank
+                      FROM (SELECT p.book_id, p.neighbour_id, p.together / sqrt(ba.members * bb.members) AS score
+                            FROM (SELECT a.book_id, b.book_id AS neighbour_id, count(*) AS together
+                                  FROM recommender_queue q
+                                  JOIN recommender_baskets a ON a.book_id = q.book_id
+                                  JOIN recommender_baskets b ON b.member_id = a.member_id AND b.book_id <> a.book_id
+                                  WHERE q.book_id <= :last
+                                  GROUP BY a.book_id, b.book_id
+                                  HAVING count(*) >= :min_together) p
+                            JOIN book_borrowers ba ON ba.book_id = p.book_id
+                            JOIN book_borrowers bb ON bb.book_id = p.neighbour_id))
+                WHERE rank <= :top
+            """, params)
+            self._execute(cur, "DELETE FROM recommender_queue WHERE book_id <= :last", params)
+            return cur.rowcount
+
+    def similar_books(self, book_id, limit):
+        return self._fetch_all("""
+            SELECT b.book_id, b.title, b.category, b.copies_available, n.score
+            FROM book_neighbours n
+            JOIN books b ON b.book_id = n.neighbour_id
+            WHERE n.book_id = ?
+            ORDER BY n.rank
+            LIMIT ?
+        """, (book_id, limit))
+
+    # ---- book clubs ----
+    def clubs(self):
+        return self._fetch_all("SELECT club_id, name, description FROM book_clubs ORDER BY name")
+
+    def club_members(self, club_id):
+        return self._fetch_all("""
+            SELECT m.member_id, m.full_name, u.username
+            FROM club_members cm
+            JOIN members m ON cm.member_id = m.member_id
+            LEFT JOIN users u ON m.user_id = u.user_id
+            WHERE cm.club_id = ?
+            ORDER BY m.full_name
+        """, (club_id,))
+
+    def member_clubs(self, member_id):
+        return self._fetch_all("""
+            SELECT bc.club_id, bc.name
+            FROM club_members cm
+            JOIN book_clubs bc ON cm.club_id = bc.club_id
+            WHERE cm.member_id = ?
+            ORDER BY bc.name
+        """, (member_id,))
+
+    def create_club(self, name, description):
+        return self._write("""INSERT INTO book_clubs (name, description) VALUES (?, ?)
+                              RETURNING club_id, name, description""", (name, description), "book_clubs")
+
+    def delete_club(self, club_id):
+        return self._write("DELETE FROM book_clubs WHERE club_id=? RETURNING club_id", (club_id,),
+                           "book_clubs", delete=True)
+
+    def join_club(self, member_id, club_id):
+        changes = ChangeSet()
+        with self._transaction() as cur:
+            self._execute(cur, """INSERT INTO club_members (member_id, club_id) VALUES (?, ?)
+                                  ON CONFLICT (club_id, member_id) DO NOTHING""", (member_id, club_id))
+            if cur.rowcount:
+                self._execute(cur, """
+                    SELECT ? AS club_id, m.member_id, m.full_name, u.username
+                    FROM members m
+                    LEFT JOIN users u ON u.user_id = m.user_id
+                    WHERE m.member_id = ?
+                """, (club_id, member_id))
+                changes.upsert("club_members", rows_as_dicts(cur))
+        return changes
+
+    def leave_club(self, member_id, club_id):
+        return self._write("DELETE FROM club_members WHERE member_id=? AND club_id=? RETURNING club_id, member_id",
+                           (member_id, club_id), "club_members", delete=True)
+
+    def member_id_range(self):
+        return self._fetch_one("SELECT min(member_id), max(member_id) FROM members")
+
+    def profile_readers(self, first, last, categories):
+        params = {"first": first, "last": last, "categories": categories}
+        with self._transaction() as cur:
+            self._execute(cur, "DELETE FROM reader_categories WHERE member_id BETWEEN :first AND :last", params)
+            self._execute(cur, """
+                INSERT INTO reader_categories (member_id, category, weight)
+                SELECT member_id, category, loans / sqrt(sum(loans * loans) OVER (PARTITION BY member_id))
+                FROM (SELECT member_id, category, loans,
+                             row_number() OVER (PARTITION BY member_id ORDER BY loans DESC, category) AS n
+                      FROM (SELECT l.member_id, b.category, count(*) AS loans
+                            FROM loans l
+                            JOIN books b ON b.book_id = l.book_id
+                            WHERE l.member_id BETWEEN :first AND :last AND b.category <> ''
+                            GROUP BY l.member_id, b.category) counted) ranked
+                WHERE n <= :categories
+            """, params)
+            return self._execute(cur, """SELECT count(DISTINCT member_id) FROM reader_categories
+                                         WHERE member_id BETWEEN :first AND :last""", params).fetchone()[0]
+
+    def profile_clubs(self):
+        with self._transaction() as cur:
+            self._execute(cur, "DELETE FROM club_categories")
+            self._execute(cur, """
+                INSERT INTO club_categories (category, club_id, weight)
+                SELECT category, club_id, weight / sqrt(sum(weight * weight) OVER (PARTITION BY club_id))
+                FROM (SELECT cm.club_id, rc.category, sum(rc.weight) AS weight
+                      FROM club_members cm
+                      JOIN reader_categories rc ON rc.member_id = cm.member_id
+                      GROUP BY cm.club_id, rc.category) summed
+            """)
+            return self._execute(cur, "SELECT count(DISTINCT club_id) FROM club_categories").fetchone()[0]
+
+    def suggest_clubs(self, first, last, top):
+        params = {"first": first, "last": last, "top": top}
+        with self._transaction() as cur:
+            self._execute(cur, "DELETE FROM club_suggestions WHERE member_id BETWEEN :first AND :last", params)
+            self._execute(cur, """
+                INSERT INTO club_suggestions (member_id, rank, club_id, score)
+                SELECT member_id, rank, club_id, score
+                FROM (SELECT member_id, club_id, score,
+                             row_number() OVER (PARTITION BY member_id ORDER BY score DESC, club_id) AS rank
+                      FROM (SELECT rc.member_id, cc.club_id, sum(rc.weight * cc.weight) AS score
+                            FROM reader_categories rc
+                            JOIN club_categories cc ON cc.category = rc.category
+                            WHERE rc.member_id BETWEEN :first AND :last
+                            GROUP BY rc.member_id, cc.club_id) scored
+                      WHERE NOT EXISTS (SELECT 1 FROM club_members cm
+                                        WHERE cm.club_id = scored.club_id AND cm.member_id = scored.member_id)) ranked
+                WHERE rank <= :top
+            """, params)
+            return self._execute(cur, """SELECT count(*) FROM club_suggestions
+                                         WHERE member_id BETWEEN :first AND :last AND rank = 1""", params).fetchone()[0]
+
+    def suggested_clubs(self, member_id):
+        return self._fetch_all("""
+            SELECT bc.club_id, bc.name, bc.description, s.score
+            FROM club_suggestions s
+            JOIN book_clubs bc ON bc.club_id = s.club_id
+            WHERE s.member_id = ?
+              AND NOT EXISTS (SELECT 1 FROM club_members cm WHERE cm.club_id = s.club_id AND cm.member_id = s.member_id)
+            ORDER BY s.rank
+        """, (member_id,))
+
+    # ---- reports and tooling ----
+    def bulk_load(self, table, columns, rows):
+        # AUTOINCREMENT keeps track of explicit ids by itself
+        rows = iter(rows)
+        loaded = 0
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        with self._transaction() as cur:
+            while True:
+                chunk = [row for _, row in zip(range(STAGING_CHUNK), rows)]
+                if not chunk:
+                    break
+                cur.executemany(sql, chunk)
+                loaded += len(chunk)
+            cur.execute(f"ANALYZE {table}")
+        return loaded
+
+    def stream_query(self, sql, itersize):
+        # Fetches `itersize` rows at a time, taking the connection lock only per
+        # batch so the rest of the application isn't held up by a long export.
+        with self._lock:
+            cur = self._conn.cursor()
+        try:
+            with self._lock:
+                self._execute(cur, sql)
+                batch = cur.fetchmany(itersize)
+            yield [d[0] for d in cur.description]
+            while batch:
+                yield from batch
+                with self._lock:
+                    batch = cur.fetchmany(itersize)
+        finally:
+            with self._lock:
+                cur.close()
+
+    def estimate_rows(self, table):
+        # the highest rowid; no table scan
+        if table not in ("books", "loans", "members", "users", "authors", "book_clubs", "club_members"):
+            return 0
+        row = self._fetch_one(f"SELECT max(rowid) FROM {table}")
+        return row[0] or 0
@@ -0,0 +1,40 @@
+import datetime
+
+from database.backend import get_backend
+
+# Circulation statistics for the librarians' dashboard. Nothing here counts
+# loans: the database keeps running totals as loans are written (see schema
+# migration 9) and these are read off them, so the dashboard costs the same
+# with a thousand loans or ten million.
+
+DASHBOARD_DAYS = 30  # days of loans per day shown
+DASHBOARD_TOP = 10   # rows in each top-N list
+
+
+class Dashboard:
+    __slots__ = ("active_loans", "overdue_loans", "daily", "top_books", "top_categories", "largest_clubs")
+
+    def __init__(self, active_loans, overdue_loans, daily, top_books, top_categories, largest_clubs):
+        self.active_loans = active_loans
+        self.overdue_loans = overdue_loans
+        self.daily = daily                    # [(day, loans, returns)], every day, oldest first
+        self.top_books = top_books            # [(book_id, title, loans)]
+        self.top_categories = top_categories  # [(category, loans)]
+        self.largest_clubs = largest_clubs    # [(club_id, name, members)]
+
+    def loans_in_period(self):
+        return sum(loans for _, loans, _ in self.daily)
+
+
+def dashboard(days=DASHBOARD_DAYS, top=DASHBOARD_TOP, today=None):
+    db = get_backend()
+    today = today or datetime.date.today()
+    since = today - datetime.timedelta(days=days - 1)
+    counted = {day: (loans, returns) for day, loans, returns in db.daily_circulation(since)}
+    # days without any circulation are listed too, with zeros
+    daily = []
+    for i in range(days):
+        day = since + datetime.timedelta(days=i)
+        daily.append((day,) + counted.get(day, (0, 0)))
+    active, overdue = db.circulation_totals()
+    return Dashboard(active, overdue, daily, db.top_books(top), db.top_categories(top), db.largest_clubs(top))
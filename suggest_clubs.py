@@ -0,0 +1,28 @@
+# tools/suggest_clubs.py
+# Works out every member's club suggestions from their reading (see
+# BookClub.suggest). Meant to run nightly, after tools/overdue_job.py:
+#
+#   45 0 * * *  cd /srv/library && python -m tools.suggest_clubs
+import argparse
+import sys
+import time
+
+from models.book_club import BookClub
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Suggest book clubs to members")
+    parser.parse_args(argv)
+
+    def progress(step, fraction):
+        print(f"\r{step}: {fraction:6.1%}", end="", file=sys.stderr)
+
+    start = time.monotonic()
+    suggested = BookClub.suggest(progress=progress)
+    print(file=sys.stderr)
+    print(f"{suggested} members given club suggestions in {time.monotonic() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
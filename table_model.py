@@ -0,0 +1,233 @@
+# gui/table_model.py
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtWidgets import QTableView, QAbstractItemView
+
+
+class RowTableModel(QAbstractTableModel):
+    # rows handed to the view per fetchMore() call
+    BATCH_SIZE = 200
+
+    def __init__(self, headers, formatters=None, parent=None, columns=None, record=None):
+        # With `record` set, rows are model objects rather than tuples: cells read
+        # the attribute named by their column, and record(values) gives the object
+        # for a new row's dict of column -> value (see Repository.record).
+        super().__init__(parent)
+        self._headers = list(headers)
+        self._formatters = formatters or {}
+        self._columns = tuple(columns) if columns is not None else None  # field names, for patch()
+        if record is not None and self._columns is None:
+            raise ValueError("object rows need the model's column names")
+        self._record = record
+        self._rows = []
+        self._exposed = 0
+        self._fetch = None
+        self._next_key = None
+        self._max_rows = None
+        self._pending = False
+        self._token = 0
+
+    # ---- Qt model API ----
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._exposed
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        val = self._value(self._rows[index.row()], index.column())
+        fmt = self._formatters.get(index.column())
+        if fmt is not None:
+            return fmt(val)
+        return "" if val is None else str(val)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._headers[section] if section < len(self._headers) else None
+        return str(section + 1)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return self._exposed < len(self._rows) or self._source_has_more()
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        if self._exposed >= len(self._rows):
+            if self._source_has_more():
+                self._pending = True
+                token = self._token
+                self._fetch(self._next_key, lambda rows, next_key: self._deliver(token, rows, next_key, False))
+            return
+        self._expose_batch()
+
+    # ---- row access ----
+    def set_rows(self, rows):
+        self._token += 1
+        self._fetch = None
+        self._next_key = None
+        self._pending = False
+        self._reset(rows)
+
+    def set_source(self, fetch, start=None, max_rows=None):
+        # fetch(after, deliver) loads the page following key `after` and calls
+        # deliver(rows, next_key), right away or later from a worker callback;
+        # further pages are pulled through fetchMore() as the view scrolls,
+        # up to max_rows rows in total
+        self._token += 1
+        token = self._token
+        self._fetch = fetch
+        self._next_key = None
+        self._max_rows = max_rows
+        self._pending = True
+        fetch(start, lambda rows, next_key: self._deliver(token, rows, next_key, True))
+
+    def patch(self, rows, deleted=(), key=None, insert_new=False):
+        # Applies a write's changes in place instead of reloading. `rows` are dicts
+        # of column -> value and may be partial: a matching row gets just those
+        # columns replaced. Complete rows not shown yet are appended if insert_new
+        # is set; rows whose key is in `deleted` are removed.
+        if self._columns is None:
+            raise ValueError("patching needs the model's column names")
+        k = self._columns.index(key or self._columns[0])
+        key = self._columns[k]
+        positions = {self._value(row, k): i for i, row in enumerate(self._rows)}
+        last_col = len(self._headers) - 1
+
+        appended = []
+        for change in rows:
+            i = positions.get(change.get(key))
+            if i is None:
+                if insert_new and all(c in change for c in self._columns):
+                    appended.append(self._make_row(change))
+                continue
+            old = self._rows[i]
+            if self._record is None:
+                self._rows[i] = tuple(change.get(c, old[j]) for j, c in enumerate(self._columns))
+            else:
+                for c in self._columns:
+                    if c in change:
+                        setattr(old, c, change[c])
+            if i < self._exposed:
+                self.dataChanged.emit(self.index(i, 0), self.index(i, last_col))
+
+        for i in sorted({positions[v] for v in deleted if v in positions}, reverse=True):
+            if i < self._exposed:
+                self.beginRemoveRows(QModelIndex(), i, i)
+                del self._rows[i]
+                self._exposed -= 1
+                self.endRemoveRows()
+            else:
+                del self._rows[i]
+
+        if appended:
+            fully_shown = self._exposed == len(self._rows)
+            self._rows.extend(appended)
+            if fully_shown:
+                self.beginInsertRows(QModelIndex(), self._exposed, len(self._rows) - 1)
+                self._exposed = len(self._rows)
+                self.endInsertRows()
+
+    def columns(self):
+        return self._columns
+
+    def _value(self, row, column):
+        if self._record is None:
+            return row[column]
+        return getattr(row, self._columns[column])
+
+    def _make_row(self, values):
+        if self._record is None:
+            return tuple(values[c] for c in self._columns)
+        return self._record({c: values[c] for c in self._columns})
+
+    def next_key(self):
+        return self._next_key
+
+    def is_loading(self):
+        return self._pending
+
+    def _deliver(self, token, rows, next_key, reset):
+        if token != self._token:
+            return  # superseded by a newer set_rows()/set_source()
+        self._pending = False
+        self._next_key = next_key
+        if reset:
+            self._reset(rows)
+        else:
+            self._rows.extend(rows)
+            self._expose_batch()
+
+    def _expose_batch(self):
+        n = min(self.BATCH_SIZE, len(self._rows) - self._exposed)
+        if n <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._exposed, self._exposed + n - 1)
+        self._exposed += n
+        self.endInsertRows()
+
+    def _source_has_more(self):
+        if self._fetch is None or self._next_key is None or self._pending:
+            return False
+        return self._max_rows is None or len(self._rows) < self._max_rows
+
+    def _reset(self, rows):
+        self.beginResetModel()
+        self._rows = rows if isinstance(rows, list) else list(rows)
+        self._exposed = min(self.BATCH_SIZE, len(self._rows))
+        self.endResetModel()
+
+    def row(self, r):
+        return self._rows[r]
+
+    def rows(self):
+        return self._rows
+
+
+class RowTableView(QTableView):
+    # rows sampled by resizeColumnsToContents(); keeps sizing O(1) in result size
+    RESIZE_SAMPLE = 100
+
+    def __init__(self, headers, formatters=None, parent=None, columns=None, record=None):
+        super().__init__(parent)
+        self.setModel(RowTableModel(headers, formatters, self, columns, record))
+        self.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.horizontalHeader().setResizeContentsPrecision(self.RESIZE_SAMPLE)
+        self.verticalHeader().setResizeContentsPrecision(self.RESIZE_SAMPLE)
+        self.model().modelReset.connect(self.resizeColumnsToContents)
+
+    def set_rows(self, rows):
+        self.model().set_rows(rows)
+
+    def apply_changes(self, changes, table, key=None, accept=None, insert_new=False):
+        # Patches this view with the rows of `table` in a ChangeSet. accept(row) says
+        # whether a changed row belongs in the view (True), has to leave it (False)
+        # or is none of its business (None); by default every row belongs.
+        rows, gone = [], []
+        key = key or self.model().columns()[0]
+        for row in changes.upserted(table):
+            verdict = True if accept is None else accept(row)
+            if verdict:
+                rows.append(row)
+            elif verdict is False:
+                gone.append(row[key])
+        for row in changes.deleted(table):
+            if accept is None or accept(row) is not None:
+                gone.append(row[key])
+        if rows or gone:
+            self.model().patch(rows, gone, key, insert_new)
+
+    def selected_records(self):
+        rows = sorted({index.row() for index in self.selectionModel().selectedRows()})
+        return [self.model().row(r) for r in rows]
+
+    def current_record(self):
+        index = self.currentIndex()
+        if not index.isValid():
+            return None
+        return self.model().row(index.row())
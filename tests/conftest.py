@@ -0,0 +1,37 @@
+# tests/conftest.py
+# Shared fixtures: a fresh in-memory SqliteBackend per test, installed as the
+# process backend so the models use it too, and helpers to add members and
+# books to it.
+import pytest
+
+from database.backend import set_backend
+from database.sqlite_backend import SqliteBackend
+from models.book import Book
+
+
+@pytest.fixture
+def db():
+    backend = SqliteBackend(":memory:")
+    backend.prepare()
+    set_backend(backend)
+    yield backend
+    set_backend(None)
+
+
+@pytest.fixture
+def add_member(db):
+    names = iter(range(1, 1000))
+
+    def add(full_name=None):
+        n = next(names)
+        user_id = db.create_account(f"member{n}", "pw", "member", full_name or f"Member {n}")
+        return db.member_id_for_user(user_id)
+    return add
+
+
+@pytest.fixture
+def add_book(db):
+    def add(title="A Book", isbn=None, copies=1, category=None):
+        changes = db.add_book(title, isbn, None, category, copies, Book.CATALOGUE_COLUMNS)
+        return changes.upserted("books")[0]["book_id"]
+    return add
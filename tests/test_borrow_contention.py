@@ -0,0 +1,73 @@
+# tests/test_borrow_contention.py
+# A hundred borrowers racing for the last copy of a book, against the Postgres
+# server in DB_CONFIG: library_borrow() must hand it to exactly one of them.
+# Skipped when psycopg2 is not installed or no server answers. Everything
+# created is removed again (tools/borrow_contention.py does the setup and
+# teardown).
+import threading
+import uuid
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+from database import database, schema
+from database.backend import BORROW_NO_COPIES, BORROW_OK, set_backend
+from database.database import connection
+from database.pg_backend import PostgresBackend
+from tools.borrow_contention import _run_concurrently, _setup, _teardown
+
+BORROWERS = 100
+
+
+@pytest.fixture
+def postgres():
+    maxconn = database.POOL_CONFIG['maxconn']
+    database.POOL_CONFIG['maxconn'] = max(maxconn, BORROWERS + 2)
+    try:
+        schema.migrate()
+    except psycopg2.OperationalError as e:
+        database.close_pool()
+        database.POOL_CONFIG['maxconn'] = maxconn
+        pytest.skip(f"no Postgres server: {e}")
+    set_backend(PostgresBackend())
+    yield
+    set_backend(None)
+    database.close_pool()
+    database.POOL_CONFIG['maxconn'] = maxconn
+
+
+def test_one_borrower_gets_the_last_copy(postgres):
+    tag = uuid.uuid4().hex[:8]
+    book_id, member_ids, _ = _setup(BORROWERS, 1, tag)
+    # copies_available as seen from another session while the race runs
+    seen = []
+    watching, done = threading.Event(), threading.Event()
+
+    def watch():
+        with connection() as conn, conn.cursor() as cur:
+            while not done.is_set():
+                cur.execute("SELECT copies_available FROM books WHERE book_id=%s", (book_id,))
+                seen.append(cur.fetchone()[0])
+                conn.rollback()
+                watching.set()
+
+    watcher = threading.Thread(target=watch)
+    watcher.start()
+    try:
+        watching.wait(10)
+        results = _run_concurrently([(m, book_id) for m in member_ids])
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT copies_available FROM books WHERE book_id=%s", (book_id,))
+            left = cur.fetchone()[0]
+            cur.execute("SELECT count(*) FROM loans WHERE book_id=%s", (book_id,))
+            loans = cur.fetchone()[0]
+    finally:
+        done.set()
+        watcher.join()
+        _teardown(tag)
+
+    assert results.count(BORROW_OK) == 1
+    assert results.count(BORROW_NO_COPIES) == BORROWERS - 1
+    assert (left, loans) == (0, 1)
+    assert min(seen) >= 0
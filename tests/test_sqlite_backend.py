@@ -0,0 +1,189 @@
+# tests/test_sqlite_backend.py
+# Circulation, holds, catalogue import and loan archival on the embedded
+# backend. The result codes are the ones library_borrow() and the other
+# Postgres functions hand back, so the GUI reads both engines the same way.
+import datetime
+
+from database.backend import (
+    BORROW_LIMIT_REACHED, BORROW_NO_BOOK, BORROW_NO_COPIES, BORROW_NO_MEMBER, BORROW_OK, HOLD_ALREADY_QUEUED,
+    HOLD_COPIES_AVAILABLE, HOLD_OK, RETURN_NOT_ON_LOAN, split_scans,
+)
+from models.member import Member
+
+MAX_LOANS = Member.MAX_ACTIVE_LOANS
+LOAN_DAYS = Member.LOAN_DAYS
+SHELF_DAYS = Member.HOLD_SHELF_DAYS
+
+
+def available(db, book_id):
+    rows, _ = db.books_page(None, 1000, ("book_id", "title", "copies_available"))
+    return {row[0]: row[2] for row in rows}[book_id]
+
+
+# ---- borrow ----
+def test_borrow_takes_a_copy_and_records_the_loan(db, add_member, add_book):
+    member_id, book_id = add_member(), add_book(copies=2)
+    code, changes = db.borrow(member_id, book_id, MAX_LOANS)
+    assert code == BORROW_OK
+    loan, = changes.upserted("loans")
+    assert (loan["member_id"], loan["book_id"], loan["status"]) == (member_id, book_id, "borrowed")
+    assert changes.upserted("books") == [{"book_id": book_id, "copies_available": 1}]
+    assert available(db, book_id) == 1
+
+
+def test_borrow_result_codes(db, add_member, add_book):
+    member_id, book_id = add_member(), add_book(copies=1)
+    assert db.borrow(member_id, book_id, MAX_LOANS)[0] == BORROW_OK
+    assert db.borrow(add_member(), book_id, MAX_LOANS)[0] == BORROW_NO_COPIES
+    assert db.borrow(member_id, 999, MAX_LOANS)[0] == BORROW_NO_BOOK
+    assert db.borrow(999, book_id, MAX_LOANS)[0] == BORROW_NO_MEMBER
+    assert db.borrow(member_id, add_book(copies=1), 1)[0] == BORROW_LIMIT_REACHED
+    assert available(db, book_id) == 0
+
+
+def test_borrow_many_skips_what_cannot_be_borrowed(db, add_member, add_book):
+    member_id = add_member()
+    hobbit = add_book("The Hobbit", "9780261103344", copies=1)
+    taken = add_book("Taken", copies=0)
+    code, changes, rejects = db.borrow_many(member_id, ["978-0-261-10334-4", "9780000000002"], [taken],
+                                            MAX_LOANS, LOAN_DAYS)
+    assert code == BORROW_OK
+    assert [loan["book_id"] for loan in changes.upserted("loans")] == [hobbit]
+    assert rejects == [("9780000000002", BORROW_NO_BOOK), (taken, BORROW_NO_COPIES)]
+
+
+def test_borrow_many_over_the_limit_borrows_nothing(db, add_member, add_book):
+    member_id = add_member()
+    book_ids = [add_book(f"Book {i}") for i in range(3)]
+    code, changes, rejects = db.borrow_many(member_id, [], book_ids, 2, LOAN_DAYS)
+    assert code == BORROW_LIMIT_REACHED
+    assert not changes
+    assert rejects == [(book_id, BORROW_LIMIT_REACHED) for book_id in book_ids]
+    assert db.open_loans(member_id) == []
+
+
+# ---- return ----
+def test_return_many_by_loan_id_and_isbn(db, add_member, add_book):
+    member_id = add_member()
+    first = add_book("First", "9780306406157", copies=1)
+    second = add_book("Second", copies=1)
+    db.borrow(member_id, first, MAX_LOANS)
+    loan_id = db.borrow(member_id, second, MAX_LOANS)[1].upserted("loans")[0]["loan_id"]
+    changes, rejects = db.return_many(member_id, [loan_id], ["978-0-306-40615-7", "9780000000002"], [],
+                                      SHELF_DAYS)
+    assert sorted((loan["book_id"], loan["status"]) for loan in changes.upserted("loans")) == \
+        [(first, "returned"), (second, "returned")]
+    assert rejects == [("9780000000002", RETURN_NOT_ON_LOAN)]
+    assert (available(db, first), available(db, second)) == (1, 1)
+    assert db.open_loans(member_id) == []
+
+
+def test_return_of_a_loan_already_returned_is_rejected(db, add_member, add_book):
+    member_id, book_id = add_member(), add_book()
+    loan_id = db.borrow(member_id, book_id, MAX_LOANS)[1].upserted("loans")[0]["loan_id"]
+    db.return_many(member_id, [loan_id], [], [], SHELF_DAYS)
+    changes, rejects = db.return_many(member_id, [loan_id], [], [], SHELF_DAYS)
+    assert not changes
+    assert rejects == [(loan_id, RETURN_NOT_ON_LOAN)]
+    assert available(db, book_id) == 1
+
+
+def test_scanned_book_numbers_borrow_and_return_that_book(db, add_member, add_book):
+    member_id = add_member()
+    hobbit = add_book("The Hobbit", "9780261103344")
+    second = add_book("Second")
+    third = add_book("Third")
+    isbns, book_ids = split_scans(["978-0-261-10334-4", f" {third} ", str(second)])
+    assert (isbns, book_ids) == (["978-0-261-10334-4"], [third, second])
+    code, changes, _ = db.borrow_many(member_id, isbns, book_ids, MAX_LOANS, LOAN_DAYS)
+    assert code == BORROW_OK
+    loans = {loan["book_id"]: loan["loan_id"] for loan in changes.upserted("loans")}
+    # the label numbers must not be mistaken for loan ids
+    assert loans[third] == second and loans[second] != second
+    isbns, book_ids = split_scans([str(second)])
+    changes, rejects = db.return_many(member_id, [], isbns, book_ids, SHELF_DAYS)
+    assert [loan["loan_id"] for loan in changes.upserted("loans")] == [loans[second]]
+    assert rejects == []
+    assert sorted(row[1] for row in db.open_loans(member_id)) == [hobbit, third]
+    changes, rejects = db.return_many(member_id, [], [], [second], SHELF_DAYS)
+    assert not changes
+    assert rejects == [(second, RETURN_NOT_ON_LOAN)]
+
+
+# ---- holds ----
+def test_place_hold_result_codes(db, add_member, add_book):
+    reader, waiting = add_member(), add_member()
+    book_id = add_book(copies=1)
+    assert db.place_hold(waiting, book_id, 0)[0] == HOLD_COPIES_AVAILABLE
+    db.borrow(reader, book_id, MAX_LOANS)
+    code, changes = db.place_hold(waiting, book_id, 0)
+    assert code == HOLD_OK
+    hold, = changes.upserted("holds")
+    assert (hold["book_id"], hold["member_id"], hold["status"]) == (book_id, waiting, "waiting")
+    assert db.place_hold(waiting, book_id, 0)[0] == HOLD_ALREADY_QUEUED
+    assert db.place_hold(waiting, 999, 0)[0] == BORROW_NO_BOOK
+    assert db.place_hold(999, book_id, 0)[0] == BORROW_NO_MEMBER
+
+
+def test_returned_copy_is_set_aside_for_the_first_hold(db, add_member, add_book):
+    reader, waiting, other = add_member(), add_member(), add_member()
+    book_id = add_book(copies=1)
+    loan_id = db.borrow(reader, book_id, MAX_LOANS)[1].upserted("loans")[0]["loan_id"]
+    db.place_hold(waiting, book_id, 0)
+    changes, _ = db.return_many(reader, [loan_id], [], [], SHELF_DAYS)
+    hold, = changes.upserted("holds")
+    assert (hold["member_id"], hold["status"]) == (waiting, "ready")
+    assert available(db, book_id) == 0
+    # nobody else can take it; the member it waits for collects it
+    assert db.borrow(other, book_id, MAX_LOANS)[0] == BORROW_NO_COPIES
+    code, changes = db.borrow(waiting, book_id, MAX_LOANS)
+    assert code == BORROW_OK
+    assert changes.upserted("holds")[0]["status"] == "collected"
+    assert available(db, book_id) == 0
+
+
+# ---- catalogue import ----
+def test_merge_catalogue_adds_copies_to_known_isbns_and_inserts_new_ones(db, add_book):
+    known = add_book("Known", "9780306406157", copies=1)
+    duplicate = add_book("Known, entered again", "9780306406157", copies=1)
+    rows = [(2, "Known", "9780306406157", None, None, 2),
+            (3, "New", "9780000000002", None, "Fiction", 1),
+            (4, "New, second line", "9780000000002", None, None, 3)]
+    assert db.merge_catalogue(iter(rows)) == (1, 1)
+    rows, _ = db.books_page(None, 1000, ("book_id", "title", "isbn", "copies_total", "copies_available"))
+    books = {row[0]: row[1:] for row in rows}
+    assert books[known] == ("Known", "9780306406157", 3, 3)
+    assert books[duplicate] == ("Known, entered again", "9780306406157", 1, 1)
+    new, = [book for book in books.values() if book[1] == "9780000000002"]
+    assert new == ("New", "9780000000002", 4, 4)
+
+
+# ---- loan archive ----
+def test_archive_loans_moves_only_loans_returned_before_the_cutoff(db, add_member, add_book):
+    member_id, book_id = add_member(), add_book(copies=5)
+    day = datetime.date(2020, 1, 1)
+    columns = ("loan_id", "book_id", "member_id", "loan_date", "due_date", "return_date", "status")
+    db.bulk_load("loans", columns, [
+        (1, book_id, member_id, day, day + datetime.timedelta(14), day + datetime.timedelta(7), "returned"),
+        (2, book_id, member_id, day, day + datetime.timedelta(14), day + datetime.timedelta(30), "returned"),
+        (3, book_id, member_id, day, day + datetime.timedelta(14), None, "overdue"),
+        (4, book_id, member_id, day + datetime.timedelta(60), None, day + datetime.timedelta(61), "returned"),
+    ])
+    # a fine still growing keeps its loan in place
+    db.bulk_load("fines", ("loan_id", "member_id", "days_late", "amount", "final", "assessed_on"),
+                 [(2, member_id, 16, 8.0, 0, day + datetime.timedelta(30))])
+    before = day + datetime.timedelta(45)
+    assert db.archive_loans(before, 10) == 1
+    assert db.archive_loans(before, 10) == 0
+    assert [row[0] for row in db.archived_loans(member_id)] == [1]
+    assert sorted(row[0] for row in db.member_loan_history(member_id)) == [2, 3, 4]
+
+
+def test_archive_loans_works_in_batches(db, add_member, add_book):
+    member_id, book_id = add_member(), add_book()
+    day = datetime.date(2020, 1, 1)
+    db.bulk_load("loans", ("book_id", "member_id", "loan_date", "return_date", "status"),
+                 [(book_id, member_id, day, day, "returned")] * 5)
+    before = day + datetime.timedelta(1)
+    assert [db.archive_loans(before, 2) for _ in range(4)] == [2, 2, 1, 0]
+    assert len(db.archived_loans(member_id)) == 5
@@ -1,19 +1,21 @@
-from database.database import get_connection
+from database.backend import get_backend
 
 class User:
+    __slots__ = ("user_id", "username", "role")
+
     def __init__(self, user_id, username, role):
         self.user_id = user_id
         self.username = username
         self.role = role
 
     @classmethod
-    def authenticate(cls, username, password):
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT user_id, role FROM users WHERE username=%s AND password=%s",
-                    (username, password))
-        row = cur.fetchone()
-        cur.close(); conn.close()
+    def authenticate(cls, username, password, role=None):
+        row = get_backend().authenticate(username, password, role)
         if row:
-            return cls(row[0], username, row[1])
+            return cls(*row)
         return None
+
+    @staticmethod
+    def create_account(username, password, role, full_name=None):
+        # Returns the new user_id, or None if the username is taken.
+        return get_backend().create_account(username, password, role, full_name)
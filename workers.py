@@ -0,0 +1,130 @@
+# gui/workers.py
+import traceback
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+from database import instrument
+
+
+class _JobSignals(QObject):
+    finished = pyqtSignal(object, int, object)  # key, generation, result
+    failed = pyqtSignal(object, int, object)    # key, generation, exception
+
+
+class _Job(QRunnable):
+    def __init__(self, key, generation, fn, args, signals, site=None):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.site = site  # where the job was submitted from, for query timing
+        self.key = key
+        self.generation = generation
+        self.fn = fn
+        self.args = args
+        self.signals = signals
+
+    def run(self):
+        try:
+            if self.site is None:
+                result = self.fn(*self.args)
+            else:
+                with instrument.site(self.site):
+                    result = self.fn(*self.args)
+        except Exception as e:
+            self._emit(self.signals.failed, e)
+            return
+        self._emit(self.signals.finished, result)
+
+    def _emit(self, signal, value):
+        try:
+            signal.emit(self.key, self.generation, value)
+        except RuntimeError:
+            pass  # the owning window was closed while the query ran
+
+
+class QueryExecutor(QObject):
+    """Runs blocking DB calls on a worker pool and hands results back on the GUI thread.
+
+    Every job has a key. Submitting a key again supersedes the earlier job, and
+    cancelled or superseded jobs never reach their callbacks. Keys may be
+    (group, name) tuples so a whole tab's requests can be dropped at once.
+    """
+    busy_changed = pyqtSignal(bool)
+
+    def __init__(self, parent=None, max_threads=4):
+        super().__init__(parent)
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(max_threads)
+        self._signals = _JobSignals(self)
+        self._signals.finished.connect(self._on_finished)
+        self._signals.failed.connect(self._on_failed)
+        self._generations = {}
+        self._jobs = {}  # key -> (job, on_result, on_error)
+
+    def submit(self, key, fn, *args, on_result=None, on_error=None):
+        self.cancel(key)
+        was_busy = bool(self._jobs)
+        generation = self._generations.get(key, 0) + 1
+        self._generations[key] = generation
+        site = instrument.call_site() if instrument.enabled() else None
+        job = _Job(key, generation, fn, args, self._signals, site)
+        self._jobs[key] = (job, on_result, on_error)
+        self._pool.start(job)
+        if not was_busy:
+            self.busy_changed.emit(True)
+
+    def cancel(self, key):
+        entry = self._jobs.pop(key, None)
+        if entry is None:
+            return False
+        # drop it from the queue if no worker picked it up yet; a running
+        # query is left to finish and its result is discarded
+        self._pool.tryTake(entry[0])
+        self._generations[key] = self._generations.get(key, 0) + 1
+        if not self._jobs:
+            self.busy_changed.emit(False)
+        return True
+
+    def cancel_group(self, group):
+        keys = [k for k in self._jobs if isinstance(k, tuple) and k[0] == group]
+        for key in keys:
+            self.cancel(key)
+        return bool(keys)
+
+    def is_busy(self):
+        return bool(self._jobs)
+
+    def shutdown(self, wait=True):
+        for key in list(self._jobs):
+            self.cancel(key)
+        if wait:
+            self._pool.waitForDone()
+
+    def _take(self, key, generation):
+        if self._generations.get(key) != generation or key not in self._jobs:
+            return None
+        entry = self._jobs.pop(key)
+        if not self._jobs:
+            self.busy_changed.emit(False)
+        return entry
+
+    @pyqtSlot(object, int, object)
+    def _on_finished(self, key, generation, result):
+        entry = self._take(key, generation)
+        if entry is not None and entry[1] is not None:
+            self._dispatch(entry[1], result)
+
+    @pyqtSlot(object, int, object)
+    def _on_failed(self, key, generation, error):
+        entry = self._take(key, generation)
+        if entry is None:
+            return
+        if entry[2] is not None:
+            self._dispatch(entry[2], error)
+        else:
+            traceback.print_exception(type(error), error, error.__traceback__)
+
+    @staticmethod
+    def _dispatch(callback, value):
+        # exceptions escaping a slot abort PyQt5 applications
+        try:
+            callback(value)
+        except Exception:
+            traceback.print_exc()